@@ -0,0 +1,13 @@
+"""
+Микробенчмарки горячих путей бота
+
+Каждый модуль запускается отдельно из корня репозитория, например:
+python -m bench.callback_routing
+"""
+import os
+import tempfile
+
+# Бенчмарки не должны трогать рабочую БД и требовать настоящий токен
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db"))
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+os.environ.setdefault("REFERRAL_CODE_KEY", "bench-referral-key")
@@ -0,0 +1,115 @@
+"""
+Стоимость маршрутизации callback-запроса
+
+Сравнивает прежнюю схему - обход роутеров с фильтрами F.data == ... и
+F.data.startswith(...) - с индексом CallbackIndex на тех же callback_data,
+что регистрируют обработчики бота. Обработчики пустые, поэтому время -
+это чистая стоимость диспетчеризации одного обновления в aiogram.
+
+Запуск: python -m bench.callback_routing [--updates 10000] [--routers 25]
+"""
+import argparse
+import asyncio
+import importlib
+import random
+import time
+import bench  # noqa: F401  (окружение бенчмарка)
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.types import CallbackQuery, Update, User
+from handlers.loader import HANDLER_MODULES
+from utils.callback_index import CallbackIndex, callback_index
+
+
+async def _noop(callback: CallbackQuery):
+    return None
+
+
+def registered_callbacks():
+    """Точные значения и префиксы, которые регистрируют обработчики бота"""
+    for name in HANDLER_MODULES:
+        importlib.import_module(name)
+    return sorted(callback_index._exact), sorted(callback_index._prefixes)
+
+
+def linear_dispatcher(exact, prefixes, routers: int) -> Dispatcher:
+    """Диспетчер со схемой до индекса: обработчики с фильтрами, разложенные по роутерам"""
+    dp = Dispatcher()
+    chunks = [Router(name=f"linear_{index}") for index in range(routers)]
+    filters = [F.data == value for value in exact] + [F.data.startswith(prefix) for prefix in prefixes]
+    for index, callback_filter in enumerate(filters):
+        chunks[index % routers].callback_query.register(_noop, callback_filter)
+    for router in chunks:
+        dp.include_router(router)
+    return dp
+
+
+def indexed_dispatcher(exact, prefixes) -> Dispatcher:
+    """Диспетчер с CallbackIndex на те же callback_data"""
+    index = CallbackIndex(name="bench_index")
+    for value in exact:
+        index.exact(value)(_noop)
+    for prefix in prefixes:
+        index.prefix(prefix)(_noop)
+    dp = Dispatcher()
+    dp.include_router(index)
+    return dp
+
+
+def make_updates(exact, prefixes, count: int):
+    """Обновления со случайными callback_data из зарегистрированных"""
+    rng = random.Random(42)
+    values = list(exact) + [prefix + "1" for prefix in prefixes]
+    user = User(id=1, is_bot=False, first_name="bench")
+    return [
+        Update(update_id=index, callback_query=CallbackQuery(
+            id=str(index), from_user=user, chat_instance="bench", data=rng.choice(values)
+        ))
+        for index in range(count)
+    ]
+
+
+async def measure(dp: Dispatcher, bot: Bot, updates) -> float:
+    """Среднее время обработки одного обновления в мкс"""
+    for update in updates[:500]:
+        await dp.feed_update(bot, update)
+    started = time.perf_counter()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    return (time.perf_counter() - started) / len(updates) * 1e6
+
+
+async def run(updates_count: int, routers: int):
+    exact, prefixes = registered_callbacks()
+    updates = make_updates(exact, prefixes, updates_count)
+    bot = Bot(token="123456:bench")
+    try:
+        linear = await measure(linear_dispatcher(exact, prefixes, routers), bot, updates)
+        indexed = await measure(indexed_dispatcher(exact, prefixes), bot, updates)
+    finally:
+        await bot.session.close()
+
+    values = [update.callback_query.data for update in updates]
+    started = time.perf_counter()
+    for value in values:
+        callback_index.resolve(value)
+    resolve = (time.perf_counter() - started) / len(values) * 1e6
+
+    print(f"callback_data: {len(exact)} точных, {len(prefixes)} префиксов; обновлений: {updates_count}")
+    print(f"{'схема':<28}{'мкс/обновление':>16}{'обновлений/с':>14}")
+    for name, cost in ((f"фильтры, {routers} роутеров", linear), ("CallbackIndex", indexed)):
+        print(f"{name:<28}{cost:>16.1f}{1e6 / cost:>14.0f}")
+    print(f"{'resolve() без aiogram':<28}{resolve:>16.2f}")
+    # Сколько ядер съедает одна маршрутизация при 10k обновлений/с
+    print(f"Ядер на маршрутизацию при 10k/с: фильтры {linear / 100:.2f}, индекс {indexed / 100:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стоимость маршрутизации callback-запроса")
+    parser.add_argument("--updates", type=int, default=10000)
+    parser.add_argument("--routers", type=int, default=25)
+    args = parser.parse_args()
+    asyncio.run(run(args.updates, args.routers))
+
+
+if __name__ == "__main__":
+    main()
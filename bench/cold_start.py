@@ -0,0 +1,94 @@
+"""
+Холодный старт до первого обновления
+
+Каждый замер - отдельный процесс python: импорт main, импорт обработчиков,
+подключение роутеров и обработка первого обновления диспетчером. Время
+считается от запуска процесса, так что в него входит и старт интерпретатора.
+
+Сравниваются два порядка старта:
+- eager: обработчики импортируются в event loop, затем запрос set_my_commands;
+- concurrent: как в main.py - импорт (и PIL/aiohttp) в потоке параллельно
+  с запросом к Telegram.
+Запрос к Telegram заменён паузой --rtt, первое обновление - callback, который
+проходит все роутеры и не вызывает API.
+
+Запуск: python -m bench.cold_start [--runs 5] [--rtt 0.3]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+
+async def _start(mode: str, rtt: float):
+    started = time.perf_counter()
+    import bench  # noqa: F401  (окружение бенчмарка)
+    import main  # noqa: F401  (всё, что бот импортирует до старта)
+    from aiogram import Bot, Dispatcher
+    from aiogram.types import CallbackQuery, Update, User
+    from handlers.loader import import_handler_modules, include_routers
+    phases = {'import main': time.perf_counter() - started}
+
+    bot = Bot(token="123456:bench")
+    started = time.perf_counter()
+    if mode == "eager":
+        routers = import_handler_modules()
+        await asyncio.sleep(rtt)
+    else:
+        _, routers = await asyncio.gather(asyncio.sleep(rtt), asyncio.to_thread(import_handler_modules))
+    dp = Dispatcher()
+    include_routers(dp, routers)
+    phases['обработчики + set_my_commands'] = time.perf_counter() - started
+
+    update = Update(update_id=1, callback_query=CallbackQuery(
+        id="1", from_user=User(id=1, is_bot=False, first_name="bench"), chat_instance="bench", data="bench_cold"
+    ))
+    started = time.perf_counter()
+    await dp.feed_update(bot, update)
+    phases['первое обновление'] = time.perf_counter() - started
+    # Момент готовности отдаём родителю: часы time.time() общие для процессов
+    phases['ready_at'] = time.time()
+    print(json.dumps(phases))
+    await bot.session.close()
+
+
+def measure(mode: str, rtt: float) -> dict:
+    """Длительности фаз старта и 'всего' - секунды от запуска процесса до обработки первого обновления"""
+    started = time.time()
+    result = subprocess.run(
+        [sys.executable, "-m", "bench.cold_start", "--child", mode, "--rtt", str(rtt)],
+        capture_output=True, text=True, check=True
+    )
+    phases = json.loads(result.stdout.strip().splitlines()[-1])
+    phases['всего'] = phases.pop('ready_at') - started
+    return phases
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Холодный старт до первого обновления")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--rtt", type=float, default=0.3, help="время ответа Telegram на set_my_commands, с")
+    parser.add_argument("--child", choices=("eager", "concurrent"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(_start(args.child, args.rtt))
+        return
+
+    # Первый запуск прогревает .pyc и кэш файловой системы
+    measure("concurrent", args.rtt)
+    print(f"Запросов к Telegram при старте: 1 по {args.rtt * 1000:.0f} мс; замеров: {args.runs}; медианы, мс")
+    results = {mode: [measure(mode, args.rtt) for _ in range(args.runs)] for mode in ("eager", "concurrent")}
+    names = list(results["eager"][0])
+    print(f"{'фаза':<32}" + "".join(f"{mode:>12}" for mode in results))
+    for name in names:
+        print(f"{name:<32}" + "".join(
+            f"{statistics.median(sample[name] for sample in samples) * 1000:>12.0f}" for samples in results.values()
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Стоимость построения inline-клавиатур
+
+Для часто открываемых меню сравнивает сборку новой InlineKeyboardMarkup
+(исходная функция без lru_cache, как было до кэширования) с вызовом
+закэшированной фабрики из keyboards/inline.py.
+
+Запуск: python -m bench.keyboards [--calls 20000]
+"""
+import argparse
+import time
+import bench  # noqa: F401  (окружение бенчмарка)
+from keyboards import inline
+
+# Клавиатуры, которые строятся на каждое нажатие в меню, с типичными параметрами
+HOT_KEYBOARDS = (
+    (inline.get_main_menu_keyboard, ()),
+    (inline.get_images_menu_keyboard, ()),
+    (inline.get_cabinet_keyboard, ()),
+    (inline.get_trends_keyboard, (1,)),
+    (inline.get_trends_keyboard, (2,)),
+    (inline.get_balance_amounts_keyboard, ("photo_animation",)),
+    (inline.get_payment_methods_keyboard, ("main_menu",)),
+    (inline.get_to_main_menu_keyboard, ()),
+)
+
+
+def per_call(func, args, calls: int) -> float:
+    """Среднее время вызова в мкс"""
+    func(*args)
+    started = time.perf_counter()
+    for _ in range(calls):
+        func(*args)
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стоимость построения inline-клавиатур")
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'клавиатура':<48}{'сборка, мкс':>12}{'кэш, мкс':>10}{'кнопок':>8}")
+    total_built = total_cached = 0.0
+    for func, func_args in HOT_KEYBOARDS:
+        # Сборка считается на меньшем числе вызовов: она на порядки дороже
+        built = per_call(func.__wrapped__, func_args, max(args.calls // 20, 100))
+        cached = per_call(func, func_args, args.calls)
+        total_built += built
+        total_cached += cached
+        buttons = sum(len(row) for row in func(*func_args).inline_keyboard)
+        name = f"{func.__name__}({', '.join(map(repr, func_args))})"
+        print(f"{name:<48}{built:>12.1f}{cached:>10.2f}{buttons:>8}")
+    print(f"{'в среднем':<48}{total_built / len(HOT_KEYBOARDS):>12.1f}{total_cached / len(HOT_KEYBOARDS):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
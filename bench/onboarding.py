@@ -0,0 +1,91 @@
+"""
+Пропускная способность регистрации из /start
+
+Сравнивает прежний путь нового пользователя - get_user, add_user,
+generate_referral_code, get_user_by_referral_code и set_referrer отдельными
+запросами с фиксацией каждого - с onboard_user одной транзакцией. Все
+регистрации идут по реферальным кодам, как во время вирусной волны;
+потоки имитируют параллельные обработчики.
+
+Запуск: python -m bench.onboarding [--signups 3000] [--threads 1 4]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+import bench  # noqa: F401  (окружение бенчмарка)
+from database.database import Database
+
+# Пригласившие, по чьим ссылкам приходят новые пользователи
+REFERRERS = 20
+
+
+def legacy_signup(db: Database, user_id: int, referral_code: str):
+    """Путь /start до onboard_user"""
+    if db.get_user(user_id):
+        return
+    db.add_user(user_id, f"user{user_id}", "Имя", None)
+    db.generate_referral_code(user_id)
+    referrer_id = db.get_user_by_referral_code(referral_code)
+    if referrer_id and referrer_id != user_id:
+        db.set_referrer(user_id, referrer_id)
+
+
+def onboard_signup(db: Database, user_id: int, referral_code: str):
+    """Текущий путь /start"""
+    if db.get_user(user_id):
+        return
+    db.onboard_user(user_id, f"user{user_id}", "Имя", None, referral_code)
+
+
+def run(signup, signups: int, threads: int) -> float:
+    """Регистраций в секунду на свежей БД"""
+    db_path = os.path.join(tempfile.mkdtemp(prefix="bench-onboarding-"), "onboarding.db")
+    codes = []
+    setup = Database(db_path)
+    for referrer_id in range(1, REFERRERS + 1):
+        setup.add_user(referrer_id)
+        codes.append(setup.generate_referral_code(referrer_id))
+
+    per_thread = signups // threads
+
+    def worker(index: int):
+        db = Database(db_path)
+        first_id = 1000000 + index * per_thread
+        for offset in range(per_thread):
+            signup(db, first_id + offset, codes[offset % len(codes)])
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    # Обе схемы должны привести к одному и тому же результату
+    counted = setup.cursor.execute("SELECT COUNT(*) FROM users WHERE referrer_id IS NOT NULL").fetchone()[0]
+    assert counted == per_thread * threads, counted
+    return per_thread * threads / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пропускная способность регистрации из /start")
+    parser.add_argument("--signups", type=int, default=3000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+
+    # Сначала все замеры: при создании БД Database печатает свои сообщения
+    results = {
+        name: [run(signup, args.signups, threads) for threads in args.threads]
+        for name, signup in (("отдельные запросы (до)", legacy_signup), ("onboard_user", onboard_signup))
+    }
+    print(f"Регистраций по реферальной ссылке: {args.signups}")
+    print(f"{'путь':<28}" + "".join(f"{f'{threads} пот., рег/с':>18}" for threads in args.threads))
+    for name, rates in results.items():
+        print(f"{name:<28}" + "".join(f"{rate:>18.0f}" for rate in rates))
+
+
+if __name__ == "__main__":
+    main()
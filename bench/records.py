@@ -0,0 +1,94 @@
+"""
+Стоимость превращения строк БД в записи
+
+Сравнивает прежний способ - dict(zip(колонки, строка)) и копию словаря при
+каждом попадании в кэш профилей - с неизменяемыми записями из
+database/records.py: время на строку, память на объект и чтение профиля
+из SQLite целиком (запрос + запись).
+
+Запуск: python -m bench.records [--rows 200000]
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+import bench  # noqa: F401  (окружение бенчмарка)
+from database.database import Database, USER_COLUMNS_SQL, PAYMENT_COLUMNS_SQL
+from database.records import UserRecord, PaymentRecord
+
+
+def per_call(func, items) -> float:
+    """Среднее время func(item) в мкс"""
+    started = time.perf_counter()
+    for item in items:
+        func(item)
+    return (time.perf_counter() - started) / len(items) * 1e6
+
+
+def bytes_per_object(func, items) -> float:
+    """Память на один созданный объект"""
+    tracemalloc.start()
+    kept = [func(item) for item in items]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return size / len(items)
+
+
+def sample_rows(count: int):
+    db = Database(os.path.join(tempfile.mkdtemp(prefix="bench-records-"), "records.db"))
+    db.cursor.executemany(
+        "INSERT INTO users (user_id, username, first_name, balance, referral_code) VALUES (?, ?, ?, ?, ?)",
+        ((user_id, f"user{user_id}", "Имя", 150.0, f"code{user_id}") for user_id in range(1, count + 1))
+    )
+    db.cursor.executemany(
+        "INSERT INTO payments (payment_id, user_id, amount, status) VALUES (?, ?, ?, 'succeeded')",
+        ((f"bench-{user_id}", user_id, 100.0) for user_id in range(1, count + 1))
+    )
+    db.conn.commit()
+    users = db.cursor.execute(f"SELECT {USER_COLUMNS_SQL} FROM users").fetchall()
+    payments = db.cursor.execute(f"SELECT {PAYMENT_COLUMNS_SQL} FROM payments").fetchall()
+    return db, users, payments
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стоимость превращения строк БД в записи")
+    parser.add_argument("--rows", type=int, default=200000)
+    args = parser.parse_args()
+    db, users, payments = sample_rows(args.rows)
+
+    def user_dict(row):
+        return dict(zip(UserRecord._fields, row))
+
+    def payment_dict(row):
+        return dict(zip(PaymentRecord._fields, row))
+
+    cached_dict = user_dict(users[0])
+    cached_record = UserRecord.from_row(users[0])
+    lookups = range(args.rows)
+
+    cases = (
+        ("users: строка -> объект", user_dict, UserRecord.from_row, users),
+        ("payments: строка -> объект", payment_dict, PaymentRecord.from_row, payments),
+    )
+    print(f"Строк: {args.rows}")
+    print(f"{'операция':<36}{'dict, мкс':>11}{'запись, мкс':>13}{'dict, байт':>12}{'запись, байт':>14}")
+    for name, old, new, rows in cases:
+        print(f"{name:<36}{per_call(old, rows):>11.3f}{per_call(new, rows):>13.3f}"
+              f"{bytes_per_object(old, rows):>12.0f}{bytes_per_object(new, rows):>14.0f}")
+
+    # Попадание в кэш: раньше отдавалась копия словаря, теперь сама запись
+    print(f"{'get_user из кэша':<36}{per_call(lambda _: dict(cached_dict), lookups):>11.3f}"
+          f"{per_call(lambda _: cached_record, lookups):>13.3f}")
+
+    # Чтение профиля из SQLite целиком, без кэша
+    query = f"SELECT {USER_COLUMNS_SQL} FROM users WHERE user_id = ?"
+    ids = range(1, min(args.rows, 50000) + 1)
+    old = per_call(lambda user_id: user_dict(db.cursor.execute(query, (user_id,)).fetchone()), ids)
+    new = per_call(lambda user_id: UserRecord.from_row(db.cursor.execute(query, (user_id,)).fetchone()), ids)
+    print(f"{'SELECT профиля + объект':<36}{old:>11.3f}{new:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
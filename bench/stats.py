@@ -0,0 +1,118 @@
+"""
+Задержка /stats на большой БД
+
+Заполняет временную БД (по умолчанию 1M генераций) через обычные INSERT,
+чтобы сработали триггеры сводок, и сравнивает сбор данных для /stats -
+get_stats_totals() и get_range_stats() за 7 дней - с прежними агрегатами
+по исходным таблицам (COUNT, SUM и COUNT(DISTINCT) на каждый вызов).
+
+Запуск: python -m bench.stats [--generations 1000000] [--users 50000] [--runs 20]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+import bench  # noqa: F401  (окружение бенчмарка)
+from database.database import Database
+
+GENERATION_TYPES = ('image_generation', 'image_editing', 'photo_animation', 'video_generation', 'motion_control')
+MODELS = (None, 'nano_banana', 'seedream', 'veo3_fast')
+
+# Запросы /stats до появления счётчиков и сводок
+LEGACY_QUERIES = (
+    ("SELECT COUNT(*) FROM users", ()),
+    ("SELECT COUNT(*) FROM users WHERE created_at >= datetime('now', '-' || ? || ' days')", (7,)),
+    ("SELECT COUNT(DISTINCT user_id) FROM generations WHERE created_at >= datetime('now', '-' || ? || ' days')", (7,)),
+    ("SELECT COUNT(*) FROM generations", ()),
+    ("SELECT type, COUNT(*) FROM generations GROUP BY type", ()),
+    ("SELECT COUNT(*) FROM payments WHERE status = 'succeeded'", ()),
+    ("SELECT COALESCE(SUM(amount), 0.0) FROM payments WHERE status = 'succeeded'", ()),
+    ("SELECT COALESCE(SUM(amount), 0.0) FROM payments WHERE status = 'succeeded' "
+     "AND paid_at >= datetime('now', '-' || ? || ' days')", (7,)),
+    ("SELECT COUNT(*) FROM users WHERE referrer_id IS NOT NULL", ()),
+    ("SELECT COALESCE(SUM(amount), 0.0) FROM referral_earnings", ()),
+)
+
+
+def _timestamps(rng: random.Random, count: int, days: int):
+    now = datetime.utcnow()
+    return sorted(
+        (now - timedelta(seconds=rng.randrange(days * 86400))).strftime('%Y-%m-%d %H:%M:%S') for _ in range(count)
+    )
+
+
+def populate(db: Database, users: int, generations: int, payments: int, days: int = 365):
+    """Заполняет БД за days дней; данные идут через триггеры, как в работе бота"""
+    rng = random.Random(42)
+    cursor = db.cursor
+    cursor.executemany(
+        "INSERT INTO users (user_id, username, created_at, referrer_id) VALUES (?, ?, ?, ?)",
+        ((user_id, f"user{user_id}", created_at, rng.randrange(1, user_id) if user_id > 1 and rng.random() < 0.3 else None)
+         for user_id, created_at in enumerate(_timestamps(rng, users, days), start=1))
+    )
+    batch = 100000
+    for offset in range(0, generations, batch):
+        size = min(batch, generations - offset)
+        cursor.executemany(
+            "INSERT INTO generations (user_id, type, file_url, prompt, model, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            ((rng.randrange(1, users + 1), rng.choice(GENERATION_TYPES), "https://example.com/file", "prompt",
+              rng.choice(MODELS), created_at)
+             for created_at in _timestamps(rng, size, days))
+        )
+        db.conn.commit()
+    cursor.executemany(
+        "INSERT INTO payments (payment_id, user_id, amount, status, created_at, paid_at) VALUES (?, ?, ?, ?, ?, ?)",
+        ((f"bench-{index}", rng.randrange(1, users + 1), rng.choice((100.0, 300.0, 500.0)),
+          'succeeded' if rng.random() < 0.8 else 'canceled', created_at, created_at)
+         for index, created_at in enumerate(_timestamps(rng, payments, days)))
+    )
+    db.conn.commit()
+
+
+def timed(func, runs: int):
+    """Медиана и максимум времени вызова в мс"""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Задержка /stats на большой БД")
+    parser.add_argument("--generations", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--payments", type=int, default=100000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    db = Database(os.path.join(tempfile.mkdtemp(prefix="bench-stats-"), "stats.db"))
+    started = time.perf_counter()
+    populate(db, args.users, args.generations, args.payments)
+    print(f"БД: {args.users} пользователей, {args.generations} генераций, {args.payments} платежей "
+          f"(заполнение {time.perf_counter() - started:.0f} с)")
+
+    def current():
+        end = datetime.utcnow()
+        db.get_stats_totals()
+        db.get_range_stats(end - timedelta(days=7), end)
+
+    def legacy():
+        for query, params in LEGACY_QUERIES:
+            db.cursor.execute(query, params).fetchall()
+
+    print(f"{'/stats':<36}{'медиана, мс':>12}{'макс, мс':>10}")
+    for name, func, runs in (
+        ("агрегаты по таблицам (до)", legacy, max(args.runs // 4, 3)),
+        ("счётчики и сводки", current, args.runs),
+    ):
+        median, worst = timed(func, runs)
+        print(f"{name:<36}{median:>12.2f}{worst:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -21,4 +21,44 @@ YOOKASSA_SHOP_ID = os.getenv("YOOKASSA_SHOP_ID")
 YOOKASSA_SECRET_KEY = os.getenv("YOOKASSA_SECRET_KEY")
 
 # Путь к базе данных
-DATABASE_PATH = os.getenv("DATABASE_PATH", "bot_database.db")
\ No newline at end of file
+DATABASE_PATH = os.getenv("DATABASE_PATH", "bot_database.db")
+# Хранилище: sqlite (по умолчанию), sharded (несколько файлов SQLite по user_id)
+# или postgres (нужны пакет psycopg[pool] и DATABASE_URL)
+DATABASE_BACKEND = os.getenv("DATABASE_BACKEND", "sqlite").lower()
+# Число шардов для sharded; после появления данных менять нельзя
+DATABASE_SHARDS = int(os.getenv("DATABASE_SHARDS", "4"))
+DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://localhost/bot")
+POSTGRES_POOL_SIZE = int(os.getenv("POSTGRES_POOL_SIZE", "10"))
+# Соединения SQLite только для чтения (галерея, /stats) и потоки для них
+READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", "4"))
+# Интервал свёртки журнала операций в снимки остатков (секунды)
+LEDGER_SNAPSHOT_INTERVAL = int(os.getenv("LEDGER_SNAPSHOT_INTERVAL", "3600"))
+# Интервал сверки счётчиков рефералов с исходными таблицами (секунды)
+REFERRAL_CHECK_INTERVAL = int(os.getenv("REFERRAL_CHECK_INTERVAL", "86400"))
+# Срок жизни незавершённого действия, ожидающего оплаты, и интервал очистки просроченных (секунды)
+PENDING_ACTION_TTL = int(os.getenv("PENDING_ACTION_TTL", "86400"))
+PENDING_ACTION_SWEEP_INTERVAL = int(os.getenv("PENDING_ACTION_SWEEP_INTERVAL", "900"))
+# Резервные копии SQLite: каталог, интервал (секунды), сколько копий хранить
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_INTERVAL = int(os.getenv("BACKUP_INTERVAL", str(6 * 3600)))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "14"))
+# Копирование шагами: страниц за шаг, пауза между шагами (секунды), допустимое число перезапусков
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "256"))
+BACKUP_STEP_SLEEP = float(os.getenv("BACKUP_STEP_SLEEP", "0.01"))
+BACKUP_MAX_RESTARTS = int(os.getenv("BACKUP_MAX_RESTARTS", "3"))
+
+# Адрес API YooKassa (можно подменить на локальный стенд)
+YOOKASSA_API_URL = os.getenv("YOOKASSA_API_URL", "https://api.yookassa.ru/v3")
+
+# Сверка зависших платежей с YooKassa
+RECONCILE_INTERVAL = int(os.getenv("RECONCILE_INTERVAL", "300"))          # как часто запускать, секунды
+RECONCILE_MIN_AGE = int(os.getenv("RECONCILE_MIN_AGE", "600"))            # не трогать платежи моложе, секунды
+RECONCILE_MAX_AGE = int(os.getenv("RECONCILE_MAX_AGE", str(48 * 3600)))   # не проверять платежи старше, секунды
+RECONCILE_CONCURRENCY = int(os.getenv("RECONCILE_CONCURRENCY", "5"))      # одновременных запросов к YooKassa
+
+# Секретный ключ перестановки для реферальных кодов: без него коды можно
+# перебрать по id. Обязателен. Менять нельзя: уже выданные коды хранятся в
+# БД, но новые коды перестанут быть гарантированно уникальными. Установкам,
+# запущенным без ключа, нужно задать прежнее значение по умолчанию
+# REFERRAL_CODE_KEY=referral-codes-v1.
+REFERRAL_CODE_KEY = os.getenv("REFERRAL_CODE_KEY")
@@ -0,0 +1,126 @@
+import gzip
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+from config import (
+    DATABASE_PATH, DATABASE_BACKEND, DATABASE_SHARDS, BACKUP_DIR, BACKUP_KEEP,
+    BACKUP_PAGES_PER_STEP, BACKUP_STEP_SLEEP, BACKUP_MAX_RESTARTS
+)
+
+
+class _TooManyRestarts(Exception):
+    """Источник меняется быстрее, чем идёт пошаговое копирование"""
+
+
+def database_files():
+    """Файлы SQLite текущего хранилища (для postgres - пусто, там свои средства резервного копирования)"""
+    if DATABASE_BACKEND == "postgres":
+        return []
+    if DATABASE_BACKEND == "sharded":
+        from database.sharded import shard_paths
+        return shard_paths(DATABASE_PATH, DATABASE_SHARDS)
+    return [DATABASE_PATH]
+
+
+def _copy_online(db_path: str, target_path: str, pages: int, sleep: float, max_restarts: int):
+    """
+    Копирует БД через backup API, не останавливая запись
+
+    Копирование идёт шагами по pages страниц с паузой sleep. В режиме WAL
+    на время копии открыта транзакция чтения: все шаги читают один снимок,
+    копия не перезапускается от новых записей, а писатели её не ждут. Без
+    WAL блокировка чтения отпускается между шагами, и при изменениях
+    SQLite начинает копию заново; после max_restarts перезапусков копируем
+    одним шагом.
+    """
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > max_restarts:
+                raise _TooManyRestarts()
+        last_remaining = remaining
+
+    source = sqlite3.connect(
+        Path(db_path).resolve().as_uri() + "?mode=ro", uri=True, timeout=10.0, isolation_level=None
+    )
+    target = sqlite3.connect(target_path)
+    try:
+        wal = source.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        if wal:
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        try:
+            source.backup(target, pages=pages, progress=progress, sleep=sleep)
+        except _TooManyRestarts:
+            print(f"⚠️ {db_path} меняется во время копирования, копируем одним шагом")
+            source.backup(target)
+        finally:
+            if wal:
+                source.execute("COMMIT")
+        result = target.execute("PRAGMA integrity_check").fetchone()[0]
+        if result != "ok":
+            raise RuntimeError(f"Копия {db_path} не прошла integrity_check: {result}")
+    finally:
+        target.close()
+        source.close()
+    return restarts
+
+
+def _rotate(backup_dir: Path, name: str, keep: int):
+    """Оставляет keep последних копий файла name"""
+    backups = sorted(backup_dir.glob(f"{name}-*.gz"))
+    for old in backups[:-keep] if keep > 0 else []:
+        old.unlink()
+
+
+def backup_database(db_path: str, backup_dir: str = BACKUP_DIR, keep: int = BACKUP_KEEP,
+                    pages: int = BACKUP_PAGES_PER_STEP, sleep: float = BACKUP_STEP_SLEEP,
+                    max_restarts: int = BACKUP_MAX_RESTARTS):
+    """
+    Делает сжатую проверенную копию БД и удаляет старые
+
+    Копия пишется во временный файл, проверяется integrity_check, сжимается
+    gzip и только потом появляется под итоговым именем - незаконченных или
+    битых копий в каталоге не бывает. Функция блокирующая: запускать в потоке.
+    """
+    backup_dir = Path(backup_dir)
+    backup_dir.mkdir(parents=True, exist_ok=True)
+    name = Path(db_path).name
+    stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    final_path = backup_dir / f"{name}-{stamp}.gz"
+    raw_path = backup_dir / f".{name}-{stamp}.tmp"
+    gz_path = backup_dir / f".{name}-{stamp}.gz.tmp"
+
+    started = time.monotonic()
+    try:
+        restarts = _copy_online(db_path, str(raw_path), pages, sleep, max_restarts)
+        with open(raw_path, "rb") as raw, gzip.open(gz_path, "wb", compresslevel=6) as compressed:
+            shutil.copyfileobj(raw, compressed, 1024 * 1024)
+        os.replace(gz_path, final_path)
+    finally:
+        for path in (raw_path, gz_path):
+            if path.exists():
+                path.unlink()
+
+    _rotate(backup_dir, name, keep)
+    return {
+        'path': str(final_path),
+        'size': final_path.stat().st_size,
+        'restarts': restarts,
+        'duration': round(time.monotonic() - started, 2)
+    }
+
+
+def backup_all(backup_dir: str = BACKUP_DIR):
+    """Копирует все файлы текущего хранилища; для периодической задачи"""
+    results = [backup_database(db_path, backup_dir) for db_path in database_files() if os.path.exists(db_path)]
+    for result in results:
+        print(f"💾 Резервная копия {result['path']}: {result['size']} байт за {result['duration']} с")
+    return results
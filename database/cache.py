@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Маркер промаха: None - допустимое закэшированное значение (пользователя нет)
+MISSING = object()
+
+
+class UserCache:
+    """
+    LRU-кэш профилей пользователей с TTL
+
+    Живёт в процессе и общий для всех экземпляров Database. Любая запись в
+    таблицу users должна вызывать invalidate для затронутого пользователя.
+    TTL страхует от изменений, сделанных в обход Database.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Возвращает значение по ключу или MISSING"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Сохраняет значение, вытесняя самые старые записи"""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *keys):
+        """Удаляет записи по ключам"""
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Метрики кэша для логов и /stats"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+
+user_cache = UserCache()
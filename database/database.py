@@ -1,21 +1,184 @@
+import asyncio
 import sqlite3
-from config import DATABASE_PATH
+import threading
+from datetime import datetime, timedelta
+from config import DATABASE_PATH, DATABASE_BACKEND, PENDING_ACTION_TTL
+from database.cache import user_cache, MISSING
+from database.read_pool import read_pool
+from database.referral_codes import encode_referral_code
+from database.records import UserRecord, PaymentRecord, GenerationPurchaseRecord
+from database.repository import Repository
 
+# Колонки, которые выбираются в записи
+USER_COLUMNS_SQL = UserRecord.columns_sql()
+PAYMENT_COLUMNS_SQL = PaymentRecord.columns_sql()
+GENERATION_PURCHASE_COLUMNS_SQL = GenerationPurchaseRecord.columns_sql()
 
-class Database:
+# Счета, которые ведутся через журнал операций (совпадают с колонками users)
+LEDGER_ACCOUNTS = ('balance', 'generations', 'referral_balance')
+
+# Версия схемы статистики: при увеличении таблицы пересчитываются при старте
+STATS_VERSION = 4
+
+# Ключи временных корзин: час и сутки в UTC, как CURRENT_TIMESTAMP
+HOUR_BUCKET = "strftime('%%Y-%%m-%%d %%H:00', %s)"
+DAY_BUCKET = "date(%s)"
+
+
+def _bump_rollups(metric: str, ts: str, value: str = "1", where: str = "") -> str:
+    """SQL для увеличения метрики в почасовой и суточной сводках"""
+    ts = f"COALESCE({ts}, CURRENT_TIMESTAMP)"
+    condition = f" WHERE {where}" if where else " WHERE 1"
+    return f"""
+                INSERT INTO stats_hourly (hour, metric, value)
+                    SELECT {HOUR_BUCKET % ts}, {metric}, {value}{condition}
+                    ON CONFLICT(hour, metric) DO UPDATE SET value = value + excluded.value;
+                INSERT INTO stats_daily (day, metric, value)
+                    SELECT {DAY_BUCKET % ts}, {metric}, {value}{condition}
+                    ON CONFLICT(day, metric) DO UPDATE SET value = value + excluded.value;"""
+
+
+def _bump_counter(name: str, value: str = "1", where: str = "") -> str:
+    condition = f" WHERE {where}" if where else " WHERE 1"
+    return f"""
+                INSERT INTO stats_counters (name, value) SELECT {name}, {value}{condition}
+                    ON CONFLICT(name) DO UPDATE SET value = value + excluded.value;"""
+
+
+def _stats_triggers_sql() -> str:
+    """Триггеры, поддерживающие счётчики и сводки статистики"""
+    triggers = {
+        "stats_users_insert": f"""AFTER INSERT ON users
+            BEGIN{_bump_counter("'users'")}{_bump_counter("'referrals'", where="NEW.referrer_id IS NOT NULL")}{_bump_rollups("'new_users'", "NEW.created_at")}
+            END""",
+        "stats_users_referrer": f"""AFTER UPDATE OF referrer_id ON users
+            WHEN (OLD.referrer_id IS NULL) != (NEW.referrer_id IS NULL)
+            BEGIN{_bump_counter("'referrals'", "CASE WHEN NEW.referrer_id IS NULL THEN -1 ELSE 1 END")}
+            END""",
+        "stats_users_delete": f"""AFTER DELETE ON users
+            BEGIN
+                UPDATE stats_counters SET value = value - 1 WHERE name = 'users';
+                UPDATE stats_counters SET value = value - 1 WHERE name = 'referrals' AND OLD.referrer_id IS NOT NULL;{_bump_rollups("'new_users'", "OLD.created_at", "-1")}
+            END""",
+        "stats_generations_insert": f"""AFTER INSERT ON generations
+            BEGIN{_bump_counter("'generations'")}{_bump_counter("'generations:' || NEW.type")}{_bump_rollups("'generations'", "NEW.created_at")}{_bump_rollups("'type:' || NEW.type", "NEW.created_at")}{_bump_rollups("'model:' || NEW.model", "NEW.created_at", where="NEW.model IS NOT NULL")}
+                INSERT OR IGNORE INTO stats_daily_active (day, user_id)
+                    VALUES (date(COALESCE(NEW.created_at, CURRENT_TIMESTAMP)), NEW.user_id);
+            END""",
+        # Активные за сутки: строка в stats_daily_active появляется один раз на пользователя и день
+        "stats_daily_active_insert": """AFTER INSERT ON stats_daily_active
+            BEGIN
+                INSERT INTO stats_daily (day, metric, value) VALUES (NEW.day, 'active_users', 1)
+                    ON CONFLICT(day, metric) DO UPDATE SET value = value + excluded.value;
+            END""",
+        "stats_generations_delete": f"""AFTER DELETE ON generations
+            BEGIN
+                UPDATE stats_counters SET value = value - 1 WHERE name IN ('generations', 'generations:' || OLD.type);{_bump_rollups("'generations'", "OLD.created_at", "-1")}{_bump_rollups("'type:' || OLD.type", "OLD.created_at", "-1")}{_bump_rollups("'model:' || OLD.model", "OLD.created_at", "-1", where="OLD.model IS NOT NULL")}
+            END""",
+        "stats_payments_insert": f"""AFTER INSERT ON payments
+            WHEN NEW.status = 'succeeded'
+            BEGIN{_bump_counter("'payments'")}{_bump_counter("'payments_sum'", "NEW.amount")}{_bump_rollups("'payments'", "NEW.paid_at")}{_bump_rollups("'payments_sum'", "NEW.paid_at", "NEW.amount")}
+            END""",
+        "stats_payments_succeeded": f"""AFTER UPDATE OF status ON payments
+            WHEN NEW.status = 'succeeded' AND OLD.status IS NOT 'succeeded'
+            BEGIN{_bump_counter("'payments'")}{_bump_counter("'payments_sum'", "NEW.amount")}{_bump_rollups("'payments'", "NEW.paid_at")}{_bump_rollups("'payments_sum'", "NEW.paid_at", "NEW.amount")}
+            END""",
+        "stats_payments_unsucceeded": f"""AFTER UPDATE OF status ON payments
+            WHEN OLD.status = 'succeeded' AND NEW.status IS NOT 'succeeded'
+            BEGIN{_bump_counter("'payments'", "-1")}{_bump_counter("'payments_sum'", "-OLD.amount")}{_bump_rollups("'payments'", "OLD.paid_at", "-1")}{_bump_rollups("'payments_sum'", "OLD.paid_at", "-OLD.amount")}
+            END""",
+        "stats_referral_earnings_insert": f"""AFTER INSERT ON referral_earnings
+            BEGIN{_bump_counter("'referral_earnings'", "NEW.amount")}{_bump_rollups("'referral_payouts'", "NEW.created_at", "NEW.amount")}
+            END""",
+    }
+    return "\n".join(
+        f"DROP TRIGGER IF EXISTS {name};\nCREATE TRIGGER {name} {body};"
+        for name, body in triggers.items()
+    )
+
+
+async def db_call(func, *args, **kwargs):
+    """
+    Вызывает синхронный метод хранилища из обработчика
+
+    Запрос к PostgreSQL - это сетевой round trip, и синхронный вызов
+    остановил бы event loop бота на всё это время, поэтому для postgres
+    метод выполняется в потоке. В шардированном режиме поток нужен, чтобы
+    записи в разные шарды шли параллельно, а не по очереди в event loop.
+    Один файл SQLite отвечает быстрее переключения потоков (профиль к тому
+    же обычно в кэше) - его вызываем напрямую.
+    """
+    if DATABASE_BACKEND in ("postgres", "sharded"):
+        return await asyncio.to_thread(func, *args, **kwargs)
+    return func(*args, **kwargs)
+
+
+class Database(Repository):
     """Класс для работы с базой данных SQLite"""
+
+    # Пути, для которых схема уже создана в этом процессе
+    _initialized_paths = set()
+    _init_lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        # Обработчики создают Database() напрямую, поэтому выбор хранилища из
+        # config происходит здесь. Database(path) с явным путём - всегда один
+        # файл SQLite (так шардированный режим открывает свои шарды)
+        if cls is Database and not args and not kwargs:
+            if DATABASE_BACKEND == "postgres":
+                from database.postgres import PostgresDatabase
+                return PostgresDatabase()
+            if DATABASE_BACKEND == "sharded":
+                from database.sharded import ShardedDatabase
+                return ShardedDatabase()
+        return super().__new__(cls)
     
     def __init__(self, db_path: str = DATABASE_PATH):
         """Инициализация подключения к базе данных"""
+        self.db_path = db_path
         self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10.0)
         self.cursor = self.conn.cursor()
+        # Database() создаётся в каждом обработчике, а схему достаточно проверить один раз
+        with Database._init_lock:
+            if db_path not in Database._initialized_paths:
+                self.init_schema()
+                Database._initialized_paths.add(db_path)
+
+    def init_schema(self):
+        """Создаёт таблицы и выполняет миграции старых БД"""
+        # WAL: чтения из read_pool идут параллельно с записью и не блокируют её
+        self.cursor.execute("PRAGMA journal_mode=WAL")
         self.create_tables()
+        self.update_pending_actions_for_expiry()
         self.create_generations_table()
         self.update_users_table_for_referrals()
         self.update_users_table_for_generations()
+        self.create_referral_code_index()
+        self.backfill_referral_codes()
         self.create_referral_earnings_table()
+        self.create_referral_counters()
+        self.create_referral_closure()
         self.create_payments_table()
         self.create_generation_purchases_table()
+        self.update_generations_table_for_model()
+        self.create_stats_tables()
+        self.create_ledger_tables()
+        self.create_processed_events_table()
+        self.create_fulfillment_queue_table()
+
+    def _user_key(self, user_id: int):
+        return ('user', self.db_path, user_id)
+
+    def _purchased_key(self, user_id: int):
+        return ('purchased', self.db_path, user_id)
+
+    def invalidate_user(self, user_id: int):
+        """Сбрасывает закэшированный профиль пользователя после записи"""
+        user_cache.invalidate(self._user_key(user_id))
+
+    def _reader(self):
+        """Курсор только для чтения из общего пула - для галереи и статистики"""
+        return read_pool.cursor(self.db_path)
     
     def create_tables(self):
         """Создаёт необходимые таблицы, если они не существуют"""
@@ -31,7 +194,9 @@ class Database:
                 referrer_id INTEGER,
                 referral_balance REAL DEFAULT 0.0,
                 referral_code TEXT UNIQUE,
-                generations INTEGER DEFAULT 0
+                generations INTEGER DEFAULT 0,
+                referrals_count INTEGER DEFAULT 0,
+                referral_earned REAL DEFAULT 0.0
             )
         ''')
     
@@ -40,7 +205,8 @@ class Database:
                 user_id INTEGER PRIMARY KEY,
                 action_type TEXT,
                 action_data TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                expires_at INTEGER
             )
         ''')
     
@@ -74,6 +240,9 @@ class Database:
                 FOREIGN KEY (user_id) REFERENCES users (user_id)
             )
         ''')
+        self.cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_generation_purchases_status_created ON generation_purchases (status, created_at)'
+        )
         self.conn.commit()
     
     def save_generation_purchase(self, payment_id: str, user_id: int, package_size: int, amount: float):
@@ -87,20 +256,10 @@ class Database:
     
     def get_generation_purchase(self, payment_id: str):
         """Получает покупку генераций по payment_id"""
-        self.cursor.execute('SELECT * FROM generation_purchases WHERE payment_id = ?', (payment_id,))
-        row = self.cursor.fetchone()
-        if row:
-            return {
-                'id': row[0],
-                'payment_id': row[1],
-                'user_id': row[2],
-                'package_size': row[3],
-                'amount': row[4],
-                'status': row[5],
-                'created_at': row[6],
-                'completed_at': row[7]
-            }
-        return None
+        self.cursor.execute(
+            f'SELECT {GENERATION_PURCHASE_COLUMNS_SQL} FROM generation_purchases WHERE payment_id = ?', (payment_id,)
+        )
+        return GenerationPurchaseRecord.from_row(self.cursor.fetchone())
     
     def update_generation_purchase_status(self, payment_id: str, status: str):
         """Обновляет статус покупки генераций"""
@@ -112,7 +271,7 @@ class Database:
         self.conn.commit()
         print(f"✅ Статус покупки генераций обновлён: payment_id={payment_id}, status={status}")
     
-    def add_generations(self, user_id: int, amount: int):
+    def add_generations(self, user_id: int, amount: int, reason: str = "purchase", ref_id: str = None):
         """Добавляет генерации пользователю"""
         user = self.get_user(user_id)
         if user:
@@ -120,15 +279,14 @@ class Database:
             new_generations = current_generations + amount
             print(f"⚡ Пополнение генераций: User {user_id}, Old: {current_generations}, Add: {amount}, New: {new_generations}")
             
-            self.cursor.execute('''
-                UPDATE users SET generations = ? WHERE user_id = ?
-            ''', (new_generations, user_id))
+            self.post_ledger_entry(user_id, 'generations', amount, reason, ref_id)
             self.conn.commit()
+            self.invalidate_user(user_id)
             
             updated_user = self.get_user(user_id)
             print(f"✅ Генерации после обновления: {updated_user.get('generations', 0)}")
     
-    def subtract_generations(self, user_id: int, amount: int = 1):
+    def subtract_generations(self, user_id: int, amount: int = 1, reason: str = "generation", ref_id: str = None):
         """Списывает генерации у пользователя"""
         # Для админа не списываем генерации
         if user_id == 6397535545:
@@ -141,10 +299,11 @@ class Database:
             new_generations = max(0, current_generations - amount)
             print(f"⚡ Списание генераций: User {user_id}, Old: {current_generations}, Subtract: {amount}, New: {new_generations}")
 
-            self.cursor.execute('''
-                UPDATE users SET generations = ? WHERE user_id = ?
-            ''', (new_generations, user_id))
-            self.conn.commit()
+            # Генерации не уходят в минус: списываем не больше остатка
+            if new_generations != current_generations:
+                self.post_ledger_entry(user_id, 'generations', new_generations - current_generations, reason, ref_id)
+                self.conn.commit()
+                self.invalidate_user(user_id)
 
             return True
         return False
@@ -160,13 +319,284 @@ class Database:
 
     def has_purchased_generations(self, user_id: int) -> bool:
         """Проверяет, покупал ли пользователь генерации"""
+        # Факт покупки не отменяется, поэтому кэшируем только положительный ответ
+        if user_cache.get(self._purchased_key(user_id)) is True:
+            return True
         self.cursor.execute('''
             SELECT COUNT(*) FROM generation_purchases 
             WHERE user_id = ? AND status = 'succeeded'
         ''', (user_id,))
         count = self.cursor.fetchone()[0]
+        if count > 0:
+            user_cache.set(self._purchased_key(user_id), True)
         return count > 0
 
+    def get_pending_payment_ids(self, min_age_seconds: int, max_age_seconds: int, limit: int = 100):
+        """Возвращает id платежей и покупок генераций, застрявших в статусе pending"""
+        return [payment_id for _, payment_id in self.get_pending_payments(min_age_seconds, max_age_seconds, limit)]
+
+    def get_pending_payments(self, min_age_seconds: int, max_age_seconds: int, limit: int = 100):
+        """Застрявшие pending-платежи как пары (created_at, payment_id), от старых к новым"""
+        self.cursor.execute('''
+            SELECT created_at, payment_id FROM (
+                SELECT payment_id, created_at FROM payments
+                WHERE status = 'pending'
+                  AND created_at BETWEEN datetime('now', '-' || ? || ' seconds') AND datetime('now', '-' || ? || ' seconds')
+                UNION ALL
+                SELECT payment_id, created_at FROM generation_purchases
+                WHERE status = 'pending'
+                  AND created_at BETWEEN datetime('now', '-' || ? || ' seconds') AND datetime('now', '-' || ? || ' seconds')
+            )
+            ORDER BY created_at
+            LIMIT ?
+        ''', (max_age_seconds, min_age_seconds, max_age_seconds, min_age_seconds, limit))
+        return self.cursor.fetchall()
+
+    def cancel_pending_payment(self, payment_id: str):
+        """Помечает отменённым платёж или покупку, если они всё ещё pending"""
+        self.cursor.execute(
+            "UPDATE payments SET status = 'canceled' WHERE payment_id = ? AND status = 'pending'", (payment_id,)
+        )
+        self.cursor.execute(
+            "UPDATE generation_purchases SET status = 'canceled' WHERE payment_id = ? AND status = 'pending'",
+            (payment_id,)
+        )
+        self.conn.commit()
+
+    def create_processed_events_table(self):
+        """Создаёт таблицу обработанных событий YooKassa (защита от повторной доставки)"""
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS processed_events (
+                event_key TEXT PRIMARY KEY,
+                payment_id TEXT NOT NULL,
+                event TEXT NOT NULL,
+                result TEXT,
+                processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self.conn.commit()
+
+    def create_fulfillment_queue_table(self):
+        """Создаёт очередь событий оплаты, ожидающих зачисления"""
+        self.cursor.executescript('''
+            CREATE TABLE IF NOT EXISTS fulfillment_queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_key TEXT UNIQUE NOT NULL,
+                event TEXT NOT NULL,
+                payment_id TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE INDEX IF NOT EXISTS idx_fulfillment_queue_due ON fulfillment_queue (status, next_attempt_at);
+        ''')
+        self.cursor.execute("PRAGMA table_info(fulfillment_queue)")
+        if 'result' not in [column[1] for column in self.cursor.fetchall()]:
+            # Результат зачисления, по которому ещё не отправлены уведомления
+            self.cursor.execute('ALTER TABLE fulfillment_queue ADD COLUMN result TEXT')
+        self.conn.commit()
+
+    def enqueue_payment_event(self, event: str, payment_id: str) -> bool:
+        """
+        Ставит событие оплаты в очередь; False, если такое событие уже в очереди
+
+        Задача, исчерпавшая попытки (failed), возвращается в работу с нуля -
+        так сверка с YooKassa может довести до зачисления платёж, который
+        воркер не смог обработать раньше.
+        """
+        self.cursor.execute('''
+            INSERT INTO fulfillment_queue (event_key, event, payment_id)
+            VALUES (?, ?, ?)
+            ON CONFLICT(event_key) DO UPDATE SET
+                status = 'pending',
+                attempts = 0,
+                next_attempt_at = 0,
+                last_error = NULL,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE fulfillment_queue.status = 'failed'
+        ''', (f"{event}:{payment_id}", event, payment_id))
+        self.conn.commit()
+        return self.cursor.rowcount > 0
+
+    def get_due_fulfillment_jobs(self, now: float, limit: int = 20):
+        """Возвращает задачи очереди, время которых подошло"""
+        self.cursor.execute('''
+            SELECT id, event, payment_id, attempts, status, result FROM fulfillment_queue
+            WHERE status IN ('pending', 'notify') AND next_attempt_at <= ?
+            ORDER BY next_attempt_at
+            LIMIT ?
+        ''', (now, limit))
+        columns = ('id', 'event', 'payment_id', 'attempts', 'status', 'result')
+        return [dict(zip(columns, row)) for row in self.cursor.fetchall()]
+
+    def get_next_fulfillment_time(self):
+        """Время ближайшей отложенной задачи очереди или None"""
+        self.cursor.execute("SELECT MIN(next_attempt_at) FROM fulfillment_queue WHERE status IN ('pending', 'notify')")
+        return self.cursor.fetchone()[0]
+
+    def save_fulfillment_result(self, job_id: int, result: str):
+        """
+        Запоминает результат зачисления до отправки уведомлений
+
+        Задача переходит в статус notify: если процесс упадёт до уведомления,
+        после перезапуска воркер отправит его по сохранённому результату -
+        повторное зачисление вернуло бы duplicate, и уведомление потерялось бы.
+        """
+        self.cursor.execute('''
+            UPDATE fulfillment_queue SET status = 'notify', result = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?
+        ''', (result, job_id))
+        self.conn.commit()
+
+    def complete_fulfillment_job(self, job_id: int):
+        """Помечает задачу очереди выполненной"""
+        self.cursor.execute('''
+            UPDATE fulfillment_queue SET status = 'done', updated_at = CURRENT_TIMESTAMP WHERE id = ?
+        ''', (job_id,))
+        self.conn.commit()
+
+    def retry_fulfillment_job(self, job_id: int, error: str, next_attempt_at: float = None):
+        """Откладывает задачу очереди до next_attempt_at (статус notify сохраняется) или помечает её failed, если он не задан"""
+        self.cursor.execute('''
+            UPDATE fulfillment_queue
+            SET attempts = attempts + 1,
+                last_error = ?,
+                status = CASE WHEN ? IS NULL THEN 'failed' WHEN status = 'notify' THEN 'notify' ELSE 'pending' END,
+                next_attempt_at = COALESCE(?, next_attempt_at),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (error, next_attempt_at, next_attempt_at, job_id))
+        self.conn.commit()
+
+    def fulfill_payment_event(self, event: str, payment_id: str, referral_rates=()):
+        """
+        Зачисляет успешный платёж ровно один раз
+
+        Вся работа идёт в одной транзакции: запись события в processed_events,
+        условный перевод покупки/платежа в 'succeeded' и начисления по журналу.
+        Повторная или параллельная доставка того же события упирается в
+        уникальный ключ и возвращает status='duplicate' без изменений в БД.
+
+        referral_rates - доли пополнения для рефереров по уровням: первая
+        для пригласившего, вторая для пригласившего его и т.д.
+        """
+        event_key = f"{event}:{payment_id}"
+        result = {'status': 'processed', 'payment_id': payment_id}
+        touched_users = []
+
+        self.cursor.execute("BEGIN IMMEDIATE")
+        try:
+            self.cursor.execute(
+                'INSERT OR IGNORE INTO processed_events (event_key, payment_id, event) VALUES (?, ?, ?)',
+                (event_key, payment_id, event)
+            )
+            if self.cursor.rowcount == 0:
+                self.conn.rollback()
+                return {'status': 'duplicate', 'payment_id': payment_id}
+
+            # Покупка пакета генераций
+            self.cursor.execute('''
+                UPDATE generation_purchases SET status = 'succeeded', completed_at = CURRENT_TIMESTAMP
+                WHERE payment_id = ? AND status != 'succeeded'
+            ''', (payment_id,))
+            if self.cursor.rowcount:
+                self.cursor.execute(
+                    'SELECT user_id, package_size FROM generation_purchases WHERE payment_id = ?', (payment_id,)
+                )
+                user_id, package_size = self.cursor.fetchone()
+                self.post_ledger_entry(user_id, 'generations', package_size, "purchase", payment_id)
+                touched_users.append(user_id)
+                result.update(kind='generations', user_id=user_id, generations_count=package_size)
+            else:
+                # Пополнение баланса
+                self.cursor.execute('''
+                    UPDATE payments SET status = 'succeeded', paid_at = CURRENT_TIMESTAMP
+                    WHERE payment_id = ? AND status != 'succeeded'
+                ''', (payment_id,))
+                if self.cursor.rowcount:
+                    self.cursor.execute('SELECT user_id, amount FROM payments WHERE payment_id = ?', (payment_id,))
+                    user_id, amount = self.cursor.fetchone()
+                    self.post_ledger_entry(user_id, 'balance', amount, "top_up", payment_id)
+                    touched_users.append(user_id)
+                    result.update(kind='balance', user_id=user_id, amount=amount)
+
+                    referral_bonuses = []
+                    for referrer_id, depth in self._get_referral_upline(user_id, len(referral_rates)):
+                        referral_bonus = amount * referral_rates[depth - 1]
+                        if referral_bonus <= 0:
+                            continue
+                        self.post_ledger_entry(referrer_id, 'balance', referral_bonus, "referral_bonus", payment_id)
+                        self.cursor.execute('''
+                            INSERT INTO referral_earnings (user_id, from_user_id, amount, payment_amount)
+                            VALUES (?, ?, ?, ?)
+                        ''', (referrer_id, user_id, referral_bonus, amount))
+                        self.post_ledger_entry(referrer_id, 'referral_balance', referral_bonus, "referral_bonus", payment_id)
+                        touched_users.append(referrer_id)
+                        referral_bonuses.append({'referrer_id': referrer_id, 'depth': depth, 'bonus': referral_bonus})
+                        if depth == 1:
+                            result.update(referrer_id=referrer_id, referral_bonus=referral_bonus)
+                    result['referral_bonuses'] = referral_bonuses
+                else:
+                    self.cursor.execute('''
+                        SELECT 1 FROM generation_purchases WHERE payment_id = ?
+                        UNION ALL
+                        SELECT 1 FROM payments WHERE payment_id = ?
+                    ''', (payment_id, payment_id))
+                    if not self.cursor.fetchone():
+                        # Платёж ещё не записан - событие не помечаем, чтобы YooKassa повторила доставку
+                        self.conn.rollback()
+                        return {'status': 'not_found', 'payment_id': payment_id}
+                    result['status'] = 'already_processed'
+
+            self.cursor.execute(
+                'UPDATE processed_events SET result = ? WHERE event_key = ?',
+                (result['status'], event_key)
+            )
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            for user_id in touched_users:
+                self.invalidate_user(user_id)
+
+        print(f"✅ Событие {event_key} обработано: {result}")
+        return result
+
+    def credit_referral_bonus(self, referrer_id: int, from_user_id: int, bonus: float, payment_amount: float,
+                              payment_id: str) -> bool:
+        """
+        Начисляет реферальный бонус за платёж ровно один раз
+
+        Нужен, когда плательщик и реферер лежат в разных БД (шардированный
+        режим) и бонус нельзя провести в транзакции fulfill_payment_event.
+        Повторный вызов для того же платежа и реферера возвращает False.
+        """
+        self.cursor.execute("BEGIN IMMEDIATE")
+        try:
+            self.cursor.execute('''
+                INSERT OR IGNORE INTO processed_events (event_key, payment_id, event, result)
+                VALUES (?, ?, 'referral_bonus', 'processed')
+            ''', (f"referral_bonus:{payment_id}:{referrer_id}", payment_id))
+            if self.cursor.rowcount == 0:
+                self.conn.rollback()
+                return False
+            self.post_ledger_entry(referrer_id, 'balance', bonus, "referral_bonus", payment_id)
+            self.cursor.execute('''
+                INSERT INTO referral_earnings (user_id, from_user_id, amount, payment_amount)
+                VALUES (?, ?, ?, ?)
+            ''', (referrer_id, from_user_id, bonus, payment_amount))
+            self.post_ledger_entry(referrer_id, 'referral_balance', bonus, "referral_bonus", payment_id)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            self.invalidate_user(referrer_id)
+        return True
+
     def create_payments_table(self):
         """Создаёт таблицу для хранения платежей"""
         self.cursor.execute('''
@@ -181,6 +611,7 @@ class Database:
                 FOREIGN KEY (user_id) REFERENCES users (user_id)
             )
         ''')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_payments_status_created ON payments (status, created_at)')
         self.conn.commit()
     
     def save_payment(self, payment_id: str, user_id: int, amount: float):
@@ -194,19 +625,8 @@ class Database:
     
     def get_payment(self, payment_id: str):
         """Получает платёж по ID"""
-        self.cursor.execute('SELECT * FROM payments WHERE payment_id = ?', (payment_id,))
-        row = self.cursor.fetchone()
-        if row:
-            return {
-                'id': row[0],
-                'payment_id': row[1],
-                'user_id': row[2],
-                'amount': row[3],
-                'status': row[4],
-                'created_at': row[5],
-                'paid_at': row[6]
-            }
-        return None
+        self.cursor.execute(f'SELECT {PAYMENT_COLUMNS_SQL} FROM payments WHERE payment_id = ?', (payment_id,))
+        return PaymentRecord.from_row(self.cursor.fetchone())
     
     def update_payment_status(self, payment_id: str, status: str):
         """Обновляет статус платежа"""
@@ -229,10 +649,24 @@ class Database:
                 file_url TEXT NOT NULL,
                 prompt TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                model TEXT,
                 FOREIGN KEY (user_id) REFERENCES users (user_id)
             )
         ''')
         self.conn.commit()
+
+    def update_generations_table_for_model(self):
+        """Добавляет поле model в таблицу generations (для старых БД)"""
+        self.cursor.execute("PRAGMA table_info(generations)")
+        columns = [column[1] for column in self.cursor.fetchall()]
+
+        if 'model' not in columns:
+            try:
+                self.cursor.execute('ALTER TABLE generations ADD COLUMN model TEXT')
+                self.conn.commit()
+                print("✅ Добавлено поле model в таблицу generations")
+            except Exception as e:
+                print(f"⚠️ Ошибка добавления поля model: {e}")
     
     def update_users_table_for_referrals(self):
         """Добавляет поля для реферальной системы в таблицу users (для старых БД)"""
@@ -266,17 +700,43 @@ class Database:
         self.conn.commit()
     
     def generate_referral_code(self, user_id: int):
-        """Генерирует уникальный реферальный код для пользователя"""
-        import random
-        import string
-        
+        """Выдаёт пользователю реферальный код, если его ещё нет, и возвращает действующий код"""
+        self.cursor.execute(
+            'UPDATE users SET referral_code = ? WHERE user_id = ? AND referral_code IS NULL',
+            (encode_referral_code(user_id), user_id)
+        )
+        self.conn.commit()
+        self.invalidate_user(user_id)
+        return self.get_referral_code(user_id)
+
+    def backfill_referral_codes(self, batch_size: int = 1000):
+        """Выдаёт коды старым пользователям без referral_code, пачками"""
+        total = 0
         while True:
-            code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-            self.cursor.execute('SELECT user_id FROM users WHERE referral_code = ?', (code,))
-            if not self.cursor.fetchone():
-                self.cursor.execute('UPDATE users SET referral_code = ? WHERE user_id = ?', (code, user_id))
-                self.conn.commit()
-                return code
+            self.cursor.execute('SELECT user_id FROM users WHERE referral_code IS NULL LIMIT ?', (batch_size,))
+            user_ids = [row[0] for row in self.cursor.fetchall()]
+            if not user_ids:
+                break
+            self.cursor.executemany(
+                'UPDATE users SET referral_code = ? WHERE user_id = ?',
+                [(encode_referral_code(user_id), user_id) for user_id in user_ids]
+            )
+            self.conn.commit()
+            user_cache.invalidate(*(self._user_key(user_id) for user_id in user_ids))
+            total += len(user_ids)
+        if total:
+            print(f"✅ Выданы реферальные коды {total} пользователям")
+        return total
+
+    def create_referral_code_index(self):
+        """Уникальный индекс по referral_code (в старых БД колонка добавлялась без UNIQUE)"""
+        try:
+            self.cursor.execute(
+                'CREATE UNIQUE INDEX IF NOT EXISTS idx_users_referral_code ON users (referral_code)'
+            )
+            self.conn.commit()
+        except sqlite3.IntegrityError as e:
+            print(f"⚠️ Не удалось создать уникальный индекс реферальных кодов: {e}")
     
     def get_referral_code(self, user_id: int):
         """Получает реферальный код пользователя"""
@@ -285,9 +745,12 @@ class Database:
         return result[0] if result and result[0] else None
     
     def set_referrer(self, user_id: int, referrer_id: int):
-        """Устанавливает реферера для пользователя"""
+        """Устанавливает реферера для пользователя (счётчики рефереров обновляет триггер)"""
+        self.cursor.execute('SELECT referrer_id FROM users WHERE user_id = ?', (user_id,))
+        row = self.cursor.fetchone()
         self.cursor.execute('UPDATE users SET referrer_id = ? WHERE user_id = ?', (referrer_id, user_id))
         self.conn.commit()
+        user_cache.invalidate(*(self._user_key(uid) for uid in (user_id, referrer_id, row[0] if row else None) if uid))
     
     def get_user_by_referral_code(self, referral_code: str):
         """Получает пользователя по реферальному коду"""
@@ -295,68 +758,274 @@ class Database:
         result = self.cursor.fetchone()
         return result[0] if result else None
     
-    def add_referral_earning(self, user_id: int, from_user_id: int, amount: float, payment_amount: float):
+    def add_referral_earning(self, user_id: int, from_user_id: int, amount: float, payment_amount: float,
+                             ref_id: str = None):
         """Добавляет реферальное начисление"""
         self.cursor.execute('''
             INSERT INTO referral_earnings (user_id, from_user_id, amount, payment_amount)
             VALUES (?, ?, ?, ?)
         ''', (user_id, from_user_id, amount, payment_amount))
-    
-        self.conn.commit()
         
-        self.cursor.execute('''
-            UPDATE users SET referral_balance = referral_balance + ? WHERE user_id = ?
-        ''', (amount, user_id))
+        self.post_ledger_entry(user_id, 'referral_balance', amount, "referral_bonus", ref_id)
         
         self.conn.commit()
+        self.invalidate_user(user_id)
     
     def get_referral_stats(self, user_id: int):
-        """Получает статистику по рефералам"""
-        self.cursor.execute('SELECT COUNT(*) FROM users WHERE referrer_id = ?', (user_id,))
-        referrals_count = self.cursor.fetchone()[0]
-        
-        self.cursor.execute('SELECT COALESCE(SUM(amount), 0.0) FROM referral_earnings WHERE user_id = ?', (user_id,))
-        total_earned = self.cursor.fetchone()[0]
-        
+        """Получает статистику по рефералам из счётчиков в профиле пользователя"""
+        user = self.get_user(user_id)
         return {
-            'referrals_count': referrals_count,
-            'total_earned': total_earned
+            'referrals_count': user['referrals_count'] if user else 0,
+            'total_earned': user['referral_earned'] if user else 0.0
         }
-    
-    def save_generation(self, user_id: int, generation_type: str, file_url: str, prompt: str = ""):
-        """Сохраняет генерацию в базу данных"""
-        self.cursor.execute('''
-            INSERT INTO generations (user_id, type, file_url, prompt)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, generation_type, file_url, prompt))
-        self.conn.commit()
-    
-    def get_user_photos(self, user_id: int):
-        """Получает все оживлённые фото пользователя"""
+
+    def create_referral_counters(self):
+        """
+        Счётчики рефералов в users: referrals_count и referral_earned
+
+        Триггеры обновляют их в той же транзакции, что и запись в users или
+        referral_earnings. При добавлении колонок в старую БД счётчики
+        пересчитываются по исходным таблицам.
+        """
+        self.cursor.execute("PRAGMA table_info(users)")
+        columns = [column[1] for column in self.cursor.fetchall()]
+
+        added = False
+        if 'referrals_count' not in columns:
+            self.cursor.execute('ALTER TABLE users ADD COLUMN referrals_count INTEGER DEFAULT 0')
+            added = True
+        if 'referral_earned' not in columns:
+            self.cursor.execute('ALTER TABLE users ADD COLUMN referral_earned REAL DEFAULT 0.0')
+            added = True
+
+        self.cursor.executescript("""
+            CREATE INDEX IF NOT EXISTS idx_users_referrer ON users (referrer_id);
+            CREATE INDEX IF NOT EXISTS idx_referral_earnings_user ON referral_earnings (user_id);
+
+            DROP TRIGGER IF EXISTS referral_counters_insert;
+            CREATE TRIGGER referral_counters_insert AFTER INSERT ON users
+            WHEN NEW.referrer_id IS NOT NULL
+            BEGIN
+                UPDATE users SET referrals_count = referrals_count + 1 WHERE user_id = NEW.referrer_id;
+            END;
+
+            DROP TRIGGER IF EXISTS referral_counters_update;
+            CREATE TRIGGER referral_counters_update AFTER UPDATE OF referrer_id ON users
+            WHEN OLD.referrer_id IS NOT NEW.referrer_id
+            BEGIN
+                UPDATE users SET referrals_count = referrals_count - 1 WHERE user_id = OLD.referrer_id;
+                UPDATE users SET referrals_count = referrals_count + 1 WHERE user_id = NEW.referrer_id;
+            END;
+
+            DROP TRIGGER IF EXISTS referral_counters_delete;
+            CREATE TRIGGER referral_counters_delete AFTER DELETE ON users
+            WHEN OLD.referrer_id IS NOT NULL
+            BEGIN
+                UPDATE users SET referrals_count = referrals_count - 1 WHERE user_id = OLD.referrer_id;
+            END;
+
+            DROP TRIGGER IF EXISTS referral_counters_earning;
+            CREATE TRIGGER referral_counters_earning AFTER INSERT ON referral_earnings
+            BEGIN
+                UPDATE users SET referral_earned = referral_earned + NEW.amount WHERE user_id = NEW.user_id;
+            END;
+        """)
+
+        if added:
+            self.check_referral_counters()
+
+    def create_referral_closure(self):
+        """
+        Таблица замыкания реферального дерева: (ancestor, descendant, depth)
+
+        Для каждого пользователя хранит всех рефереров вверх по цепочке с
+        глубиной (1 - пригласивший напрямую). Поддерживается триггерами на
+        users, поэтому счётчики по уровням и начисления по цепочке - один
+        индексный запрос без рекурсии.
+        """
+        self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'referral_closure'")
+        existed = self.cursor.fetchone() is not None
+
+        self.cursor.executescript("""
+            CREATE TABLE IF NOT EXISTS referral_closure (
+                ancestor INTEGER NOT NULL,
+                descendant INTEGER NOT NULL,
+                depth INTEGER NOT NULL,
+                PRIMARY KEY (ancestor, depth, descendant)
+            ) WITHOUT ROWID;
+
+            CREATE INDEX IF NOT EXISTS idx_referral_closure_descendant ON referral_closure (descendant, depth);
+
+            DROP TRIGGER IF EXISTS referral_closure_cycle;
+            CREATE TRIGGER referral_closure_cycle BEFORE UPDATE OF referrer_id ON users
+            WHEN NEW.referrer_id = NEW.user_id OR EXISTS (
+                SELECT 1 FROM referral_closure WHERE ancestor = NEW.user_id AND descendant = NEW.referrer_id
+            )
+            BEGIN
+                SELECT RAISE(ABORT, 'referral cycle');
+            END;
+
+            DROP TRIGGER IF EXISTS referral_closure_insert;
+            CREATE TRIGGER referral_closure_insert AFTER INSERT ON users
+            WHEN NEW.referrer_id IS NOT NULL
+            BEGIN
+                INSERT OR IGNORE INTO referral_closure (ancestor, descendant, depth)
+                    SELECT NEW.referrer_id, NEW.user_id, 1
+                    UNION ALL
+                    SELECT ancestor, NEW.user_id, depth + 1 FROM referral_closure WHERE descendant = NEW.referrer_id;
+            END;
+
+            -- Смена реферера переносит всё поддерево пользователя под нового реферера
+            DROP TRIGGER IF EXISTS referral_closure_update;
+            CREATE TRIGGER referral_closure_update AFTER UPDATE OF referrer_id ON users
+            WHEN OLD.referrer_id IS NOT NEW.referrer_id
+            BEGIN
+                DELETE FROM referral_closure
+                WHERE ancestor IN (SELECT ancestor FROM referral_closure WHERE descendant = NEW.user_id)
+                  AND (descendant = NEW.user_id
+                       OR descendant IN (SELECT descendant FROM referral_closure WHERE ancestor = NEW.user_id));
+                INSERT OR IGNORE INTO referral_closure (ancestor, descendant, depth)
+                    SELECT up.ancestor, down.descendant, up.depth + down.depth + 1
+                    FROM (SELECT NEW.referrer_id AS ancestor, 0 AS depth
+                          UNION ALL
+                          SELECT ancestor, depth FROM referral_closure WHERE descendant = NEW.referrer_id) AS up,
+                         (SELECT NEW.user_id AS descendant, 0 AS depth
+                          UNION ALL
+                          SELECT descendant, depth FROM referral_closure WHERE ancestor = NEW.user_id) AS down
+                    WHERE NEW.referrer_id IS NOT NULL;
+            END;
+
+            DROP TRIGGER IF EXISTS referral_closure_delete;
+            CREATE TRIGGER referral_closure_delete AFTER DELETE ON users
+            BEGIN
+                DELETE FROM referral_closure WHERE descendant = OLD.user_id OR ancestor = OLD.user_id;
+            END;
+        """)
+
+        if not existed:
+            self.rebuild_referral_closure()
+
+    def rebuild_referral_closure(self):
+        """Пересчитывает таблицу замыкания по users.referrer_id"""
+        self.cursor.executescript("""
+            BEGIN;
+            DELETE FROM referral_closure;
+            INSERT OR IGNORE INTO referral_closure (ancestor, descendant, depth)
+                WITH RECURSIVE chain (ancestor, descendant, depth) AS (
+                    SELECT referrer_id, user_id, 1 FROM users WHERE referrer_id IS NOT NULL
+                    UNION ALL
+                    SELECT u.referrer_id, chain.descendant, chain.depth + 1
+                    FROM chain JOIN users u ON u.user_id = chain.ancestor
+                    WHERE u.referrer_id IS NOT NULL AND chain.depth < 64
+                )
+                SELECT ancestor, descendant, depth FROM chain;
+            COMMIT;
+        """)
+
+    def _get_referral_upline(self, user_id: int, max_depth: int):
+        """Рефереры пользователя вверх по цепочке до max_depth: [(referrer_id, depth), ...]"""
+        if max_depth <= 0:
+            return []
         self.cursor.execute('''
-            SELECT file_url, prompt, created_at FROM generations
-            WHERE user_id = ? AND type = 'photo_animation'
-            ORDER BY created_at DESC
-        ''', (user_id,))
+            SELECT ancestor, depth FROM referral_closure
+            WHERE descendant = ? AND depth <= ?
+            ORDER BY depth
+        ''', (user_id, max_depth))
         return self.cursor.fetchall()
+
+    def get_referral_counts_by_depth(self, user_id: int, max_depth: int = 3):
+        """Количество рефералов по уровням: {1: приглашённые напрямую, 2: приглашённые ими, ...}"""
+        with self._reader() as cursor:
+            cursor.execute('''
+                SELECT depth, COUNT(*) FROM referral_closure
+                WHERE ancestor = ? AND depth <= ?
+                GROUP BY depth
+            ''', (user_id, max_depth))
+            return dict(cursor.fetchall())
+
+    def count_referrals_by_referrer(self):
+        """Число приглашённых в этой БД по рефереру: {referrer_id: количество}"""
+        with self._reader() as cursor:
+            cursor.execute('''
+                SELECT referrer_id, COUNT(*) FROM users
+                WHERE referrer_id IS NOT NULL
+                GROUP BY referrer_id
+            ''')
+            return dict(cursor.fetchall())
+
+    def get_referral_ids(self, referrer_ids):
+        """id пользователей, приглашённых кем-то из referrer_ids"""
+        placeholders = ", ".join("?" * len(referrer_ids))
+        with self._reader() as cursor:
+            cursor.execute(f'SELECT user_id FROM users WHERE referrer_id IN ({placeholders})', tuple(referrer_ids))
+            return [row[0] for row in cursor.fetchall()]
+
+    def adjust_referrals_count(self, user_id: int, delta: int):
+        """Меняет счётчик приглашённых, когда реферал записан в другой БД (шардированный режим)"""
+        self.cursor.execute(
+            'UPDATE users SET referrals_count = referrals_count + ? WHERE user_id = ?', (delta, user_id)
+        )
+        self.conn.commit()
+        self.invalidate_user(user_id)
+
+    def check_referral_counters(self, fix: bool = True, referrals_counts: dict = None):
+        """
+        Сверяет счётчики рефералов с users и referral_earnings, возвращает число расхождений
+
+        referrals_counts - {referrer_id: число приглашённых}, посчитанное снаружи:
+        в шардированном режиме приглашённые лежат и в других файлах.
+        """
+        if referrals_counts is None:
+            self.cursor.execute('''
+                SELECT user_id, actual_count, actual_earned FROM (
+                    SELECT u.user_id, u.referrals_count, u.referral_earned,
+                           (SELECT COUNT(*) FROM users r WHERE r.referrer_id = u.user_id) AS actual_count,
+                           (SELECT COALESCE(SUM(e.amount), 0.0) FROM referral_earnings e WHERE e.user_id = u.user_id) AS actual_earned
+                    FROM users u
+                )
+                WHERE referrals_count IS NOT actual_count OR abs(COALESCE(referral_earned, 0) - actual_earned) > 0.005
+            ''')
+            mismatches = self.cursor.fetchall()
+        else:
+            self.cursor.execute('''
+                SELECT u.user_id, u.referrals_count, u.referral_earned,
+                       (SELECT COALESCE(SUM(e.amount), 0.0) FROM referral_earnings e WHERE e.user_id = u.user_id)
+                FROM users u
+            ''')
+            mismatches = [
+                (user_id, referrals_counts.get(user_id, 0), actual_earned)
+                for user_id, referrals_count, referral_earned, actual_earned in self.cursor.fetchall()
+                if referrals_count != referrals_counts.get(user_id, 0)
+                or abs((referral_earned or 0) - actual_earned) > 0.005
+            ]
+        if mismatches and fix:
+            self.cursor.executemany(
+                'UPDATE users SET referrals_count = ?, referral_earned = ? WHERE user_id = ?',
+                [(actual_count, actual_earned, user_id) for user_id, actual_count, actual_earned in mismatches]
+            )
+            self.conn.commit()
+            user_cache.invalidate(*(self._user_key(row[0]) for row in mismatches))
+        if mismatches:
+            print(f"⚠️ Счётчики рефералов расходились у {len(mismatches)} пользователей" + (" - исправлено" if fix else ""))
+        return len(mismatches)
     
-    def get_user_videos(self, user_id: int):
-        """Получает все видео пользователя"""
+    def save_generation(self, user_id: int, generation_type: str, file_url: str, prompt: str = "", model: str = None):
+        """Сохраняет генерацию в базу данных"""
         self.cursor.execute('''
-            SELECT file_url, prompt, created_at FROM generations
-            WHERE user_id = ? AND type = 'video_generation'
-            ORDER BY created_at DESC
-        ''', (user_id,))
-        return self.cursor.fetchall()
+            INSERT INTO generations (user_id, type, file_url, prompt, model)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (user_id, generation_type, file_url, prompt, model))
+        self.conn.commit()
     
-    def get_user_edited_images(self, user_id: int):
-        """Получает все отредактированные изображения пользователя"""
-        self.cursor.execute('''
-            SELECT file_url, prompt, created_at FROM generations
-            WHERE user_id = ? AND type = 'image_editing'
-            ORDER BY created_at DESC
-        ''', (user_id,))
-        return self.cursor.fetchall()
+    def get_user_files(self, user_id: int, generation_type: str):
+        """Получает все файлы пользователя заданного типа, новые первыми"""
+        with self._reader() as cursor:
+            cursor.execute('''
+                SELECT file_url, prompt, created_at FROM generations
+                WHERE user_id = ? AND type = ?
+                ORDER BY created_at DESC
+            ''', (user_id, generation_type))
+            return cursor.fetchall()
     
     def add_user(self, user_id: int, username: str = None, first_name: str = None,
                  last_name: str = None):
@@ -366,26 +1035,59 @@ class Database:
             VALUES (?, ?, ?, ?, 0.0, 0)
         ''', (user_id, username, first_name, last_name))
         self.conn.commit()
+        self.invalidate_user(user_id)
     
+    def onboard_user(self, user_id: int, username: str = None, first_name: str = None,
+                     last_name: str = None, referral_code: str = None, referrer_id: int = None):
+        """
+        Регистрирует пользователя из /start одной транзакцией
+
+        Создаёт запись, выдаёт реферальный код и привязывает пригласившего по
+        его коду (или сразу по referrer_id, если код уже разрешён). Если
+        пользователь уже есть (например, /start пришёл дважды), ничего не
+        меняет и возвращает created=False.
+        """
+        if referrer_id == user_id:
+            referrer_id = None
+        self.cursor.execute("BEGIN IMMEDIATE")
+        try:
+            if referral_code:
+                self.cursor.execute('SELECT user_id FROM users WHERE referral_code = ?', (referral_code,))
+                row = self.cursor.fetchone()
+                if row and row[0] != user_id:
+                    referrer_id = row[0]
+
+            self.cursor.execute('''
+                INSERT OR IGNORE INTO users (user_id, username, first_name, last_name, balance, generations, referrer_id)
+                VALUES (?, ?, ?, ?, 0.0, 0, ?)
+            ''', (user_id, username, first_name, last_name, referrer_id))
+            created = self.cursor.rowcount > 0
+            if created:
+                self.cursor.execute(
+                    'UPDATE users SET referral_code = ? WHERE user_id = ?', (encode_referral_code(user_id), user_id)
+                )
+            else:
+                referrer_id = None
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+        self.invalidate_user(user_id)
+        if referrer_id:
+            self.invalidate_user(referrer_id)
+        return {'created': created, 'referrer_id': referrer_id}
+
     def get_user(self, user_id: int):
         """Получает информацию о пользователе"""
-        self.cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-        row = self.cursor.fetchone()
-        if row:
-            return {
-                'user_id': row[0],
-                'username': row[1],
-                'first_name': row[2],
-                'last_name': row[3],
-                'agreed_to_terms': row[4],
-                'balance': row[5],
-                'created_at': row[6],
-                'referrer_id': row[7] if len(row) > 7 else None,
-                'referral_balance': row[8] if len(row) > 8 else 0.0,
-                'referral_code': row[9] if len(row) > 9 else None,
-                'generations': row[10] if len(row) > 10 else 0
-            }
-        return None
+        key = self._user_key(user_id)
+        user = user_cache.get(key)
+        if user is MISSING:
+            self.cursor.execute(f'SELECT {USER_COLUMNS_SQL} FROM users WHERE user_id = ?', (user_id,))
+            user = UserRecord.from_row(self.cursor.fetchone())
+            user_cache.set(key, user)
+        # Запись неизменяемая, поэтому её можно отдавать прямо из кэша
+        return user
     
     def update_user_agreement(self, user_id: int):
         """Обновляет статус согласия пользователя с условиями"""
@@ -393,43 +1095,196 @@ class Database:
             UPDATE users SET agreed_to_terms = 1 WHERE user_id = ?
         ''', (user_id,))
         self.conn.commit()
+        self.invalidate_user(user_id)
     
-    def user_agreed_to_terms(self, user_id: int) -> bool:
-        """Проверяет, согласился ли пользователь с условиями"""
-        self.cursor.execute('SELECT agreed_to_terms FROM users WHERE user_id = ?', (user_id,))
-        result = self.cursor.fetchone()
-        return result[0] == 1 if result else False
-    
-    def add_to_balance(self, user_id: int, amount: float):
+    def add_to_balance(self, user_id: int, amount: float, reason: str = "top_up", ref_id: str = None):
         """Добавляет средства к балансу пользователя"""
         user = self.get_user(user_id)
         if user:
             new_balance = user['balance'] + amount
             print(f"💰 Пополнение баланса: User {user_id}, Old: {user['balance']}, Add: {amount}, New: {new_balance}")
-            self.update_user_balance(user_id, new_balance)
+            self.post_ledger_entry(user_id, 'balance', amount, reason, ref_id)
+            self.conn.commit()
+            self.invalidate_user(user_id)
             updated_user = self.get_user(user_id)
             print(f"✅ Баланс после обновления: {updated_user['balance']}")
+
+    def subtract_from_balance(self, user_id: int, amount: float, reason: str = "generation", ref_id: str = None):
+        """Списывает средства с баланса пользователя"""
+        print(f"📝 Списание с баланса: User {user_id}, Amount: {amount}, Reason: {reason}")
+        self.post_ledger_entry(user_id, 'balance', -amount, reason, ref_id)
+        self.conn.commit()
+        self.invalidate_user(user_id)
     
-    def update_user_balance(self, user_id: int, new_balance: float):
-        """Обновляет баланс пользователя"""
+    def update_user_balance(self, user_id: int, new_balance: float, reason: str = "adjustment"):
+        """Обновляет баланс пользователя (разница записывается в журнал как корректировка)"""
         print(f"📝 Обновление баланса в БД: User {user_id}, New Balance: {new_balance}")
+        self.cursor.execute('SELECT balance FROM users WHERE user_id = ?', (user_id,))
+        result = self.cursor.fetchone()
+        if result and new_balance != result[0]:
+            self.post_ledger_entry(user_id, 'balance', new_balance - result[0], reason)
+            self.conn.commit()
+        self.invalidate_user(user_id)
+
+    def create_ledger_tables(self):
+        """Создаёт журнал операций по счетам и таблицу его снимков"""
+        self.cursor.executescript("""
+            CREATE TABLE IF NOT EXISTS ledger (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                account TEXT NOT NULL,
+                amount REAL NOT NULL,
+                reason TEXT NOT NULL,
+                ref_id TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE INDEX IF NOT EXISTS idx_ledger_user_account ON ledger (user_id, account, id);
+            CREATE INDEX IF NOT EXISTS idx_ledger_ref_id ON ledger (ref_id);
+
+            CREATE TABLE IF NOT EXISTS ledger_snapshots (
+                user_id INTEGER NOT NULL,
+                account TEXT NOT NULL,
+                ledger_id INTEGER NOT NULL,
+                value REAL NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, account)
+            ) WITHOUT ROWID;
+
+            -- Последняя запись журнала, уже свёрнутая в снимки
+            CREATE TABLE IF NOT EXISTS ledger_watermark (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                ledger_id INTEGER NOT NULL
+            );
+
+            -- Журнал только дописывается: исправления оформляются новыми записями
+            CREATE TRIGGER IF NOT EXISTS ledger_no_update BEFORE UPDATE ON ledger
+            BEGIN
+                SELECT RAISE(ABORT, 'ledger is append-only');
+            END;
+            CREATE TRIGGER IF NOT EXISTS ledger_no_delete BEFORE DELETE ON ledger
+            BEGIN
+                SELECT RAISE(ABORT, 'ledger is append-only');
+            END;
+        """)
+
+        # Для существующей БД переносим текущие остатки как начальные записи
+        self.cursor.execute("SELECT 1 FROM ledger LIMIT 1")
+        if not self.cursor.fetchone():
+            for account in LEDGER_ACCOUNTS:
+                self.cursor.execute(f"""
+                    INSERT INTO ledger (user_id, account, amount, reason)
+                    SELECT user_id, '{account}', {account}, 'opening' FROM users
+                    WHERE {account} IS NOT NULL AND {account} != 0
+                """)
+            self.conn.commit()
+
+    def post_ledger_entry(self, user_id: int, account: str, amount: float, reason: str, ref_id: str = None):
+        """
+        Записывает операцию в журнал и применяет её к остатку в users
+
+        Коммит и сброс кэша делает вызывающий метод, чтобы несколько операций
+        попадали в одну транзакцию.
+        """
+        if account not in LEDGER_ACCOUNTS:
+            raise ValueError(f"Неизвестный счёт: {account}")
         self.cursor.execute('''
-            UPDATE users SET balance = ? WHERE user_id = ?
-        ''', (new_balance, user_id))
+            INSERT INTO ledger (user_id, account, amount, reason, ref_id)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (user_id, account, amount, reason, ref_id))
+        self.cursor.execute(f'UPDATE users SET {account} = {account} + ? WHERE user_id = ?', (amount, user_id))
+
+    def get_ledger_entries(self, user_id: int = None, ref_id: str = None, limit: int = 50):
+        """Возвращает последние записи журнала по пользователю или по id платежа/задачи"""
+        conditions, params = [], []
+        if user_id is not None:
+            conditions.append('user_id = ?')
+            params.append(user_id)
+        if ref_id is not None:
+            conditions.append('ref_id = ?')
+            params.append(ref_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        self.cursor.execute(f'''
+            SELECT id, user_id, account, amount, reason, ref_id, created_at
+            FROM ledger {where}
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (*params, limit))
+        columns = ('id', 'user_id', 'account', 'amount', 'reason', 'ref_id', 'created_at')
+        return [dict(zip(columns, row)) for row in self.cursor.fetchall()]
+
+    def snapshot_ledger(self):
+        """
+        Сворачивает новые записи журнала в снимки остатков, возвращает число обновлённых снимков
+
+        Читаются только записи после ledger_watermark. Запись в SQLite идёт по
+        одной транзакции за раз, поэтому id фиксируются по возрастанию и всё,
+        что не больше отметки, уже учтено.
+        """
+        self.cursor.execute('''
+            SELECT COALESCE(
+                (SELECT ledger_id FROM ledger_watermark),
+                (SELECT MAX(ledger_id) FROM ledger_snapshots),
+                0
+            ), (SELECT MAX(id) FROM ledger)
+        ''')
+        watermark, last_id = self.cursor.fetchone()
+        if last_id is None or last_id <= watermark:
+            return 0
+
+        self.cursor.execute('''
+            INSERT INTO ledger_snapshots (user_id, account, ledger_id, value, created_at)
+            SELECT tail.user_id, tail.account, tail.last_id, COALESCE(s.value, 0.0) + tail.delta, CURRENT_TIMESTAMP
+            FROM (
+                SELECT user_id, account, MAX(id) AS last_id, SUM(amount) AS delta
+                FROM ledger
+                WHERE id > ? AND id <= ?
+                GROUP BY user_id, account
+            ) AS tail
+            LEFT JOIN ledger_snapshots s ON s.user_id = tail.user_id AND s.account = tail.account
+            WHERE 1
+            ON CONFLICT(user_id, account) DO UPDATE SET
+                ledger_id = excluded.ledger_id,
+                value = excluded.value,
+                created_at = excluded.created_at
+        ''', (watermark, last_id))
+        updated = self.cursor.rowcount
+        self.cursor.execute('''
+            INSERT INTO ledger_watermark (id, ledger_id) VALUES (1, ?)
+            ON CONFLICT(id) DO UPDATE SET ledger_id = excluded.ledger_id
+        ''', (last_id,))
         self.conn.commit()
+        return updated
 
     
-    def save_pending_action(self, user_id: int, action_type: str, action_data: str):
-        """Сохраняет незавершённое действие пользователя"""
+    def update_pending_actions_for_expiry(self):
+        """Добавляет срок жизни незавершённым действиям (для старых БД) и индекс по нему"""
+        self.cursor.execute("PRAGMA table_info(pending_actions)")
+        columns = [column[1] for column in self.cursor.fetchall()]
+
+        if 'expires_at' not in columns:
+            self.cursor.execute('ALTER TABLE pending_actions ADD COLUMN expires_at INTEGER')
+            self.cursor.execute(
+                "UPDATE pending_actions SET expires_at = CAST(strftime('%s', created_at) AS INTEGER) + ?",
+                (PENDING_ACTION_TTL,)
+            )
+            print("✅ Добавлено поле expires_at в таблицу pending_actions")
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_pending_actions_expires ON pending_actions (expires_at)')
+        self.conn.commit()
+
+    def save_pending_action(self, user_id: int, action_type: str, action_data: str, ttl: int = PENDING_ACTION_TTL):
+        """Сохраняет незавершённое действие пользователя на ttl секунд"""
         self.cursor.execute('''
-            INSERT OR REPLACE INTO pending_actions (user_id, action_type, action_data)
-            VALUES (?, ?, ?)
-        ''', (user_id, action_type, action_data))
+            INSERT OR REPLACE INTO pending_actions (user_id, action_type, action_data, expires_at)
+            VALUES (?, ?, ?, CAST(strftime('%s', 'now') AS INTEGER) + ?)
+        ''', (user_id, action_type, action_data, ttl))
         self.conn.commit()
     
     def get_pending_action(self, user_id: int):
-        """Получает незавершённое действие пользователя"""
-        self.cursor.execute('SELECT action_type, action_data FROM pending_actions WHERE user_id = ?', (user_id,))
+        """Получает незавершённое действие пользователя (просроченные не возвращаются)"""
+        self.cursor.execute('''
+            SELECT action_type, action_data FROM pending_actions
+            WHERE user_id = ? AND (expires_at IS NULL OR expires_at > CAST(strftime('%s', 'now') AS INTEGER))
+        ''', (user_id,))
         result = self.cursor.fetchone()
         if result:
             pending = {'action_type': result[0], 'action_data': result[1]}
@@ -442,100 +1297,282 @@ class Database:
         """Удаляет незавершённое действие после выполнения"""
         self.cursor.execute('DELETE FROM pending_actions WHERE user_id = ?', (user_id,))
         self.conn.commit()
+
+    def sweep_expired_pending_actions(self, batch_size: int = 500):
+        """Удаляет просроченные незавершённые действия пачками, возвращает их количество"""
+        total = 0
+        while True:
+            self.cursor.execute('''
+                DELETE FROM pending_actions WHERE user_id IN (
+                    SELECT user_id FROM pending_actions
+                    WHERE expires_at <= CAST(strftime('%s', 'now') AS INTEGER)
+                    LIMIT ?
+                )
+            ''', (batch_size,))
+            deleted = self.cursor.rowcount
+            self.conn.commit()
+            total += deleted
+            if deleted < batch_size:
+                break
+        if total:
+            print(f"🧹 Удалено просроченных незавершённых действий: {total}")
+        return total
         
+    def create_stats_tables(self):
+        """Создаёт таблицы статистики, которые поддерживаются триггерами при каждой записи"""
+        self.cursor.executescript("""
+            CREATE TABLE IF NOT EXISTS stats_counters (
+                name TEXT PRIMARY KEY,
+                value REAL NOT NULL DEFAULT 0
+            );
+
+            CREATE TABLE IF NOT EXISTS stats_hourly (
+                hour TEXT NOT NULL,
+                metric TEXT NOT NULL,
+                value REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (hour, metric)
+            ) WITHOUT ROWID;
+
+            CREATE TABLE IF NOT EXISTS stats_daily (
+                day TEXT NOT NULL,
+                metric TEXT NOT NULL,
+                value REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, metric)
+            ) WITHOUT ROWID;
+
+            CREATE TABLE IF NOT EXISTS stats_daily_active (
+                day TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                PRIMARY KEY (day, user_id)
+            ) WITHOUT ROWID;
+        """)
+
+        # Триггеры пересоздаются, чтобы старая БД получила их актуальную версию
+        self.cursor.executescript(_stats_triggers_sql())
+
+        # Для существующей БД заполняем счётчики по уже накопленным данным
+        self.cursor.execute("SELECT value FROM stats_counters WHERE name = 'initialized'")
+        result = self.cursor.fetchone()
+        if not result or result[0] < STATS_VERSION:
+            self.rebuild_stats()
+
+    def rebuild_stats(self):
+        """Пересчитывает таблицы статистики с нуля по исходным данным"""
+        rollups = []
+        for table, bucket in (("stats_hourly (hour", HOUR_BUCKET), ("stats_daily (day", DAY_BUCKET)):
+            rollups.append(f"""
+                INSERT INTO {table}, metric, value)
+                    SELECT {bucket % 'created_at'}, 'new_users', COUNT(*) FROM users GROUP BY 1;
+                INSERT INTO {table}, metric, value)
+                    SELECT {bucket % 'created_at'}, 'generations', COUNT(*) FROM generations GROUP BY 1;
+                INSERT INTO {table}, metric, value)
+                    SELECT {bucket % 'created_at'}, 'type:' || type, COUNT(*) FROM generations GROUP BY 1, 2;
+                INSERT INTO {table}, metric, value)
+                    SELECT {bucket % 'created_at'}, 'model:' || model, COUNT(*) FROM generations
+                    WHERE model IS NOT NULL GROUP BY 1, 2;
+                INSERT INTO {table}, metric, value)
+                    SELECT {bucket % 'paid_at'}, 'payments', COUNT(*) FROM payments
+                    WHERE status = 'succeeded' AND paid_at IS NOT NULL GROUP BY 1;
+                INSERT INTO {table}, metric, value)
+                    SELECT {bucket % 'paid_at'}, 'payments_sum', SUM(amount) FROM payments
+                    WHERE status = 'succeeded' AND paid_at IS NOT NULL GROUP BY 1;
+                INSERT INTO {table}, metric, value)
+                    SELECT {bucket % 'created_at'}, 'referral_payouts', SUM(amount) FROM referral_earnings GROUP BY 1;
+            """)
+
+        self.cursor.executescript(f"""
+            BEGIN;
+            DELETE FROM stats_counters;
+            DELETE FROM stats_hourly;
+            DELETE FROM stats_daily;
+            DELETE FROM stats_daily_active;
+
+            INSERT INTO stats_counters (name, value)
+                SELECT 'users', COUNT(*) FROM users;
+            INSERT INTO stats_counters (name, value)
+                SELECT 'referrals', COUNT(*) FROM users WHERE referrer_id IS NOT NULL;
+            INSERT INTO stats_counters (name, value)
+                SELECT 'generations', COUNT(*) FROM generations;
+            INSERT INTO stats_counters (name, value)
+                SELECT 'generations:' || type, COUNT(*) FROM generations GROUP BY type;
+            INSERT INTO stats_counters (name, value)
+                SELECT 'payments', COUNT(*) FROM payments WHERE status = 'succeeded';
+            INSERT INTO stats_counters (name, value)
+                SELECT 'payments_sum', COALESCE(SUM(amount), 0.0) FROM payments WHERE status = 'succeeded';
+            INSERT INTO stats_counters (name, value)
+                SELECT 'referral_earnings', COALESCE(SUM(amount), 0.0) FROM referral_earnings;
+            {''.join(rollups)}
+            -- Суточные active_users заполнит триггер stats_daily_active_insert
+            INSERT INTO stats_daily_active (day, user_id)
+                SELECT DISTINCT date(created_at), user_id FROM generations;
+
+            INSERT INTO stats_counters (name, value) VALUES ('initialized', {STATS_VERSION});
+            COMMIT;
+        """)
+        print("📊 Статистика пересчитана")
+
+    def _get_counter(self, name: str):
+        with self._reader() as cursor:
+            cursor.execute("SELECT value FROM stats_counters WHERE name = ?", (name,))
+            result = cursor.fetchone()
+        return result[0] if result else 0
+
+    def _get_daily_sum(self, metric: str, days: int):
+        # Окно в днях считается по календарным суткам (UTC), включая сегодняшние
+        with self._reader() as cursor:
+            cursor.execute("""
+                SELECT COALESCE(SUM(value), 0)
+                FROM stats_daily
+                WHERE metric = ? AND day >= date('now', '-' || ? || ' days')
+            """, (metric, days - 1))
+            return cursor.fetchone()[0]
+
     def get_total_users_count(self):
         """Получает общее количество пользователей"""
-        self.cursor.execute("SELECT COUNT(*) FROM users")
-        count = self.cursor.fetchone()[0]
-        return count
+        return int(self._get_counter('users'))
     
     def get_new_users_count(self, days=7):
         """Получает количество новых пользователей за последние N дней"""
-        self.cursor.execute("""
-            SELECT COUNT(*) 
-            FROM users 
-            WHERE created_at >= datetime('now', '-' || ? || ' days')
-        """, (days,))
-        return self.cursor.fetchone()[0]
+        return int(self._get_daily_sum('new_users', days))
     
     def get_total_generations_count(self):
         """Получает общее количество генераций"""
-        self.cursor.execute("SELECT COUNT(*) FROM generations")
-        count = self.cursor.fetchone()[0]
-        return count
+        return int(self._get_counter('generations'))
     
     def get_generations_by_type(self):
         """Получает количество генераций по типам"""
-        self.cursor.execute("""
-            SELECT type, COUNT(*) 
-            FROM generations 
-            GROUP BY type
-        """)
-        results = self.cursor.fetchall()
-        return {row[0]: row[1] for row in results}
+        with self._reader() as cursor:
+            cursor.execute("""
+                SELECT substr(name, 13), value
+                FROM stats_counters
+                WHERE name LIKE 'generations:%' AND value != 0
+            """)
+            results = cursor.fetchall()
+        return {row[0]: int(row[1]) for row in results}
     
     def get_total_payments_sum(self):
         """Получает общую сумму успешных платежей"""
-        self.cursor.execute("""
-            SELECT COALESCE(SUM(amount), 0.0) 
-            FROM payments 
-            WHERE status = 'succeeded'
-        """)
-        result = self.cursor.fetchone()[0]
-        return result if result else 0.0
+        return float(self._get_counter('payments_sum'))
     
     def get_payments_count(self):
         """Получает количество успешных платежей"""
-        self.cursor.execute("""
-            SELECT COUNT(*) 
-            FROM payments 
-            WHERE status = 'succeeded'
-        """)
-        return self.cursor.fetchone()[0]
+        return int(self._get_counter('payments'))
     
     def get_recent_payments_sum(self, days=7):
         """Получает сумму платежей за последние N дней"""
-        self.cursor.execute("""
-            SELECT COALESCE(SUM(amount), 0.0)
-            FROM payments 
-            WHERE status = 'succeeded' 
-            AND paid_at >= datetime('now', '-' || ? || ' days')
-        """, (days,))
-        result = self.cursor.fetchone()[0]
-        return result if result else 0.0
+        return float(self._get_daily_sum('payments_sum', days))
     
     def get_active_users_count(self, days=7):
         """Получает количество активных пользователей (сделавших хотя бы 1 генерацию)"""
-        self.cursor.execute("""
-            SELECT COUNT(DISTINCT user_id) 
-            FROM generations 
-            WHERE created_at >= datetime('now', '-' || ? || ' days')
-        """, (days,))
-        return self.cursor.fetchone()[0]
+        with self._reader() as cursor:
+            cursor.execute("""
+                SELECT COUNT(DISTINCT user_id) 
+                FROM stats_daily_active 
+                WHERE day >= date('now', '-' || ? || ' days')
+            """, (days - 1,))
+            return cursor.fetchone()[0]
+    
+    def _sum_rollup(self, totals: dict, table: str, column: str, start: str, end: str):
+        if start >= end:
+            return
+        with self._reader() as cursor:
+            cursor.execute(f"""
+                SELECT metric, SUM(value)
+                FROM {table}
+                WHERE {column} >= ? AND {column} < ?
+                GROUP BY metric
+            """, (start, end))
+            rows = cursor.fetchall()
+        for metric, value in rows:
+            totals[metric] = totals.get(metric, 0) + value
+
+    def get_range_stats(self, start: datetime, end: datetime):
+        """Статистика за период [start, end) в UTC по почасовым и суточным сводкам"""
+        # Края периода берём из почасовой сводки, полные сутки - из суточной,
+        # так что читается не больше 48 строк на метрику плюс по строке на день
+        start = start.replace(minute=0, second=0, microsecond=0)
+        if end.minute or end.second or end.microsecond:
+            end = end.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        first_day = start.replace(hour=0)
+        if first_day < start:
+            first_day += timedelta(days=1)
+        last_day = end.replace(hour=0)
+
+        hour_key = lambda value: value.strftime('%Y-%m-%d %H:00')
+        day_key = lambda value: value.strftime('%Y-%m-%d')
+
+        totals = {}
+        if first_day >= last_day:
+            self._sum_rollup(totals, 'stats_hourly', 'hour', hour_key(start), hour_key(end))
+        else:
+            self._sum_rollup(totals, 'stats_hourly', 'hour', hour_key(start), hour_key(first_day))
+            self._sum_rollup(totals, 'stats_daily', 'day', day_key(first_day), day_key(last_day))
+            self._sum_rollup(totals, 'stats_hourly', 'hour', hour_key(last_day), hour_key(end))
+
+        # Уникальных за произвольный период не хранится (это обход всех
+        # пар день-пользователь), поэтому отдаём среднее число активных в сутки
+        first_active, last_active = start.date(), (end - timedelta(seconds=1)).date()
+        with self._reader() as cursor:
+            cursor.execute("""
+                SELECT COALESCE(SUM(value), 0)
+                FROM stats_daily
+                WHERE metric = 'active_users' AND day >= ? AND day <= ?
+            """, (first_active.isoformat(), last_active.isoformat()))
+            active_user_days = cursor.fetchone()[0]
+
+        return {
+            'new_users': int(totals.get('new_users', 0)),
+            'active_users_per_day': active_user_days / ((last_active - first_active).days + 1),
+            'generations': int(totals.get('generations', 0)),
+            'generations_by_type': {
+                metric[5:]: int(value) for metric, value in totals.items() if metric.startswith('type:') and value
+            },
+            'generations_by_model': {
+                metric[6:]: int(value) for metric, value in totals.items() if metric.startswith('model:') and value
+            },
+            'payments': int(totals.get('payments', 0)),
+            'revenue': float(totals.get('payments_sum', 0.0)),
+            'referral_payouts': float(totals.get('referral_payouts', 0.0))
+        }
     
     def get_top_users_by_generations(self, limit=10):
         """Получает топ пользователей по количеству генераций"""
-        self.cursor.execute("""
-            SELECT u.user_id, u.username, u.first_name, COUNT(g.id) as gen_count
-            FROM users u
-            JOIN generations g ON u.user_id = g.user_id
-            GROUP BY u.user_id
-            ORDER BY gen_count DESC
-            LIMIT ?
-        """, (limit,))
-        return self.cursor.fetchall()
+        with self._reader() as cursor:
+            cursor.execute("""
+                SELECT u.user_id, u.username, u.first_name, COUNT(g.id) as gen_count
+                FROM users u
+                JOIN generations g ON u.user_id = g.user_id
+                GROUP BY u.user_id
+                ORDER BY gen_count DESC
+                LIMIT ?
+            """, (limit,))
+            return cursor.fetchall()
     
     def get_referral_stats_total(self):
         """Получает общую статистику по рефералам"""
-        self.cursor.execute("SELECT COUNT(*) FROM users WHERE referrer_id IS NOT NULL")
-        total_referrals = self.cursor.fetchone()[0]
-        
-        self.cursor.execute("SELECT COALESCE(SUM(amount), 0.0) FROM referral_earnings")
-        total_referral_earnings = self.cursor.fetchone()[0]
-        
         return {
-            'total_referrals': total_referrals,
-            'total_earnings': total_referral_earnings
+            'total_referrals': int(self._get_counter('referrals')),
+            'total_earnings': float(self._get_counter('referral_earnings'))
+        }
+
+    def get_stats_totals(self):
+        """Итоги за всё время для /stats из материализованных счётчиков"""
+        return {
+            'total_users': self.get_total_users_count(),
+            'total_generations': self.get_total_generations_count(),
+            'generations_by_type': self.get_generations_by_type(),
+            'total_payments': self.get_payments_count(),
+            'total_earnings': self.get_total_payments_sum(),
+            'referral_stats': self.get_referral_stats_total()
+        }
+
+    def get_stats_summary(self, days=7):
+        """Итоги за всё время и за последние N дней"""
+        return {
+            **self.get_stats_totals(),
+            'new_users': self.get_new_users_count(days=days),
+            'active_users': self.get_active_users_count(days=days),
+            'recent_earnings': self.get_recent_payments_sum(days=days)
         }
 
     def __del__(self):
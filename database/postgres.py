@@ -0,0 +1,1042 @@
+import asyncio
+import logging
+import re
+import threading
+from contextlib import contextmanager
+from config import DATABASE_URL, POSTGRES_POOL_SIZE, PENDING_ACTION_TTL
+from database.cache import user_cache
+from database.referral_codes import encode_referral_code
+from database.records import UserRecord, PaymentRecord, GenerationPurchaseRecord
+from database.repository import Repository
+
+logger = logging.getLogger(__name__)
+
+# Счета журнала операций (совпадают с колонками users)
+LEDGER_ACCOUNTS = ('balance', 'generations', 'referral_balance')
+
+# Текущее время в UTC без часового пояса, как CURRENT_TIMESTAMP в SQLite
+NOW_UTC = "(now() AT TIME ZONE 'utc')"
+
+# Запись журнала старше этого уже точно зафиксирована: отметка снимков не обгонит чужую транзакцию
+LEDGER_COMMIT_LAG = "5 minutes"
+
+
+def _columns_sql(record, timestamps=('created_at',)) -> str:
+    """Колонки записи для SELECT; даты отдаются строками в формате SQLite"""
+    return ", ".join(
+        f"to_char({field}, 'YYYY-MM-DD HH24:MI:SS') AS {field}" if field in timestamps else field
+        for field in record._fields
+    )
+
+
+USER_COLUMNS_SQL = _columns_sql(UserRecord)
+PAYMENT_COLUMNS_SQL = _columns_sql(PaymentRecord, ('created_at', 'paid_at'))
+GENERATION_PURCHASE_COLUMNS_SQL = _columns_sql(GenerationPurchaseRecord, ('created_at', 'completed_at'))
+
+SCHEMA_SQL = f"""
+    CREATE TABLE IF NOT EXISTS users (
+        user_id BIGINT PRIMARY KEY,
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        agreed_to_terms INTEGER DEFAULT 0,
+        balance DOUBLE PRECISION DEFAULT 0.0,
+        created_at TIMESTAMP DEFAULT {NOW_UTC},
+        referrer_id BIGINT,
+        referral_balance DOUBLE PRECISION DEFAULT 0.0,
+        referral_code TEXT UNIQUE,
+        generations INTEGER DEFAULT 0,
+        referrals_count INTEGER DEFAULT 0,
+        referral_earned DOUBLE PRECISION DEFAULT 0.0
+    );
+    CREATE INDEX IF NOT EXISTS idx_users_referrer ON users (referrer_id);
+    CREATE INDEX IF NOT EXISTS idx_users_created ON users (created_at);
+
+    CREATE TABLE IF NOT EXISTS pending_actions (
+        user_id BIGINT PRIMARY KEY,
+        action_type TEXT,
+        action_data TEXT,
+        created_at TIMESTAMP DEFAULT {NOW_UTC},
+        expires_at BIGINT
+    );
+    CREATE INDEX IF NOT EXISTS idx_pending_actions_expires ON pending_actions (expires_at);
+
+    CREATE TABLE IF NOT EXISTS generations (
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        type TEXT NOT NULL,
+        file_url TEXT NOT NULL,
+        prompt TEXT,
+        created_at TIMESTAMP DEFAULT {NOW_UTC},
+        model TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_generations_user_type ON generations (user_id, type, created_at);
+    CREATE INDEX IF NOT EXISTS idx_generations_created ON generations (created_at);
+
+    CREATE TABLE IF NOT EXISTS payments (
+        id BIGSERIAL PRIMARY KEY,
+        payment_id TEXT UNIQUE NOT NULL,
+        user_id BIGINT NOT NULL,
+        amount DOUBLE PRECISION NOT NULL,
+        status TEXT DEFAULT 'pending',
+        created_at TIMESTAMP DEFAULT {NOW_UTC},
+        paid_at TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_payments_status_created ON payments (status, created_at);
+
+    CREATE TABLE IF NOT EXISTS generation_purchases (
+        id BIGSERIAL PRIMARY KEY,
+        payment_id TEXT UNIQUE NOT NULL,
+        user_id BIGINT NOT NULL,
+        package_size INTEGER NOT NULL,
+        amount DOUBLE PRECISION NOT NULL,
+        status TEXT DEFAULT 'pending',
+        created_at TIMESTAMP DEFAULT {NOW_UTC},
+        completed_at TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_generation_purchases_status_created ON generation_purchases (status, created_at);
+    CREATE INDEX IF NOT EXISTS idx_generation_purchases_user ON generation_purchases (user_id, status);
+
+    CREATE TABLE IF NOT EXISTS referral_earnings (
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        from_user_id BIGINT NOT NULL,
+        amount DOUBLE PRECISION NOT NULL,
+        payment_amount DOUBLE PRECISION NOT NULL,
+        created_at TIMESTAMP DEFAULT {NOW_UTC}
+    );
+    CREATE INDEX IF NOT EXISTS idx_referral_earnings_user ON referral_earnings (user_id);
+
+    CREATE TABLE IF NOT EXISTS referral_closure (
+        ancestor BIGINT NOT NULL,
+        descendant BIGINT NOT NULL,
+        depth INTEGER NOT NULL,
+        PRIMARY KEY (ancestor, depth, descendant)
+    );
+    CREATE INDEX IF NOT EXISTS idx_referral_closure_descendant ON referral_closure (descendant, depth);
+
+    CREATE TABLE IF NOT EXISTS ledger (
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        account TEXT NOT NULL,
+        amount DOUBLE PRECISION NOT NULL,
+        reason TEXT NOT NULL,
+        ref_id TEXT,
+        created_at TIMESTAMP DEFAULT {NOW_UTC}
+    );
+    CREATE INDEX IF NOT EXISTS idx_ledger_user_account ON ledger (user_id, account, id);
+    CREATE INDEX IF NOT EXISTS idx_ledger_ref_id ON ledger (ref_id);
+
+    CREATE TABLE IF NOT EXISTS ledger_snapshots (
+        user_id BIGINT NOT NULL,
+        account TEXT NOT NULL,
+        ledger_id BIGINT NOT NULL,
+        value DOUBLE PRECISION NOT NULL,
+        created_at TIMESTAMP DEFAULT {NOW_UTC},
+        PRIMARY KEY (user_id, account)
+    );
+
+    -- Отметка, до которой журнал точно свёрнут в снимки
+    CREATE TABLE IF NOT EXISTS ledger_watermark (
+        id SMALLINT PRIMARY KEY CHECK (id = 1),
+        ledger_id BIGINT NOT NULL
+    );
+
+    -- Журнал только дописывается: исправления оформляются новыми записями
+    CREATE OR REPLACE FUNCTION ledger_append_only() RETURNS trigger AS $$
+    BEGIN
+        RAISE EXCEPTION 'ledger is append-only';
+    END
+    $$ LANGUAGE plpgsql;
+    DROP TRIGGER IF EXISTS ledger_append_only ON ledger;
+    CREATE TRIGGER ledger_append_only BEFORE UPDATE OR DELETE ON ledger
+        FOR EACH ROW EXECUTE FUNCTION ledger_append_only();
+
+    CREATE TABLE IF NOT EXISTS processed_events (
+        event_key TEXT PRIMARY KEY,
+        payment_id TEXT NOT NULL,
+        event TEXT NOT NULL,
+        result TEXT,
+        processed_at TIMESTAMP DEFAULT {NOW_UTC}
+    );
+
+    CREATE TABLE IF NOT EXISTS fulfillment_queue (
+        id BIGSERIAL PRIMARY KEY,
+        event_key TEXT UNIQUE NOT NULL,
+        event TEXT NOT NULL,
+        payment_id TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at DOUBLE PRECISION NOT NULL DEFAULT 0,
+        last_error TEXT,
+        created_at TIMESTAMP DEFAULT {NOW_UTC},
+        updated_at TIMESTAMP DEFAULT {NOW_UTC}
+    );
+    ALTER TABLE fulfillment_queue ADD COLUMN IF NOT EXISTS result TEXT;
+    CREATE INDEX IF NOT EXISTS idx_fulfillment_queue_due ON fulfillment_queue (status, next_attempt_at);
+"""
+
+
+class _Rollback(Exception):
+    """Откатывает транзакцию _transaction и возвращает value как результат"""
+
+    def __init__(self, value):
+        super().__init__()
+        self.value = value
+
+
+class _Record(tuple):
+    """Строка результата как asyncpg.Record: распаковка и индексы кортежа, row['колонка'] и dict(row)"""
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            key = self._index[key]
+        return tuple.__getitem__(self, key)
+
+    def keys(self):
+        return self._index.keys()
+
+
+def _record_row(cursor):
+    """Фабрика строк psycopg, создающая _Record"""
+    index = {column.name: position for position, column in enumerate(cursor.description or ())}
+
+    def make(values):
+        record = _Record(values)
+        record._index = index
+        return record
+    return make
+
+
+# Плейсхолдеры запросов - $1, $2, ... (один номер может повторяться)
+_PLACEHOLDER = re.compile(r'\$(\d+)')
+
+
+class _Connection:
+    """
+    Соединение psycopg с методами fetch, fetchrow, fetchval и execute
+
+    Запросы пишутся с $1, $2, ...: здесь они переводятся в %s psycopg,
+    а аргументы раскладываются в порядке упоминания.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def _query(self, query: str):
+        """Текст запроса для psycopg и номера аргументов в порядке подстановки"""
+        order = [int(number) - 1 for number in _PLACEHOLDER.findall(query)]
+        return _PLACEHOLDER.sub('%s', query.replace('%', '%%')), order
+
+    def _cursor(self, query: str, args):
+        query, order = self._query(query)
+        return self._conn.execute(query, [args[index] for index in order])
+
+    def fetch(self, query: str, *args):
+        return self._cursor(query, args).fetchall()
+
+    def fetchrow(self, query: str, *args):
+        return self._cursor(query, args).fetchone()
+
+    def fetchval(self, query: str, *args):
+        row = self.fetchrow(query, *args)
+        return row[0] if row else None
+
+    def execute(self, query: str, *args):
+        """Выполняет запрос и возвращает статус команды ('DELETE 3', 'INSERT 0 1')"""
+        return self._cursor(query, args).statusmessage
+
+    def executemany(self, query: str, rows):
+        query, order = self._query(query)
+        with self._conn.cursor() as cursor:
+            cursor.executemany(query, [[row[index] for index in order] for row in rows])
+
+    def transaction(self):
+        return self._conn.transaction()
+
+
+class _Pool:
+    """
+    Пул соединений psycopg
+
+    Методы хранилища синхронные, как у SQLite Database. Обработчики зовут
+    их через db_call, то есть из потока asyncio.to_thread, и запрос
+    выполняется прямо в этом потоке - без второго event loop и пересылки
+    корутины между потоками.
+    """
+
+    def __init__(self, dsn: str, pool_size: int):
+        try:
+            from psycopg_pool import ConnectionPool
+        except ImportError:
+            raise RuntimeError(
+                "Для DATABASE_BACKEND=postgres нужен пакет psycopg: pip install 'psycopg[binary,pool]'"
+            ) from None
+
+        self._warned_blocking = False
+        self.pool = ConnectionPool(
+            dsn, min_size=1, max_size=pool_size, open=True,
+            kwargs={'autocommit': True, 'row_factory': _record_row}
+        )
+        with self.pool.connection() as conn:
+            conn.execute(SCHEMA_SQL)
+        print(f"✅ PostgreSQL подключён, пул до {pool_size} соединений")
+
+    @contextmanager
+    def connection(self):
+        if not self._warned_blocking:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+            else:
+                # Вызов прямо из корутины бота ждёт сеть, остановив event loop
+                self._warned_blocking = True
+                logger.warning("⚠️ Запрос к PostgreSQL из event loop блокирует бота - вызывайте через db_call", stack_info=True)
+        with self.pool.connection() as conn:
+            yield _Connection(conn)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(dsn: str, pool_size: int) -> _Pool:
+    """Один пул (и одна проверка схемы) на DSN за время жизни процесса"""
+    with _pools_lock:
+        pool = _pools.get(dsn)
+        if pool is None:
+            pool = _pools[dsn] = _Pool(dsn, pool_size)
+        return pool
+
+
+def _rowcount(status: str) -> int:
+    """Число строк из статуса команды ('DELETE 3', 'INSERT 0 1')"""
+    return int(status.split()[-1])
+
+
+class PostgresDatabase(Repository):
+    """
+    Хранилище в PostgreSQL (psycopg)
+
+    Повторяет поведение SQLite Database, но без триггеров: счётчики и
+    таблица замыкания рефералов обновляются явно в тех же транзакциях,
+    а статистика считается по исходным таблицам.
+    """
+
+    def __init__(self, dsn: str = DATABASE_URL, pool_size: int = POSTGRES_POOL_SIZE):
+        self.dsn = dsn
+        self._pool = _get_pool(dsn, pool_size)
+
+    # --- Выполнение запросов ---
+
+    def _run(self, fn):
+        """Выполняет fn(conn) на соединении из пула и возвращает результат"""
+        with self._pool.connection() as conn:
+            return fn(conn)
+
+    def _transaction(self, fn):
+        """Выполняет fn(conn) в транзакции; _Rollback откатывает её и возвращает своё значение"""
+        def call(conn):
+            try:
+                with conn.transaction():
+                    return fn(conn)
+            except _Rollback as rollback:
+                return rollback.value
+        return self._run(call)
+
+    def _fetch(self, query: str, *args):
+        return self._run(lambda conn: conn.fetch(query, *args))
+
+    def _fetchrow(self, query: str, *args):
+        return self._run(lambda conn: conn.fetchrow(query, *args))
+
+    def _fetchval(self, query: str, *args):
+        return self._run(lambda conn: conn.fetchval(query, *args))
+
+    def _execute(self, query: str, *args):
+        return self._run(lambda conn: conn.execute(query, *args))
+
+    # --- Пользователи ---
+
+    def _purchased_key(self, user_id: int):
+        return ('purchased', self.dsn, user_id)
+
+    def invalidate_user(self, user_id: int):
+        """
+        Профили из PostgreSQL не кэшируются
+
+        С одной БД работают несколько процессов, и кэш одного из них не видел
+        бы записей других (баланс, пополненный на соседнем хосте). Поэтому
+        get_user всегда читает из БД, а сбрасывать нечего.
+        """
+
+    def get_user(self, user_id: int):
+        """Получает информацию о пользователе"""
+        row = self._fetchrow(f'SELECT {USER_COLUMNS_SQL} FROM users WHERE user_id = $1', user_id)
+        return UserRecord.from_row(tuple(row) if row else None)
+
+    def add_user(self, user_id: int, username: str = None, first_name: str = None, last_name: str = None):
+        """Добавляет нового пользователя в базу данных"""
+        self._execute('''
+            INSERT INTO users (user_id, username, first_name, last_name, balance, generations)
+            VALUES ($1, $2, $3, $4, 0.0, 0)
+            ON CONFLICT (user_id) DO NOTHING
+        ''', user_id, username, first_name, last_name)
+
+    def onboard_user(self, user_id: int, username: str = None, first_name: str = None,
+                     last_name: str = None, referral_code: str = None, referrer_id: int = None):
+        """Регистрирует пользователя из /start одной транзакцией (см. Database.onboard_user)"""
+        def work(conn):
+            inviter_id = referrer_id if referrer_id != user_id else None
+            if referral_code:
+                owner_id = conn.fetchval('SELECT user_id FROM users WHERE referral_code = $1', referral_code)
+                if owner_id and owner_id != user_id:
+                    inviter_id = owner_id
+
+            created = conn.fetchval('''
+                INSERT INTO users (user_id, username, first_name, last_name, balance, generations, referrer_id, referral_code)
+                VALUES ($1, $2, $3, $4, 0.0, 0, $5, $6)
+                ON CONFLICT (user_id) DO NOTHING
+                RETURNING true
+            ''', user_id, username, first_name, last_name, inviter_id, encode_referral_code(user_id))
+            if not created:
+                return {'created': False, 'referrer_id': None}
+            if inviter_id:
+                self._move_referral_subtree(conn, user_id, None, inviter_id)
+            return {'created': True, 'referrer_id': inviter_id}
+
+        return self._transaction(work)
+
+    def update_user_agreement(self, user_id: int):
+        """Обновляет статус согласия пользователя с условиями"""
+        self._execute('UPDATE users SET agreed_to_terms = 1 WHERE user_id = $1', user_id)
+
+    # --- Баланс и генерации ---
+
+    def _post_ledger_entry(self, conn, user_id: int, account: str, amount: float, reason: str,
+                                 ref_id: str = None):
+        """Записывает операцию в журнал и применяет её к остатку в users (внутри транзакции вызывающего)"""
+        if account not in LEDGER_ACCOUNTS:
+            raise ValueError(f"Неизвестный счёт: {account}")
+        conn.execute('''
+            INSERT INTO ledger (user_id, account, amount, reason, ref_id)
+            VALUES ($1, $2, $3, $4, $5)
+        ''', user_id, account, amount, reason, ref_id)
+        conn.execute(f'UPDATE users SET {account} = {account} + $1 WHERE user_id = $2', amount, user_id)
+
+    def add_to_balance(self, user_id: int, amount: float, reason: str = "top_up", ref_id: str = None):
+        """Добавляет средства к балансу пользователя"""
+        user = self.get_user(user_id)
+        if user:
+            print(f"💰 Пополнение баланса: User {user_id}, Old: {user['balance']}, Add: {amount}")
+            self._transaction(lambda conn: self._post_ledger_entry(conn, user_id, 'balance', amount, reason, ref_id))
+            print(f"✅ Баланс после обновления: {self.get_user(user_id)['balance']}")
+
+    def subtract_from_balance(self, user_id: int, amount: float, reason: str = "generation", ref_id: str = None):
+        """Списывает средства с баланса пользователя"""
+        print(f"📝 Списание с баланса: User {user_id}, Amount: {amount}, Reason: {reason}")
+        self._transaction(lambda conn: self._post_ledger_entry(conn, user_id, 'balance', -amount, reason, ref_id))
+
+    def update_user_balance(self, user_id: int, new_balance: float, reason: str = "adjustment"):
+        """Обновляет баланс пользователя (разница записывается в журнал как корректировка)"""
+        print(f"📝 Обновление баланса в БД: User {user_id}, New Balance: {new_balance}")
+
+        def work(conn):
+            balance = conn.fetchval('SELECT balance FROM users WHERE user_id = $1 FOR UPDATE', user_id)
+            if balance is not None and new_balance != balance:
+                self._post_ledger_entry(conn, user_id, 'balance', new_balance - balance, reason)
+
+        self._transaction(work)
+
+    def add_generations(self, user_id: int, amount: int, reason: str = "purchase", ref_id: str = None):
+        """Добавляет генерации пользователю"""
+        user = self.get_user(user_id)
+        if user:
+            print(f"⚡ Пополнение генераций: User {user_id}, Old: {user['generations']}, Add: {amount}")
+            self._transaction(lambda conn: self._post_ledger_entry(conn, user_id, 'generations', amount, reason, ref_id))
+
+    def subtract_generations(self, user_id: int, amount: int = 1, reason: str = "generation", ref_id: str = None):
+        """Списывает генерации у пользователя (не ниже нуля)"""
+        # Для админа не списываем генерации
+        if user_id == 6397535545:
+            print(f"⚡ Списание генераций пропущено для админа: User {user_id}")
+            return True
+
+        def work(conn):
+            current = conn.fetchval('SELECT generations FROM users WHERE user_id = $1 FOR UPDATE', user_id)
+            if current is None:
+                return False
+            new_generations = max(0, current - amount)
+            print(f"⚡ Списание генераций: User {user_id}, Old: {current}, Subtract: {amount}, New: {new_generations}")
+            if new_generations != current:
+                self._post_ledger_entry(conn, user_id, 'generations', new_generations - current, reason, ref_id)
+            return True
+
+        found = self._transaction(work)
+        return found
+
+    def get_user_generations(self, user_id: int):
+        """Получает количество генераций пользователя"""
+        # Для админа всегда 1000 генераций
+        if user_id == 6397535545:
+            return 1000
+        user = self.get_user(user_id)
+        return user.get('generations', 0) if user else 0
+
+    def has_purchased_generations(self, user_id: int) -> bool:
+        """Проверяет, покупал ли пользователь генерации"""
+        # Факт покупки не отменяется, поэтому кэшируем только положительный ответ
+        if user_cache.get(self._purchased_key(user_id)) is True:
+            return True
+        purchased = self._fetchval('''
+            SELECT EXISTS (SELECT 1 FROM generation_purchases WHERE user_id = $1 AND status = 'succeeded')
+        ''', user_id)
+        if purchased:
+            user_cache.set(self._purchased_key(user_id), True)
+        return purchased
+
+    # --- Результаты генераций ---
+
+    def save_generation(self, user_id: int, generation_type: str, file_url: str, prompt: str = "", model: str = None):
+        """Сохраняет генерацию в базу данных"""
+        self._execute('''
+            INSERT INTO generations (user_id, type, file_url, prompt, model)
+            VALUES ($1, $2, $3, $4, $5)
+        ''', user_id, generation_type, file_url, prompt, model)
+
+    def get_user_files(self, user_id: int, generation_type: str):
+        """Получает все файлы пользователя заданного типа, новые первыми"""
+        rows = self._fetch('''
+            SELECT file_url, prompt, to_char(created_at, 'YYYY-MM-DD HH24:MI:SS') FROM generations
+            WHERE user_id = $1 AND type = $2
+            ORDER BY created_at DESC
+        ''', user_id, generation_type)
+        return [tuple(row) for row in rows]
+
+    # --- Платежи и покупки генераций ---
+
+    def save_payment(self, payment_id: str, user_id: int, amount: float):
+        """Сохраняет платёж в БД"""
+        self._execute('''
+            INSERT INTO payments (payment_id, user_id, amount, status)
+            VALUES ($1, $2, $3, 'pending')
+        ''', payment_id, user_id, amount)
+        print(f"💾 Платёж сохранён: payment_id={payment_id}, user_id={user_id}, amount={amount}")
+
+    def get_payment(self, payment_id: str):
+        """Получает платёж по ID"""
+        row = self._fetchrow(f'SELECT {PAYMENT_COLUMNS_SQL} FROM payments WHERE payment_id = $1', payment_id)
+        return PaymentRecord.from_row(tuple(row) if row else None)
+
+    def update_payment_status(self, payment_id: str, status: str):
+        """Обновляет статус платежа"""
+        self._execute(f'UPDATE payments SET status = $1, paid_at = {NOW_UTC} WHERE payment_id = $2', status, payment_id)
+        print(f"✅ Статус платежа обновлён: payment_id={payment_id}, status={status}")
+
+    def save_generation_purchase(self, payment_id: str, user_id: int, package_size: int, amount: float):
+        """Сохраняет покупку генераций в БД"""
+        self._execute('''
+            INSERT INTO generation_purchases (payment_id, user_id, package_size, amount, status)
+            VALUES ($1, $2, $3, $4, 'pending')
+        ''', payment_id, user_id, package_size, amount)
+        print(f"💾 Покупка генераций сохранена: payment_id={payment_id}, user_id={user_id}, package={package_size}, amount={amount}")
+
+    def get_generation_purchase(self, payment_id: str):
+        """Получает покупку генераций по payment_id"""
+        row = self._fetchrow(
+            f'SELECT {GENERATION_PURCHASE_COLUMNS_SQL} FROM generation_purchases WHERE payment_id = $1', payment_id
+        )
+        return GenerationPurchaseRecord.from_row(tuple(row) if row else None)
+
+    def update_generation_purchase_status(self, payment_id: str, status: str):
+        """Обновляет статус покупки генераций"""
+        self._execute(
+            f'UPDATE generation_purchases SET status = $1, completed_at = {NOW_UTC} WHERE payment_id = $2',
+            status, payment_id
+        )
+        print(f"✅ Статус покупки генераций обновлён: payment_id={payment_id}, status={status}")
+
+    def get_pending_payment_ids(self, min_age_seconds: int, max_age_seconds: int, limit: int = 100):
+        """Возвращает id платежей и покупок генераций, застрявших в статусе pending"""
+        rows = self._fetch(f'''
+            SELECT payment_id FROM (
+                SELECT payment_id, created_at FROM payments
+                WHERE status = 'pending'
+                  AND created_at BETWEEN {NOW_UTC} - $1::int * interval '1 second'
+                                     AND {NOW_UTC} - $2::int * interval '1 second'
+                UNION ALL
+                SELECT payment_id, created_at FROM generation_purchases
+                WHERE status = 'pending'
+                  AND created_at BETWEEN {NOW_UTC} - $1::int * interval '1 second'
+                                     AND {NOW_UTC} - $2::int * interval '1 second'
+            ) AS pending
+            ORDER BY created_at
+            LIMIT $3
+        ''', max_age_seconds, min_age_seconds, limit)
+        return [row[0] for row in rows]
+
+    def cancel_pending_payment(self, payment_id: str):
+        """Помечает отменённым платёж или покупку, если они всё ещё pending"""
+        def work(conn):
+            conn.execute(
+                "UPDATE payments SET status = 'canceled' WHERE payment_id = $1 AND status = 'pending'", payment_id
+            )
+            conn.execute(
+                "UPDATE generation_purchases SET status = 'canceled' WHERE payment_id = $1 AND status = 'pending'",
+                payment_id
+            )
+        self._transaction(work)
+
+    def fulfill_payment_event(self, event: str, payment_id: str, referral_rates=()):
+        """Зачисляет успешный платёж ровно один раз (см. Database.fulfill_payment_event)"""
+        event_key = f"{event}:{payment_id}"
+
+        def work(conn):
+            result = {'status': 'processed', 'payment_id': payment_id}
+            inserted = conn.fetchval('''
+                INSERT INTO processed_events (event_key, payment_id, event) VALUES ($1, $2, $3)
+                ON CONFLICT (event_key) DO NOTHING
+                RETURNING true
+            ''', event_key, payment_id, event)
+            if not inserted:
+                return {'status': 'duplicate', 'payment_id': payment_id}
+
+            # Покупка пакета генераций
+            row = conn.fetchrow(f'''
+                UPDATE generation_purchases SET status = 'succeeded', completed_at = {NOW_UTC}
+                WHERE payment_id = $1 AND status != 'succeeded'
+                RETURNING user_id, package_size
+            ''', payment_id)
+            if row:
+                user_id, package_size = row
+                self._post_ledger_entry(conn, user_id, 'generations', package_size, "purchase", payment_id)
+                result.update(kind='generations', user_id=user_id, generations_count=package_size)
+            else:
+                # Пополнение баланса
+                row = conn.fetchrow(f'''
+                    UPDATE payments SET status = 'succeeded', paid_at = {NOW_UTC}
+                    WHERE payment_id = $1 AND status != 'succeeded'
+                    RETURNING user_id, amount
+                ''', payment_id)
+                if row:
+                    user_id, amount = row
+                    self._post_ledger_entry(conn, user_id, 'balance', amount, "top_up", payment_id)
+                    result.update(kind='balance', user_id=user_id, amount=amount)
+
+                    referral_bonuses = []
+                    upline = conn.fetch('''
+                        SELECT ancestor, depth FROM referral_closure
+                        WHERE descendant = $1 AND depth <= $2
+                        ORDER BY depth
+                    ''', user_id, len(referral_rates)) if referral_rates else []
+                    for referrer_id, depth in upline:
+                        referral_bonus = amount * referral_rates[depth - 1]
+                        if referral_bonus <= 0:
+                            continue
+                        self._post_ledger_entry(conn, referrer_id, 'balance', referral_bonus, "referral_bonus", payment_id)
+                        self._record_referral_earning(conn, referrer_id, user_id, referral_bonus, amount, payment_id)
+                        referral_bonuses.append({'referrer_id': referrer_id, 'depth': depth, 'bonus': referral_bonus})
+                        if depth == 1:
+                            result.update(referrer_id=referrer_id, referral_bonus=referral_bonus)
+                    result['referral_bonuses'] = referral_bonuses
+                else:
+                    known = conn.fetchval('''
+                        SELECT EXISTS (SELECT 1 FROM generation_purchases WHERE payment_id = $1)
+                            OR EXISTS (SELECT 1 FROM payments WHERE payment_id = $1)
+                    ''', payment_id)
+                    if not known:
+                        # Платёж ещё не записан - событие не помечаем, чтобы YooKassa повторила доставку
+                        raise _Rollback({'status': 'not_found', 'payment_id': payment_id})
+                    result['status'] = 'already_processed'
+
+            conn.execute('UPDATE processed_events SET result = $1 WHERE event_key = $2', result['status'], event_key)
+            return result
+
+        result = self._transaction(work)
+
+        if result['status'] in ('processed', 'already_processed'):
+            print(f"✅ Событие {event_key} обработано: {result}")
+        return result
+
+    # --- Очередь зачислений ---
+
+    def enqueue_payment_event(self, event: str, payment_id: str) -> bool:
+        """Ставит событие оплаты в очередь; False, если оно уже там (failed-задача возвращается в работу)"""
+        inserted = self._fetchval(f'''
+            INSERT INTO fulfillment_queue (event_key, event, payment_id) VALUES ($1, $2, $3)
+            ON CONFLICT (event_key) DO UPDATE SET
+                status = 'pending',
+                attempts = 0,
+                next_attempt_at = 0,
+                last_error = NULL,
+                updated_at = {NOW_UTC}
+            WHERE fulfillment_queue.status = 'failed'
+            RETURNING true
+        ''', f"{event}:{payment_id}", event, payment_id)
+        return bool(inserted)
+
+    def get_due_fulfillment_jobs(self, now: float, limit: int = 20):
+        """Возвращает задачи очереди, время которых подошло"""
+        rows = self._fetch('''
+            SELECT id, event, payment_id, attempts, status, result FROM fulfillment_queue
+            WHERE status IN ('pending', 'notify') AND next_attempt_at <= $1
+            ORDER BY next_attempt_at
+            LIMIT $2
+        ''', now, limit)
+        return [dict(row) for row in rows]
+
+    def get_next_fulfillment_time(self):
+        """Время ближайшей отложенной задачи очереди или None"""
+        return self._fetchval("SELECT MIN(next_attempt_at) FROM fulfillment_queue WHERE status IN ('pending', 'notify')")
+
+    def save_fulfillment_result(self, job_id: int, result: str):
+        """Запоминает результат зачисления до отправки уведомлений (статус notify)"""
+        self._execute(
+            f"UPDATE fulfillment_queue SET status = 'notify', result = $1, updated_at = {NOW_UTC} WHERE id = $2",
+            result, job_id
+        )
+
+    def complete_fulfillment_job(self, job_id: int):
+        """Помечает задачу очереди выполненной"""
+        self._execute(f"UPDATE fulfillment_queue SET status = 'done', updated_at = {NOW_UTC} WHERE id = $1", job_id)
+
+    def retry_fulfillment_job(self, job_id: int, error: str, next_attempt_at: float = None):
+        """Откладывает задачу очереди до next_attempt_at (статус notify сохраняется) или помечает её failed, если он не задан"""
+        self._execute(f'''
+            UPDATE fulfillment_queue
+            SET attempts = attempts + 1,
+                last_error = $1,
+                status = CASE WHEN $2::double precision IS NULL THEN 'failed' WHEN status = 'notify' THEN 'notify' ELSE 'pending' END,
+                next_attempt_at = COALESCE($2::double precision, next_attempt_at),
+                updated_at = {NOW_UTC}
+            WHERE id = $3
+        ''', error, next_attempt_at, job_id)
+
+    # --- Рефералы ---
+
+    def generate_referral_code(self, user_id: int):
+        """Выдаёт пользователю реферальный код, если его ещё нет, и возвращает действующий код"""
+        self._execute(
+            'UPDATE users SET referral_code = $1 WHERE user_id = $2 AND referral_code IS NULL',
+            encode_referral_code(user_id), user_id
+        )
+        return self.get_referral_code(user_id)
+
+    def get_referral_code(self, user_id: int):
+        """Получает реферальный код пользователя"""
+        return self._fetchval('SELECT referral_code FROM users WHERE user_id = $1', user_id) or None
+
+    def get_user_by_referral_code(self, referral_code: str):
+        """Получает пользователя по реферальному коду"""
+        return self._fetchval('SELECT user_id FROM users WHERE referral_code = $1', referral_code)
+
+    def _move_referral_subtree(self, conn, user_id: int, old_referrer_id, new_referrer_id):
+        """
+        Переносит пользователя с его поддеревом к новому рефереру
+
+        Обновляет счётчики приглашённых и таблицу замыкания - то же, что в
+        SQLite делают триггеры referral_counters_* и referral_closure_*.
+        """
+        if old_referrer_id:
+            conn.execute(
+                'UPDATE users SET referrals_count = referrals_count - 1 WHERE user_id = $1', old_referrer_id
+            )
+        if new_referrer_id:
+            conn.execute(
+                'UPDATE users SET referrals_count = referrals_count + 1 WHERE user_id = $1', new_referrer_id
+            )
+        conn.execute('''
+            DELETE FROM referral_closure
+            WHERE ancestor IN (SELECT ancestor FROM referral_closure WHERE descendant = $1)
+              AND (descendant = $1 OR descendant IN (SELECT descendant FROM referral_closure WHERE ancestor = $1))
+        ''', user_id)
+        if new_referrer_id:
+            conn.execute('''
+                INSERT INTO referral_closure (ancestor, descendant, depth)
+                SELECT up.ancestor, down.descendant, up.depth + down.depth + 1
+                FROM (SELECT $2::bigint AS ancestor, 0 AS depth
+                      UNION ALL
+                      SELECT ancestor, depth FROM referral_closure WHERE descendant = $2) AS up,
+                     (SELECT $1::bigint AS descendant, 0 AS depth
+                      UNION ALL
+                      SELECT descendant, depth FROM referral_closure WHERE ancestor = $1) AS down
+                ON CONFLICT DO NOTHING
+            ''', user_id, new_referrer_id)
+
+    def set_referrer(self, user_id: int, referrer_id: int):
+        """Устанавливает реферера для пользователя"""
+        def work(conn):
+            # Блокировка строки упорядочивает параллельные переносы одного пользователя
+            old_referrer_id = conn.fetchval(
+                'SELECT referrer_id FROM users WHERE user_id = $1 FOR UPDATE', user_id
+            )
+            if referrer_id == user_id or conn.fetchval('''
+                SELECT EXISTS (SELECT 1 FROM referral_closure WHERE ancestor = $1 AND descendant = $2)
+            ''', user_id, referrer_id):
+                raise ValueError("referral cycle")
+            conn.execute('UPDATE users SET referrer_id = $1 WHERE user_id = $2', referrer_id, user_id)
+            if old_referrer_id != referrer_id:
+                self._move_referral_subtree(conn, user_id, old_referrer_id, referrer_id)
+            return old_referrer_id
+
+        self._transaction(work)
+
+    def _record_referral_earning(self, conn, user_id: int, from_user_id: int, amount: float,
+                                       payment_amount: float, ref_id: str = None):
+        """Записывает реферальное начисление и увеличивает счётчик заработка реферера"""
+        conn.execute('''
+            INSERT INTO referral_earnings (user_id, from_user_id, amount, payment_amount)
+            VALUES ($1, $2, $3, $4)
+        ''', user_id, from_user_id, amount, payment_amount)
+        conn.execute('UPDATE users SET referral_earned = referral_earned + $1 WHERE user_id = $2', amount, user_id)
+        self._post_ledger_entry(conn, user_id, 'referral_balance', amount, "referral_bonus", ref_id)
+
+    def add_referral_earning(self, user_id: int, from_user_id: int, amount: float, payment_amount: float,
+                             ref_id: str = None):
+        """Добавляет реферальное начисление"""
+        self._transaction(
+            lambda conn: self._record_referral_earning(conn, user_id, from_user_id, amount, payment_amount, ref_id)
+        )
+
+    def get_referral_stats(self, user_id: int):
+        """Получает статистику по рефералам из счётчиков в профиле пользователя"""
+        user = self.get_user(user_id)
+        return {
+            'referrals_count': user['referrals_count'] if user else 0,
+            'total_earned': user['referral_earned'] if user else 0.0
+        }
+
+    def get_referral_counts_by_depth(self, user_id: int, max_depth: int = 3):
+        """Количество рефералов по уровням: {1: приглашённые напрямую, 2: приглашённые ими, ...}"""
+        rows = self._fetch('''
+            SELECT depth, COUNT(*) FROM referral_closure
+            WHERE ancestor = $1 AND depth <= $2
+            GROUP BY depth
+        ''', user_id, max_depth)
+        return {depth: count for depth, count in rows}
+
+    def check_referral_counters(self, fix: bool = True):
+        """Сверяет счётчики рефералов с users и referral_earnings, возвращает число расхождений"""
+        mismatches = self._fetch('''
+            SELECT user_id, actual_count, actual_earned FROM (
+                SELECT u.user_id, u.referrals_count, u.referral_earned,
+                       (SELECT COUNT(*) FROM users r WHERE r.referrer_id = u.user_id) AS actual_count,
+                       (SELECT COALESCE(SUM(e.amount), 0.0) FROM referral_earnings e WHERE e.user_id = u.user_id) AS actual_earned
+                FROM users u
+            ) AS counters
+            WHERE referrals_count IS DISTINCT FROM actual_count
+               OR abs(COALESCE(referral_earned, 0) - actual_earned) > 0.005
+        ''')
+        if mismatches and fix:
+            self._run(lambda conn: conn.executemany(
+                'UPDATE users SET referrals_count = $2, referral_earned = $3 WHERE user_id = $1',
+                [tuple(row) for row in mismatches]
+            ))
+        if mismatches:
+            print(f"⚠️ Счётчики рефералов расходились у {len(mismatches)} пользователей" + (" - исправлено" if fix else ""))
+        return len(mismatches)
+
+    # --- Незавершённые действия ---
+
+    def save_pending_action(self, user_id: int, action_type: str, action_data: str, ttl: int = PENDING_ACTION_TTL):
+        """Сохраняет незавершённое действие пользователя на ttl секунд"""
+        self._execute(f'''
+            INSERT INTO pending_actions (user_id, action_type, action_data, expires_at)
+            VALUES ($1, $2, $3, extract(epoch FROM now())::bigint + $4)
+            ON CONFLICT (user_id) DO UPDATE SET
+                action_type = excluded.action_type,
+                action_data = excluded.action_data,
+                created_at = {NOW_UTC},
+                expires_at = excluded.expires_at
+        ''', user_id, action_type, action_data, ttl)
+
+    def get_pending_action(self, user_id: int):
+        """Получает незавершённое действие пользователя (просроченные не возвращаются)"""
+        row = self._fetchrow('''
+            SELECT action_type, action_data FROM pending_actions
+            WHERE user_id = $1 AND (expires_at IS NULL OR expires_at > extract(epoch FROM now())::bigint)
+        ''', user_id)
+        if row:
+            pending = {'action_type': row[0], 'action_data': row[1]}
+            print(f"📥 Получен pending action для user {user_id}: {pending['action_type']}")
+            return pending
+        print(f"⚠️ Pending action не найден для user {user_id}")
+        return None
+
+    def clear_pending_action(self, user_id: int):
+        """Удаляет незавершённое действие после выполнения"""
+        self._execute('DELETE FROM pending_actions WHERE user_id = $1', user_id)
+
+    def sweep_expired_pending_actions(self, batch_size: int = 500):
+        """Удаляет просроченные незавершённые действия пачками, возвращает их количество"""
+        total = 0
+        while True:
+            deleted = _rowcount(self._execute('''
+                DELETE FROM pending_actions WHERE user_id IN (
+                    SELECT user_id FROM pending_actions
+                    WHERE expires_at <= extract(epoch FROM now())::bigint
+                    LIMIT $1
+                )
+            ''', batch_size))
+            total += deleted
+            if deleted < batch_size:
+                break
+        if total:
+            print(f"🧹 Удалено просроченных незавершённых действий: {total}")
+        return total
+
+    # --- Статистика и обслуживание ---
+
+    def get_stats_totals(self):
+        """Итоги за всё время для /stats по исходным таблицам"""
+        def work(conn):
+            totals = conn.fetchrow('''
+                SELECT
+                    (SELECT COUNT(*) FROM users) AS total_users,
+                    (SELECT COUNT(*) FROM generations) AS total_generations,
+                    (SELECT COUNT(*) FROM payments WHERE status = 'succeeded') AS total_payments,
+                    (SELECT COALESCE(SUM(amount), 0.0) FROM payments WHERE status = 'succeeded') AS total_earnings,
+                    (SELECT COUNT(*) FROM users WHERE referrer_id IS NOT NULL) AS total_referrals,
+                    (SELECT COALESCE(SUM(amount), 0.0) FROM referral_earnings) AS referral_earnings
+            ''')
+            by_type = conn.fetch('SELECT type, COUNT(*) FROM generations GROUP BY type')
+            return totals, by_type
+
+        totals, by_type = self._run(work)
+        return {
+            'total_users': totals['total_users'],
+            'total_generations': totals['total_generations'],
+            'generations_by_type': {gen_type: count for gen_type, count in by_type},
+            'total_payments': totals['total_payments'],
+            'total_earnings': float(totals['total_earnings']),
+            'referral_stats': {
+                'total_referrals': totals['total_referrals'],
+                'total_earnings': float(totals['referral_earnings'])
+            }
+        }
+
+    def get_stats_summary(self, days=7):
+        """Итоги за всё время и за последние N дней"""
+        recent = self._fetchrow(f'''
+            WITH period AS (SELECT date_trunc('day', {NOW_UTC}) - ($1::int - 1) * interval '1 day' AS since)
+            SELECT
+                (SELECT COUNT(*) FROM users, period WHERE created_at >= since) AS new_users,
+                (SELECT COUNT(DISTINCT user_id) FROM generations, period WHERE created_at >= since) AS active_users,
+                (SELECT COALESCE(SUM(amount), 0.0) FROM payments, period
+                 WHERE status = 'succeeded' AND paid_at >= since) AS recent_earnings
+        ''', days)
+        return {
+            **self.get_stats_totals(),
+            'new_users': recent['new_users'],
+            'active_users': recent['active_users'],
+            'recent_earnings': float(recent['recent_earnings'])
+        }
+
+    def get_range_stats(self, start, end):
+        """Статистика за период [start, end) в UTC (границы - по часам, как в SQLite Database)"""
+        def work(conn):
+            totals = conn.fetchrow('''
+                WITH period AS (
+                    SELECT date_trunc('hour', $1::timestamp) AS since,
+                           date_trunc('hour', $2::timestamp + interval '1 hour' - interval '1 microsecond') AS until
+                )
+                SELECT
+                    (SELECT COUNT(*) FROM users, period WHERE created_at >= since AND created_at < until) AS new_users,
+                    -- Пары день-пользователь: из них среднее число активных в сутки, как в SQLite Database
+                    (SELECT COUNT(*) FROM (
+                        SELECT DISTINCT created_at::date, user_id FROM generations, period
+                        WHERE created_at >= date_trunc('day', since)
+                          AND created_at < date_trunc('day', until - interval '1 second') + interval '1 day'
+                     ) AS daily) AS active_user_days,
+                    (SELECT (until - interval '1 second')::date - since::date + 1 FROM period) AS days,
+                    (SELECT COUNT(*) FROM generations, period WHERE created_at >= since AND created_at < until) AS generations,
+                    (SELECT COUNT(*) FROM payments, period
+                     WHERE status = 'succeeded' AND paid_at >= since AND paid_at < until) AS payments,
+                    (SELECT COALESCE(SUM(amount), 0.0) FROM payments, period
+                     WHERE status = 'succeeded' AND paid_at >= since AND paid_at < until) AS revenue,
+                    (SELECT COALESCE(SUM(amount), 0.0) FROM referral_earnings, period
+                     WHERE created_at >= since AND created_at < until) AS referral_payouts
+            ''', start, end)
+            breakdown = conn.fetch('''
+                SELECT 'type' AS kind, type AS name, COUNT(*) FROM generations
+                WHERE created_at >= date_trunc('hour', $1::timestamp)
+                  AND created_at < date_trunc('hour', $2::timestamp + interval '1 hour' - interval '1 microsecond')
+                GROUP BY type
+                UNION ALL
+                SELECT 'model', model, COUNT(*) FROM generations
+                WHERE model IS NOT NULL
+                  AND created_at >= date_trunc('hour', $1::timestamp)
+                  AND created_at < date_trunc('hour', $2::timestamp + interval '1 hour' - interval '1 microsecond')
+                GROUP BY model
+            ''', start, end)
+            return totals, breakdown
+
+        totals, breakdown = self._run(work)
+        return {
+            'new_users': totals['new_users'],
+            'active_users_per_day': totals['active_user_days'] / totals['days'],
+            'generations': totals['generations'],
+            'generations_by_type': {name: count for kind, name, count in breakdown if kind == 'type'},
+            'generations_by_model': {name: count for kind, name, count in breakdown if kind == 'model'},
+            'payments': totals['payments'],
+            'revenue': float(totals['revenue']),
+            'referral_payouts': float(totals['referral_payouts'])
+        }
+
+    def get_top_users_by_generations(self, limit=10):
+        """Получает топ пользователей по количеству генераций"""
+        rows = self._fetch('''
+            SELECT u.user_id, u.username, u.first_name, COUNT(g.id) AS gen_count
+            FROM users u
+            JOIN generations g ON u.user_id = g.user_id
+            GROUP BY u.user_id
+            ORDER BY gen_count DESC
+            LIMIT $1
+        ''', limit)
+        return [tuple(row) for row in rows]
+
+    def snapshot_ledger(self):
+        """
+        Сворачивает новые записи журнала в снимки остатков, возвращает число обновлённых снимков
+
+        Читаются только записи после ledger_watermark. В PostgreSQL id из
+        BIGSERIAL могут фиксироваться не по порядку, поэтому отметка
+        сдвигается лишь до записей старше LEDGER_COMMIT_LAG, а свежий хвост
+        перечитывается со сверкой по ledger_id снимка. Записи одного
+        пользователя не обгоняют друг друга: их транзакции ждут блокировку
+        строки users.
+        """
+        def work(conn):
+            watermark = conn.fetchval('''
+                SELECT COALESCE(
+                    (SELECT ledger_id FROM ledger_watermark),
+                    (SELECT MAX(ledger_id) FROM ledger_snapshots),
+                    0
+                )
+            ''')
+            updated = _rowcount(conn.execute(f'''
+                INSERT INTO ledger_snapshots (user_id, account, ledger_id, value, created_at)
+                SELECT tail.user_id, tail.account, tail.last_id, COALESCE(s.value, 0.0) + tail.delta, {NOW_UTC}
+                FROM (
+                    SELECT l.user_id, l.account, MAX(l.id) AS last_id, SUM(l.amount) AS delta
+                    FROM ledger l
+                    LEFT JOIN ledger_snapshots s ON s.user_id = l.user_id AND s.account = l.account
+                    WHERE l.id > $1 AND l.id > COALESCE(s.ledger_id, 0)
+                    GROUP BY l.user_id, l.account
+                ) AS tail
+                LEFT JOIN ledger_snapshots s ON s.user_id = tail.user_id AND s.account = tail.account
+                ON CONFLICT (user_id, account) DO UPDATE SET
+                    ledger_id = excluded.ledger_id,
+                    value = excluded.value,
+                    created_at = excluded.created_at
+            ''', watermark))
+            conn.execute(f'''
+                INSERT INTO ledger_watermark (id, ledger_id)
+                SELECT 1, GREATEST($1, COALESCE(MAX(id), 0)) FROM ledger
+                WHERE id > $1 AND created_at < {NOW_UTC} - interval '{LEDGER_COMMIT_LAG}'
+                ON CONFLICT (id) DO UPDATE SET ledger_id = excluded.ledger_id
+            ''', watermark)
+            return updated
+
+        return self._transaction(work)
@@ -0,0 +1,79 @@
+import asyncio
+import functools
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from config import READ_POOL_SIZE
+
+
+class ReadPool:
+    """
+    Соединения SQLite только для чтения и потоки для тяжёлых запросов
+
+    Галерея, /stats и реферальная статистика читают через соединения
+    mode=ro, а не через соединение записи экземпляра Database. БД работает
+    в режиме WAL, поэтому читатели не ждут писателя и не задерживают его:
+    долгий запрос статистики не мешает зачислению платежа.
+    """
+
+    def __init__(self, size: int = READ_POOL_SIZE):
+        self.size = size
+        self._pools = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_pool(self, db_path: str) -> queue.LifoQueue:
+        with self._lock:
+            pool = self._pools.get(db_path)
+            if pool is None:
+                pool = self._pools[db_path] = queue.LifoQueue(maxsize=self.size)
+            return pool
+
+    @staticmethod
+    def _connect(db_path: str):
+        uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+        return sqlite3.connect(uri, uri=True, check_same_thread=False, timeout=10.0)
+
+    @contextmanager
+    def cursor(self, db_path: str):
+        """Курсор свободного соединения только для чтения; лишние соединения закрываются при возврате"""
+        pool = self._get_pool(db_path)
+        try:
+            conn = pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect(db_path)
+        try:
+            yield conn.cursor()
+        finally:
+            try:
+                pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    async def run(self, func, *args):
+        """Выполняет синхронное чтение в потоках пула, не занимая event loop"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="db-read")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+
+    def close(self):
+        """Закрывает соединения и останавливает потоки чтения"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            pools, self._pools = self._pools, {}
+        if executor:
+            executor.shutdown(wait=False)
+        for pool in pools.values():
+            while True:
+                try:
+                    pool.get_nowait().close()
+                except queue.Empty:
+                    break
+
+
+read_pool = ReadPool()
@@ -0,0 +1,56 @@
+from collections import namedtuple
+
+
+class Record(tuple):
+    """
+    Неизменяемая запись строки БД
+
+    Записи - кортежи с именованными полями (__slots__ пустой, словаря на
+    экземпляр нет). Поля совпадают с колонками запроса и идут в том же
+    порядке, поэтому строка из курсора превращается в запись без
+    промежуточного словаря. Для совместимости с кодом, который работал со
+    словарями, поддерживаются record['поле'] и record.get('поле').
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def columns_sql(cls) -> str:
+        """Список колонок для SELECT в порядке полей записи"""
+        return ", ".join(cls._fields)
+
+    @classmethod
+    def from_row(cls, row):
+        return tuple.__new__(cls, row) if row is not None else None
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def as_dict(self) -> dict:
+        return dict(zip(self._fields, self))
+
+
+def _record(name: str, fields: str):
+    """Создаёт класс записи с именованными полями"""
+    return type(name, (Record, namedtuple(name, fields)), {'__slots__': ()})
+
+
+UserRecord = _record('UserRecord', (
+    'user_id username first_name last_name agreed_to_terms balance '
+    'created_at referrer_id referral_balance referral_code generations '
+    'referrals_count referral_earned'
+))
+
+PaymentRecord = _record('PaymentRecord', 'id payment_id user_id amount status created_at paid_at')
+
+GenerationPurchaseRecord = _record(
+    'GenerationPurchaseRecord', 'id payment_id user_id package_size amount status created_at completed_at'
+)
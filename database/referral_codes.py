@@ -0,0 +1,72 @@
+import hashlib
+from config import REFERRAL_CODE_KEY
+
+# Перестановка Фейстеля на 52 битах: столько значащих бит максимум у id в Telegram
+HALF_BITS = 26
+HALF_MASK = (1 << HALF_BITS) - 1
+ROUNDS = 4
+
+# Base32 Крокфорда: без I, L, O, U, которые легко перепутать
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+CODE_LENGTH = 11  # ceil(52 / 5)
+
+if not REFERRAL_CODE_KEY:
+    raise RuntimeError(
+        "REFERRAL_CODE_KEY не задан: укажите секретный ключ в .env "
+        "(для БД, где коды уже выдавались без ключа, - REFERRAL_CODE_KEY=referral-codes-v1)"
+    )
+
+_KEY = hashlib.sha256(REFERRAL_CODE_KEY.encode()).digest()
+
+
+def _round(value: int, round_index: int) -> int:
+    digest = hashlib.blake2b(
+        value.to_bytes(4, "big") + bytes([round_index]), key=_KEY, digest_size=4
+    ).digest()
+    return int.from_bytes(digest, "big") & HALF_MASK
+
+
+def permute(user_id: int) -> int:
+    """Биективно перемешивает user_id: разные id всегда дают разные значения"""
+    if not 0 <= user_id < 1 << (2 * HALF_BITS):
+        raise ValueError(f"user_id вне диапазона перестановки: {user_id}")
+    left, right = user_id >> HALF_BITS, user_id & HALF_MASK
+    for round_index in range(ROUNDS):
+        left, right = right, left ^ _round(right, round_index)
+    return (left << HALF_BITS) | right
+
+
+def unpermute(value: int) -> int:
+    """Обратная к permute перестановка"""
+    left, right = value >> HALF_BITS, value & HALF_MASK
+    for round_index in reversed(range(ROUNDS)):
+        left, right = right ^ _round(left, round_index), left
+    return (left << HALF_BITS) | right
+
+
+def encode_referral_code(user_id: int) -> str:
+    """
+    Реферальный код пользователя без обращений к БД
+
+    Код - перестановка user_id в base32, поэтому совпасть у двух
+    пользователей он не может. Старые случайные коды короче (6 символов)
+    и с новыми не пересекаются.
+    """
+    value = permute(user_id)
+    chars = []
+    for _ in range(CODE_LENGTH):
+        value, index = divmod(value, 32)
+        chars.append(ALPHABET[index])
+    return "".join(reversed(chars))
+
+
+def decode_referral_code(referral_code: str):
+    """user_id, из которого получен код, или None для старых и некорректных кодов"""
+    if len(referral_code) != CODE_LENGTH or any(char not in ALPHABET for char in referral_code):
+        return None
+    value = 0
+    for char in referral_code:
+        value = value * 32 + ALPHABET.index(char)
+    if value >= 1 << (2 * HALF_BITS):
+        return None
+    return unpermute(value)
@@ -0,0 +1,241 @@
+from abc import ABC, abstractmethod
+from config import PENDING_ACTION_TTL
+
+
+class Repository(ABC):
+    """
+    Интерфейс хранилища данных бота
+
+    Обработчики работают только через эти методы, поэтому хранилище можно
+    выбрать в config.py (DATABASE_BACKEND): SQLite (Database, по умолчанию)
+    или PostgreSQL (PostgresDatabase). Методы синхронные, как и у
+    исходного Database.
+    """
+
+    # --- Пользователи ---
+
+    @abstractmethod
+    def get_user(self, user_id: int):
+        """Профиль пользователя (UserRecord) или None"""
+
+    @abstractmethod
+    def add_user(self, user_id: int, username: str = None, first_name: str = None, last_name: str = None):
+        """Добавляет пользователя, если его ещё нет"""
+
+    @abstractmethod
+    def onboard_user(self, user_id: int, username: str = None, first_name: str = None,
+                     last_name: str = None, referral_code: str = None, referrer_id: int = None):
+        """
+        Регистрирует пользователя из /start одной транзакцией: {'created', 'referrer_id'}
+
+        Пригласивший ищется по referral_code; referrer_id - уже известный
+        пригласивший (код разрешён заранее, например в другом шарде).
+        """
+
+    @abstractmethod
+    def update_user_agreement(self, user_id: int):
+        """Отмечает согласие пользователя с условиями"""
+
+    @abstractmethod
+    def invalidate_user(self, user_id: int):
+        """Сбрасывает закэшированный профиль пользователя"""
+
+    def user_agreed_to_terms(self, user_id: int) -> bool:
+        """Проверяет, согласился ли пользователь с условиями"""
+        user = self.get_user(user_id)
+        return user['agreed_to_terms'] == 1 if user else False
+
+    # --- Баланс и генерации ---
+
+    @abstractmethod
+    def add_to_balance(self, user_id: int, amount: float, reason: str = "top_up", ref_id: str = None):
+        """Зачисляет средства на баланс"""
+
+    @abstractmethod
+    def subtract_from_balance(self, user_id: int, amount: float, reason: str = "generation", ref_id: str = None):
+        """Списывает средства с баланса"""
+
+    @abstractmethod
+    def update_user_balance(self, user_id: int, new_balance: float, reason: str = "adjustment"):
+        """Устанавливает баланс, записывая разницу как корректировку"""
+
+    @abstractmethod
+    def add_generations(self, user_id: int, amount: int, reason: str = "purchase", ref_id: str = None):
+        """Начисляет генерации"""
+
+    @abstractmethod
+    def subtract_generations(self, user_id: int, amount: int = 1, reason: str = "generation", ref_id: str = None):
+        """Списывает генерации (не ниже нуля); False, если пользователя нет"""
+
+    @abstractmethod
+    def get_user_generations(self, user_id: int):
+        """Остаток генераций пользователя"""
+
+    @abstractmethod
+    def has_purchased_generations(self, user_id: int) -> bool:
+        """Покупал ли пользователь пакеты генераций"""
+
+    # --- Результаты генераций ---
+
+    @abstractmethod
+    def save_generation(self, user_id: int, generation_type: str, file_url: str, prompt: str = "", model: str = None):
+        """Сохраняет результат генерации"""
+
+    @abstractmethod
+    def get_user_files(self, user_id: int, generation_type: str):
+        """Файлы пользователя заданного типа: [(file_url, prompt, created_at), ...], новые первыми"""
+
+    def get_user_photos(self, user_id: int):
+        """Получает все оживлённые фото пользователя"""
+        return self.get_user_files(user_id, 'photo_animation')
+
+    def get_user_videos(self, user_id: int):
+        """Получает все видео пользователя"""
+        return self.get_user_files(user_id, 'video_generation')
+
+    def get_user_edited_images(self, user_id: int):
+        """Получает все отредактированные изображения пользователя"""
+        return self.get_user_files(user_id, 'image_editing')
+
+    def get_user_motion_videos(self, user_id: int):
+        """Получает все видео с управлением движением"""
+        return self.get_user_files(user_id, 'motion_control')
+
+    # --- Платежи и покупки генераций ---
+
+    @abstractmethod
+    def save_payment(self, payment_id: str, user_id: int, amount: float):
+        """Сохраняет созданный платёж пополнения"""
+
+    @abstractmethod
+    def get_payment(self, payment_id: str):
+        """Платёж (PaymentRecord) или None"""
+
+    @abstractmethod
+    def update_payment_status(self, payment_id: str, status: str):
+        """Обновляет статус платежа"""
+
+    @abstractmethod
+    def save_generation_purchase(self, payment_id: str, user_id: int, package_size: int, amount: float):
+        """Сохраняет созданную покупку пакета генераций"""
+
+    @abstractmethod
+    def get_generation_purchase(self, payment_id: str):
+        """Покупка (GenerationPurchaseRecord) или None"""
+
+    @abstractmethod
+    def update_generation_purchase_status(self, payment_id: str, status: str):
+        """Обновляет статус покупки генераций"""
+
+    @abstractmethod
+    def get_pending_payment_ids(self, min_age_seconds: int, max_age_seconds: int, limit: int = 100):
+        """id платежей и покупок, застрявших в статусе pending"""
+
+    @abstractmethod
+    def cancel_pending_payment(self, payment_id: str):
+        """Помечает отменённым платёж или покупку в статусе pending"""
+
+    @abstractmethod
+    def fulfill_payment_event(self, event: str, payment_id: str, referral_rates=()):
+        """Зачисляет успешный платёж ровно один раз, возвращает словарь со status"""
+
+    # --- Очередь зачислений ---
+
+    @abstractmethod
+    def enqueue_payment_event(self, event: str, payment_id: str) -> bool:
+        """Ставит событие оплаты в очередь (или возвращает в работу failed-задачу); False, если оно уже там"""
+
+    @abstractmethod
+    def get_due_fulfillment_jobs(self, now: float, limit: int = 20):
+        """Задачи очереди, время которых подошло"""
+
+    @abstractmethod
+    def get_next_fulfillment_time(self):
+        """Время ближайшей отложенной задачи или None"""
+
+    @abstractmethod
+    def save_fulfillment_result(self, job_id: int, result: str):
+        """Сохраняет результат зачисления; задача ждёт отправки уведомлений"""
+
+    @abstractmethod
+    def complete_fulfillment_job(self, job_id: int):
+        """Помечает задачу выполненной"""
+
+    @abstractmethod
+    def retry_fulfillment_job(self, job_id: int, error: str, next_attempt_at: float = None):
+        """Откладывает задачу или помечает её failed"""
+
+    # --- Рефералы ---
+
+    @abstractmethod
+    def generate_referral_code(self, user_id: int):
+        """Выдаёт реферальный код, если его нет, и возвращает действующий"""
+
+    @abstractmethod
+    def get_referral_code(self, user_id: int):
+        """Реферальный код пользователя или None"""
+
+    @abstractmethod
+    def get_user_by_referral_code(self, referral_code: str):
+        """user_id владельца кода или None"""
+
+    @abstractmethod
+    def set_referrer(self, user_id: int, referrer_id: int):
+        """Привязывает пользователя к рефереру"""
+
+    @abstractmethod
+    def add_referral_earning(self, user_id: int, from_user_id: int, amount: float, payment_amount: float,
+                             ref_id: str = None):
+        """Начисляет реферальный бонус"""
+
+    @abstractmethod
+    def get_referral_stats(self, user_id: int):
+        """{'referrals_count', 'total_earned'} пользователя"""
+
+    @abstractmethod
+    def get_referral_counts_by_depth(self, user_id: int, max_depth: int = 3):
+        """Количество рефералов по уровням: {глубина: количество}"""
+
+    @abstractmethod
+    def check_referral_counters(self, fix: bool = True):
+        """Сверяет счётчики рефералов с исходными данными, возвращает число расхождений"""
+
+    # --- Незавершённые действия ---
+
+    @abstractmethod
+    def save_pending_action(self, user_id: int, action_type: str, action_data: str, ttl: int = PENDING_ACTION_TTL):
+        """Сохраняет действие, ожидающее оплаты"""
+
+    @abstractmethod
+    def get_pending_action(self, user_id: int):
+        """Непросроченное действие {'action_type', 'action_data'} или None"""
+
+    @abstractmethod
+    def clear_pending_action(self, user_id: int):
+        """Удаляет действие после выполнения"""
+
+    @abstractmethod
+    def sweep_expired_pending_actions(self, batch_size: int = 500):
+        """Удаляет просроченные действия, возвращает их количество"""
+
+    # --- Статистика и обслуживание ---
+
+    @abstractmethod
+    def get_stats_totals(self):
+        """Итоги за всё время для /stats"""
+
+    @abstractmethod
+    def get_stats_summary(self, days=7):
+        """Итоги за всё время и за последние N дней"""
+
+    @abstractmethod
+    def get_range_stats(self, start, end):
+        """Статистика за период [start, end) в UTC; активные - в среднем за сутки"""
+
+    @abstractmethod
+    def get_top_users_by_generations(self, limit=10):
+        """Топ пользователей по количеству генераций"""
+
+    @abstractmethod
+    def snapshot_ledger(self):
+        """Сворачивает журнал операций в снимки остатков"""
@@ -0,0 +1,431 @@
+import hashlib
+import heapq
+import itertools
+import os
+import threading
+from config import DATABASE_PATH, DATABASE_SHARDS, PENDING_ACTION_TTL
+from database.cache import UserCache, MISSING
+from database.database import Database
+from database.referral_codes import decode_referral_code
+from database.repository import Repository
+
+# Максимальная глубина реферальной цепочки, как в rebuild_referral_closure
+MAX_REFERRAL_DEPTH = 64
+
+# Размер списка IN при обходе рефералов по уровням
+FAN_OUT_CHUNK = 500
+
+# payment_id -> номер шарда. Свой кэш, чтобы не вытеснять профили из user_cache;
+# платёж не переезжает между шардами, так что TTL только ограничивает память
+payment_shard_cache = UserCache(maxsize=4096, ttl=24 * 3600)
+
+
+def shard_paths(db_path: str, shards: int):
+    """Файлы шардов: bot_database.db -> bot_database.shard0.db, bot_database.shard1.db, ..."""
+    root, ext = os.path.splitext(db_path)
+    return [f"{root}.shard{index}{ext or '.db'}" for index in range(shards)]
+
+
+def shard_index(user_id: int, shards: int) -> int:
+    """Номер шарда пользователя: хэш id, чтобы соседние id расходились по файлам"""
+    digest = hashlib.blake2b(user_id.to_bytes(8, "big", signed=True), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shards
+
+
+class ShardedDatabase(Repository):
+    """
+    Данные пользователей в нескольких файлах SQLite
+
+    Пользователь и всё, что к нему относится (генерации, платежи, покупки,
+    незавершённые действия, журнал), живут в шарде shard_index(user_id), так
+    что записи разных пользователей не ждут одну блокировку. Шард - обычная
+    Database со своей схемой и триггерами. Роутер направляет точечные
+    операции в нужный шард, а общие выборки (статистика, сверки, очистка)
+    выполняет во всех шардах и объединяет.
+
+    Связи между шардами поддерживаются здесь: счётчик приглашённых у
+    реферера из другого шарда, цепочка рефереров и реферальные бонусы
+    (начисляются в шарде реферера, каждый ровно один раз). Очередь
+    зачислений и таблица payment_shards (в каком шарде платёж) живут в
+    шарде 0.
+    """
+
+    # Шарды, для которых число шардов уже сверено в этом процессе
+    _checked_paths = set()
+    _check_lock = threading.Lock()
+
+    def __init__(self, db_path: str = DATABASE_PATH, shards: int = DATABASE_SHARDS):
+        self.db_path = db_path
+        self.paths = shard_paths(db_path, shards)
+        self._shards = [None] * shards
+
+    # --- Шарды ---
+
+    def _shard(self, index: int) -> Database:
+        """Шард по номеру; соединение открывается при первом обращении"""
+        shard = self._shards[index]
+        if shard is None:
+            shard = self._shards[index] = Database(self.paths[index])
+            with ShardedDatabase._check_lock:
+                if shard.db_path not in ShardedDatabase._checked_paths:
+                    self._check_shard(shard, index)
+                    ShardedDatabase._checked_paths.add(shard.db_path)
+        return shard
+
+    def _check_shard(self, shard: Database, index: int):
+        """Запоминает в шарде его номер и число шардов, чтобы не перепутать файлы при смене настроек"""
+        shard.cursor.execute('CREATE TABLE IF NOT EXISTS shard_info (shard INTEGER NOT NULL, shards INTEGER NOT NULL)')
+        shard.cursor.execute('SELECT shard, shards FROM shard_info')
+        row = shard.cursor.fetchone()
+        if row is None:
+            shard.cursor.execute('INSERT INTO shard_info (shard, shards) VALUES (?, ?)', (index, len(self.paths)))
+            shard.conn.commit()
+        elif row != (index, len(self.paths)):
+            raise RuntimeError(
+                f"{shard.db_path} - шард {row[0]} из {row[1]}, а DATABASE_SHARDS={len(self.paths)}; "
+                "перераспределение данных между шардами не поддерживается"
+            )
+        if index == 0:
+            shard.cursor.execute(
+                'CREATE TABLE IF NOT EXISTS payment_shards (payment_id TEXT PRIMARY KEY, shard INTEGER NOT NULL)'
+            )
+            shard.conn.commit()
+
+    def _all(self):
+        return [self._shard(index) for index in range(len(self.paths))]
+
+    def shard_for(self, user_id: int) -> Database:
+        """Шард, в котором живёт пользователь"""
+        return self._shard(shard_index(user_id, len(self.paths)))
+
+    def _queue(self) -> Database:
+        """Шард с очередью зачислений"""
+        return self._shard(0)
+
+    def _payment_shard(self, payment_id: str):
+        """Шард платежа или покупки по payment_id (None, если платёж не записан)"""
+        key = (self.db_path, payment_id)
+        index = payment_shard_cache.get(key)
+        if index is MISSING:
+            queue = self._queue()
+            queue.cursor.execute('SELECT shard FROM payment_shards WHERE payment_id = ?', (payment_id,))
+            row = queue.cursor.fetchone()
+            if row:
+                index = row[0]
+            else:
+                # Платежи, записанные до появления payment_shards, ищем по шардам один раз
+                index = next((
+                    candidate for candidate, shard in enumerate(self._all())
+                    if shard.get_payment(payment_id) or shard.get_generation_purchase(payment_id)
+                ), None)
+                if index is None:
+                    return None
+                self._store_payment_shard(payment_id, index)
+            payment_shard_cache.set(key, index)
+        return self._shard(index)
+
+    def _store_payment_shard(self, payment_id: str, index: int):
+        queue = self._queue()
+        queue.cursor.execute(
+            'INSERT OR IGNORE INTO payment_shards (payment_id, shard) VALUES (?, ?)', (payment_id, index)
+        )
+        queue.conn.commit()
+
+    def _remember_payment(self, payment_id: str, user_id: int):
+        """
+        Записывает шард нового платежа
+
+        Вызывается до записи самого платежа: если процесс упадёт между
+        шагами, ссылка на шард без платежа безвредна - get_payment вернёт None.
+        """
+        index = shard_index(user_id, len(self.paths))
+        self._store_payment_shard(payment_id, index)
+        payment_shard_cache.set((self.db_path, payment_id), index)
+
+    # --- Пользователи ---
+
+    def get_user(self, user_id: int):
+        return self.shard_for(user_id).get_user(user_id)
+
+    def add_user(self, user_id: int, username: str = None, first_name: str = None, last_name: str = None):
+        self.shard_for(user_id).add_user(user_id, username, first_name, last_name)
+
+    def onboard_user(self, user_id: int, username: str = None, first_name: str = None,
+                     last_name: str = None, referral_code: str = None, referrer_id: int = None):
+        """Регистрирует пользователя в его шарде; реферер ищется по коду во всех шардах"""
+        if referral_code:
+            referrer_id = self.get_user_by_referral_code(referral_code) or referrer_id
+        shard = self.shard_for(user_id)
+        result = shard.onboard_user(user_id, username, first_name, last_name, referrer_id=referrer_id)
+        # В своём шарде счётчик реферера обновил триггер, в чужом - обновляем сами
+        if result['referrer_id'] and self.shard_for(result['referrer_id']) is not shard:
+            self.shard_for(result['referrer_id']).adjust_referrals_count(result['referrer_id'], 1)
+        return result
+
+    def update_user_agreement(self, user_id: int):
+        self.shard_for(user_id).update_user_agreement(user_id)
+
+    def invalidate_user(self, user_id: int):
+        self.shard_for(user_id).invalidate_user(user_id)
+
+    # --- Баланс и генерации ---
+
+    def add_to_balance(self, user_id: int, amount: float, reason: str = "top_up", ref_id: str = None):
+        self.shard_for(user_id).add_to_balance(user_id, amount, reason, ref_id)
+
+    def subtract_from_balance(self, user_id: int, amount: float, reason: str = "generation", ref_id: str = None):
+        self.shard_for(user_id).subtract_from_balance(user_id, amount, reason, ref_id)
+
+    def update_user_balance(self, user_id: int, new_balance: float, reason: str = "adjustment"):
+        self.shard_for(user_id).update_user_balance(user_id, new_balance, reason)
+
+    def add_generations(self, user_id: int, amount: int, reason: str = "purchase", ref_id: str = None):
+        self.shard_for(user_id).add_generations(user_id, amount, reason, ref_id)
+
+    def subtract_generations(self, user_id: int, amount: int = 1, reason: str = "generation", ref_id: str = None):
+        return self.shard_for(user_id).subtract_generations(user_id, amount, reason, ref_id)
+
+    def get_user_generations(self, user_id: int):
+        return self.shard_for(user_id).get_user_generations(user_id)
+
+    def has_purchased_generations(self, user_id: int) -> bool:
+        return self.shard_for(user_id).has_purchased_generations(user_id)
+
+    # --- Результаты генераций ---
+
+    def save_generation(self, user_id: int, generation_type: str, file_url: str, prompt: str = "", model: str = None):
+        self.shard_for(user_id).save_generation(user_id, generation_type, file_url, prompt, model)
+
+    def get_user_files(self, user_id: int, generation_type: str):
+        return self.shard_for(user_id).get_user_files(user_id, generation_type)
+
+    # --- Платежи и покупки генераций ---
+
+    def save_payment(self, payment_id: str, user_id: int, amount: float):
+        self._remember_payment(payment_id, user_id)
+        self.shard_for(user_id).save_payment(payment_id, user_id, amount)
+
+    def get_payment(self, payment_id: str):
+        shard = self._payment_shard(payment_id)
+        return shard.get_payment(payment_id) if shard else None
+
+    def update_payment_status(self, payment_id: str, status: str):
+        shard = self._payment_shard(payment_id)
+        if shard:
+            shard.update_payment_status(payment_id, status)
+
+    def save_generation_purchase(self, payment_id: str, user_id: int, package_size: int, amount: float):
+        self._remember_payment(payment_id, user_id)
+        self.shard_for(user_id).save_generation_purchase(payment_id, user_id, package_size, amount)
+
+    def get_generation_purchase(self, payment_id: str):
+        shard = self._payment_shard(payment_id)
+        return shard.get_generation_purchase(payment_id) if shard else None
+
+    def update_generation_purchase_status(self, payment_id: str, status: str):
+        shard = self._payment_shard(payment_id)
+        if shard:
+            shard.update_generation_purchase_status(payment_id, status)
+
+    def get_pending_payment_ids(self, min_age_seconds: int, max_age_seconds: int, limit: int = 100):
+        # Самые старые платежи со всех шардов: иначе завал в одном шарде не пускал бы сверку к остальным
+        pending = heapq.merge(*(
+            shard.get_pending_payments(min_age_seconds, max_age_seconds, limit) for shard in self._all()
+        ))
+        return [payment_id for _, payment_id in itertools.islice(pending, limit)]
+
+    def cancel_pending_payment(self, payment_id: str):
+        shard = self._payment_shard(payment_id)
+        if shard:
+            shard.cancel_pending_payment(payment_id)
+
+    def fulfill_payment_event(self, event: str, payment_id: str, referral_rates=()):
+        """
+        Зачисляет платёж в шарде плательщика, затем бонусы в шардах рефереров
+
+        Бонусы идемпотентны (credit_referral_bonus), поэтому, если процесс
+        упал между шагами, повтор задачи из очереди доначислит недостающие,
+        даже когда сам платёж уже отмечен как обработанный.
+        """
+        shard = self._payment_shard(payment_id)
+        if shard is None:
+            return {'status': 'not_found', 'payment_id': payment_id}
+
+        result = shard.fulfill_payment_event(event, payment_id)
+        if not referral_rates or result['status'] == 'not_found':
+            return result
+
+        payment = shard.get_payment(payment_id)
+        if not payment or payment['status'] != 'succeeded':
+            return result
+
+        referral_bonuses = []
+        for referrer_id, depth in self._get_referral_upline(payment['user_id'], len(referral_rates)):
+            referral_bonus = payment['amount'] * referral_rates[depth - 1]
+            if referral_bonus <= 0:
+                continue
+            credited = self.shard_for(referrer_id).credit_referral_bonus(
+                referrer_id, payment['user_id'], referral_bonus, payment['amount'], payment_id
+            )
+            if credited:
+                referral_bonuses.append({'referrer_id': referrer_id, 'depth': depth, 'bonus': referral_bonus})
+                if depth == 1:
+                    result.update(referrer_id=referrer_id, referral_bonus=referral_bonus)
+        if result.get('kind') == 'balance':
+            result['referral_bonuses'] = referral_bonuses
+        elif referral_bonuses:
+            print(f"✅ Доначислены реферальные бонусы за {payment_id}: {referral_bonuses}")
+        return result
+
+    # --- Очередь зачислений ---
+
+    def enqueue_payment_event(self, event: str, payment_id: str) -> bool:
+        return self._queue().enqueue_payment_event(event, payment_id)
+
+    def get_due_fulfillment_jobs(self, now: float, limit: int = 20):
+        return self._queue().get_due_fulfillment_jobs(now, limit)
+
+    def get_next_fulfillment_time(self):
+        return self._queue().get_next_fulfillment_time()
+
+    def save_fulfillment_result(self, job_id: int, result: str):
+        self._queue().save_fulfillment_result(job_id, result)
+
+    def complete_fulfillment_job(self, job_id: int):
+        self._queue().complete_fulfillment_job(job_id)
+
+    def retry_fulfillment_job(self, job_id: int, error: str, next_attempt_at: float = None):
+        self._queue().retry_fulfillment_job(job_id, error, next_attempt_at)
+
+    # --- Рефералы ---
+
+    def generate_referral_code(self, user_id: int):
+        return self.shard_for(user_id).generate_referral_code(user_id)
+
+    def get_referral_code(self, user_id: int):
+        return self.shard_for(user_id).get_referral_code(user_id)
+
+    def get_user_by_referral_code(self, referral_code: str):
+        """Владелец кода: новый код сам указывает на шард, старые ищутся во всех"""
+        user_id = decode_referral_code(referral_code)
+        if user_id is not None:
+            return self.shard_for(user_id).get_user_by_referral_code(referral_code)
+        for shard in self._all():
+            user_id = shard.get_user_by_referral_code(referral_code)
+            if user_id is not None:
+                return user_id
+        return None
+
+    def _get_referral_upline(self, user_id: int, max_depth: int):
+        """Рефереры вверх по цепочке до max_depth: [(referrer_id, depth), ...] (цепочка может идти через шарды)"""
+        upline = []
+        user = self.get_user(user_id)
+        while user and user['referrer_id'] and len(upline) < max_depth:
+            upline.append((user['referrer_id'], len(upline) + 1))
+            user = self.get_user(user['referrer_id'])
+        return upline
+
+    def set_referrer(self, user_id: int, referrer_id: int):
+        """Привязывает пользователя к рефереру, проверяя цикл по цепочке во всех шардах"""
+        if referrer_id == user_id or any(
+            ancestor == user_id for ancestor, _ in self._get_referral_upline(referrer_id, MAX_REFERRAL_DEPTH)
+        ):
+            raise ValueError("referral cycle")
+
+        user = self.get_user(user_id)
+        old_referrer_id = user['referrer_id'] if user else None
+        shard = self.shard_for(user_id)
+        shard.set_referrer(user_id, referrer_id)
+        if user and old_referrer_id != referrer_id:
+            if old_referrer_id and self.shard_for(old_referrer_id) is not shard:
+                self.shard_for(old_referrer_id).adjust_referrals_count(old_referrer_id, -1)
+            if referrer_id and self.shard_for(referrer_id) is not shard:
+                self.shard_for(referrer_id).adjust_referrals_count(referrer_id, 1)
+
+    def add_referral_earning(self, user_id: int, from_user_id: int, amount: float, payment_amount: float,
+                             ref_id: str = None):
+        self.shard_for(user_id).add_referral_earning(user_id, from_user_id, amount, payment_amount, ref_id)
+
+    def get_referral_stats(self, user_id: int):
+        return self.shard_for(user_id).get_referral_stats(user_id)
+
+    def get_referral_counts_by_depth(self, user_id: int, max_depth: int = 3):
+        """Количество рефералов по уровням, обходом дерева по всем шардам"""
+        counts = {}
+        level = [user_id]
+        for depth in range(1, max_depth + 1):
+            next_level = []
+            for start in range(0, len(level), FAN_OUT_CHUNK):
+                chunk = level[start:start + FAN_OUT_CHUNK]
+                for shard in self._all():
+                    next_level.extend(shard.get_referral_ids(chunk))
+            if not next_level:
+                break
+            counts[depth] = len(next_level)
+            level = next_level
+        return counts
+
+    def check_referral_counters(self, fix: bool = True):
+        """Сверяет счётчики рефералов: число приглашённых собирается со всех шардов"""
+        referrals_counts = {}
+        for shard in self._all():
+            for referrer_id, count in shard.count_referrals_by_referrer().items():
+                referrals_counts[referrer_id] = referrals_counts.get(referrer_id, 0) + count
+        return sum(shard.check_referral_counters(fix, referrals_counts) for shard in self._all())
+
+    # --- Незавершённые действия ---
+
+    def save_pending_action(self, user_id: int, action_type: str, action_data: str, ttl: int = PENDING_ACTION_TTL):
+        self.shard_for(user_id).save_pending_action(user_id, action_type, action_data, ttl)
+
+    def get_pending_action(self, user_id: int):
+        return self.shard_for(user_id).get_pending_action(user_id)
+
+    def clear_pending_action(self, user_id: int):
+        self.shard_for(user_id).clear_pending_action(user_id)
+
+    def sweep_expired_pending_actions(self, batch_size: int = 500):
+        return sum(shard.sweep_expired_pending_actions(batch_size) for shard in self._all())
+
+    # --- Статистика и обслуживание ---
+
+    def get_total_users_count(self):
+        return sum(shard.get_total_users_count() for shard in self._all())
+
+    def get_stats_totals(self):
+        total = {}
+        for shard in self._all():
+            _merge_stats(total, shard.get_stats_totals())
+        return total
+
+    def get_stats_summary(self, days=7):
+        """Сводка для /stats: суммы по шардам (пользователь живёт в одном шарде, так что активные не задваиваются)"""
+        total = {}
+        for shard in self._all():
+            _merge_stats(total, shard.get_stats_summary(days))
+        return total
+
+    def get_range_stats(self, start, end):
+        total = {}
+        for shard in self._all():
+            _merge_stats(total, shard.get_range_stats(start, end))
+        return total
+
+    def get_top_users_by_generations(self, limit=10):
+        top = []
+        for shard in self._all():
+            top.extend(shard.get_top_users_by_generations(limit))
+        top.sort(key=lambda row: row[3], reverse=True)
+        return top[:limit]
+
+    def snapshot_ledger(self):
+        return sum(shard.snapshot_ledger() for shard in self._all())
+
+
+def _merge_stats(total: dict, stats: dict):
+    """Складывает сводку шарда в общую: числа суммируются, вложенные словари - по ключам"""
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            _merge_stats(total.setdefault(key, {}), value)
+        else:
+            total[key] = total.get(key, 0) + value
@@ -1,20 +1,22 @@
-from aiogram import Router, F
-from aiogram.types import CallbackQuery, URLInputFile, InlineKeyboardMarkup, InlineKeyboardButton
-from keyboards.inline import get_cabinet_keyboard, get_main_menu_keyboard
+from aiogram import Router
+from aiogram.types import CallbackQuery, URLInputFile, BufferedInputFile
+from utils.callback_index import callback_index
+from keyboards.inline import get_cabinet_keyboard, get_main_menu_keyboard, get_balance_amounts_keyboard, get_to_main_menu_keyboard, get_back_keyboard
+from database.database import Database, db_call
+from database.read_pool import read_pool
+import aiohttp
 
 router = Router()
 
 
-@router.callback_query(F.data == "personal_cabinet")
+@callback_index.exact("personal_cabinet")
 async def personal_cabinet_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Личный кабинет'"""
-    from database.database import Database
-    
     user_id = callback.from_user.id
     
     # Получаем баланс из БД
     db = Database()
-    user = db.get_user(user_id)
+    user = await db_call(db.get_user, user_id)
     balance = user['balance'] if user else 0.00
     
     text = (
@@ -40,15 +42,13 @@ async def personal_cabinet_handler(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "my_photos")
+@callback_index.exact("my_photos")
 async def my_photos_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Мои фото'"""
-    from database.database import Database
-    
     user_id = callback.from_user.id
     db = Database()
     
-    photos = db.get_user_photos(user_id)
+    photos = await read_pool.run(db.get_user_photos, user_id)
     
     if not photos:
         await callback.answer("У вас пока нет оживлённых фото", show_alert=True)
@@ -66,11 +66,7 @@ async def my_photos_handler(callback: CallbackQuery):
             print(f"Ошибка отправки фото: {e}")
     
     # В конце отправляем текст с кнопкой
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="Главное меню", callback_data="main_menu")]
-        ]
-    )
+    keyboard = get_to_main_menu_keyboard()
     
     await callback.message.answer(
         f"Ваши оживлённые фотографии ({len(photos)})",
@@ -80,15 +76,13 @@ async def my_photos_handler(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "my_videos")
+@callback_index.exact("my_videos")
 async def my_videos_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Мои видео'"""
-    from database.database import Database
-    
     user_id = callback.from_user.id
     db = Database()
     
-    videos = db.get_user_videos(user_id)
+    videos = await read_pool.run(db.get_user_videos, user_id)
     
     if not videos:
         await callback.answer("У вас пока нет сгенерированных видео", show_alert=True)
@@ -106,11 +100,7 @@ async def my_videos_handler(callback: CallbackQuery):
             print(f"Ошибка отправки видео: {e}")
     
     # В конце отправляем текст с кнопкой
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="Главное меню", callback_data="main_menu")]
-        ]
-    )
+    keyboard = get_to_main_menu_keyboard()
     
     await callback.message.answer(
         f"Ваши видео ({len(videos)})",
@@ -120,19 +110,16 @@ async def my_videos_handler(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "my_edited_images")
+@callback_index.exact("my_edited_images")
 async def my_edited_images_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Мои отредактированные изображения'"""
-    from database.database import Database
-    import aiohttp
     from PIL import Image
     from io import BytesIO
-    from aiogram.types import BufferedInputFile
     
     user_id = callback.from_user.id
     db = Database()
     
-    images = db.get_user_edited_images(user_id)
+    images = await read_pool.run(db.get_user_edited_images, user_id)
     
     if not images:
         await callback.answer("У вас пока нет отредактированных изображений", show_alert=True)
@@ -191,11 +178,7 @@ async def my_edited_images_handler(callback: CallbackQuery):
             print(f"❌ Ошибка отправки изображения: {e}")
     
     # В конце отправляем текст с кнопкой
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="Главное меню", callback_data="main_menu")]
-        ]
-    )
+    keyboard = get_to_main_menu_keyboard()
     
     await callback.message.answer(
         f"Ваши отредактированные изображения ({len(images)})",
@@ -205,11 +188,9 @@ async def my_edited_images_handler(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "top_up_balance_cabinet")
+@callback_index.exact("top_up_balance_cabinet")
 async def top_up_balance_cabinet_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Пополнить баланс' из личного кабинета"""
-    from keyboards.inline import get_balance_amounts_keyboard
-    
     # Сохраняем контекст
     from handlers.payment import user_balance_context
     user_balance_context[callback.from_user.id] = "personal_cabinet"
@@ -221,7 +202,7 @@ async def top_up_balance_cabinet_handler(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "documents")
+@callback_index.exact("documents")
 async def documents_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Документы'"""
     text = (
@@ -231,12 +212,7 @@ async def documents_handler(callback: CallbackQuery):
         "📌 <a href='https://docs.google.com/document/d/1ik6H8r3mc2vLQWqce_Yc9evrd5shACcdr3um8jOYV6o/edit?tab=t.0#heading=h.448sylidj6gd'>Договор оферты</a>"
     )
     
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="Назад", callback_data="personal_cabinet")],
-            [InlineKeyboardButton(text="Главное меню", callback_data="main_menu")]
-        ]
-    )
+    keyboard = get_back_keyboard("personal_cabinet", main_menu=True)
     
     await callback.message.edit_text(
         text,
@@ -245,22 +221,14 @@ async def documents_handler(callback: CallbackQuery):
     )
     await callback.answer()
 
-@router.callback_query(F.data == "my_motion_videos")
+@callback_index.exact("my_motion_videos")
 async def my_motion_videos_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Управление движением(Kling)'"""
-    from database.database import Database
-    
     user_id = callback.from_user.id
     db = Database()
     
     # Получаем видео с управлением движением
-    cursor = db.conn.cursor()
-    cursor.execute('''
-        SELECT file_url, prompt, created_at FROM generations
-        WHERE user_id = ? AND type = 'motion_control'
-        ORDER BY created_at DESC
-    ''', (user_id,))
-    videos = cursor.fetchall()
+    videos = await read_pool.run(db.get_user_motion_videos, user_id)
     
     if not videos:
         await callback.answer("У вас пока нет видео с управлением движением", show_alert=True)
@@ -278,11 +246,7 @@ async def my_motion_videos_handler(callback: CallbackQuery):
             print(f"Ошибка отправки видео: {e}")
     
     # В конце отправляем текст с кнопкой
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="Главное меню", callback_data="main_menu")]
-        ]
-    )
+    keyboard = get_to_main_menu_keyboard()
     
     await callback.message.answer(
         f"Ваши видео с управлением движением ({len(videos)})",
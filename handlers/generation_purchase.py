@@ -1,37 +1,34 @@
-from aiogram import Router, F
+from functools import lru_cache
+from aiogram import Router
 from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
-from database.database import Database
-from utils.yookassa_client import YooKassaClient
+from utils.callback_index import callback_index
+from database.database import Database, db_call
+from utils.yookassa_client import yookassa_client
+from utils.pricing import GENERATION_PACKAGES, GENERATION_PACKAGE_DESCRIPTIONS
 import logging
+from keyboards.inline import get_images_menu_keyboard
 
 router = Router()
 logger = logging.getLogger(__name__)
 
-GENERATION_PACKAGES = {
-    "gen_10": {"count": 10, "price": 99.0},
-    "gen_25": {"count": 25, "price": 199.0},
-    "gen_50": {"count": 50, "price": 399.0},
-    "gen_100": {"count": 100, "price": 799.0}
-}
-
 # Словарь для хранения контекста откуда пришел пользователь
 user_gen_context = {}
 
 
+@lru_cache(maxsize=16)
 def show_generation_packages(back_to: str = "images_menu"):
     """Создает клавиатуру с пакетами генераций"""
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="10 генераций - 99₽", callback_data="select_gen_10")],
-            [InlineKeyboardButton(text="🔥 25 генераций - 199₽", callback_data="select_gen_25")],
-            [InlineKeyboardButton(text="50 генераций - 399₽", callback_data="select_gen_50")],
-            [InlineKeyboardButton(text="🔥 100 генераций - 799₽", callback_data="select_gen_100")],
-            [InlineKeyboardButton(text="Назад", callback_data=f"back_gen_{back_to}")]
-        ]
-    )
+    rows = []
+    for key, package in GENERATION_PACKAGES.items():
+        label = f"{package['count']} генераций - {package['price']:.0f}₽"
+        if package.get('hot'):
+            label = f"🔥 {label}"
+        rows.append([InlineKeyboardButton(text=label, callback_data=f"select_{key}")])
+    rows.append([InlineKeyboardButton(text="Назад", callback_data=f"back_gen_{back_to}")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
-@router.callback_query(F.data == "buy_generations")
+@callback_index.exact("buy_generations")
 async def buy_generations_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Купить генерации' из меню изображений"""
     user_id = callback.from_user.id
@@ -49,7 +46,7 @@ async def buy_generations_handler(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "buy_generations_from_editing")
+@callback_index.exact("buy_generations_from_editing")
 async def buy_generations_from_editing_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Купить генерации' из редактирования"""
     user_id = callback.from_user.id
@@ -67,7 +64,7 @@ async def buy_generations_from_editing_handler(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "buy_generations_from_trends")
+@callback_index.exact("buy_generations_from_trends")
 async def buy_generations_from_trends_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Купить генерации' из трендов"""
     user_id = callback.from_user.id
@@ -85,7 +82,7 @@ async def buy_generations_from_trends_handler(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("select_gen_"))
+@callback_index.prefix("select_gen_")
 async def select_generation_package_handler(callback: CallbackQuery):
     """Обработчик выбора пакета генераций - сразу создает платеж"""
     package_key = callback.data.replace("select_", "")
@@ -101,10 +98,9 @@ async def select_generation_package_handler(callback: CallbackQuery):
     
     logger.info(f"💳 User {user_id} покупает пакет {package_key}: {generations_count} генераций за {amount}₽")
     
-    yookassa_client = YooKassaClient()
     payment_data = await yookassa_client.create_payment(
         amount=amount,
-        description=f"Покупка {generations_count} генераций",
+        description=GENERATION_PACKAGE_DESCRIPTIONS[package_key],
         user_id=user_id
     )
     
@@ -116,7 +112,8 @@ async def select_generation_package_handler(callback: CallbackQuery):
     confirmation_url = payment_data['confirmation_url']
     
     db = Database()
-    db.save_generation_purchase(
+    await db_call(
+        db.save_generation_purchase,
         payment_id=payment_id,
         user_id=user_id,
         package_size=generations_count,
@@ -148,15 +145,12 @@ async def select_generation_package_handler(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "back_gen_images_menu")
+@callback_index.exact("back_gen_images_menu")
 async def back_gen_images_menu_handler(callback: CallbackQuery):
     """Назад в меню изображений"""
-    from keyboards.inline import get_images_menu_keyboard
-    from database.database import Database
-
     user_id = callback.from_user.id
     db = Database()
-    generations = db.get_user_generations(user_id)
+    generations = await db_call(db.get_user_generations, user_id)
 
     generation_text = f"<blockquote>⚡ У вас осталось: {generations} генераций</blockquote>"
 
@@ -176,14 +170,14 @@ async def back_gen_images_menu_handler(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "back_gen_image_editing")
+@callback_index.exact("back_gen_image_editing")
 async def back_gen_image_editing_handler(callback: CallbackQuery):
     """Назад в редактирование"""
     from handlers.image_editing import image_editing_handler
     await image_editing_handler(callback)
 
 
-@router.callback_query(F.data == "back_gen_trends")
+@callback_index.exact("back_gen_trends")
 async def back_gen_trends_handler(callback: CallbackQuery):
     """Назад в тренды"""
     from handlers.trends import trends_handler
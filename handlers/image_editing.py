@@ -1,18 +1,26 @@
 from aiogram import Router, F, Bot
-from aiogram.types import CallbackQuery, Message, URLInputFile, BufferedInputFile, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import CallbackQuery, Message, URLInputFile, BufferedInputFile
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from keyboards.inline import (
     get_edit_aspect_ratio_keyboard,
-    get_images_menu_keyboard
+    get_images_menu_keyboard,
+    get_trend_model_selection_keyboard,
+    get_back_keyboard,
+    get_buy_generations_keyboard
 )
+from utils.callback_index import callback_index
 from utils.nano_banana_edit_client import NanoBananaEditClient
 from utils.texts import TEXTS
+from utils.progress import progress_reporter
 import logging
 import aiohttp
 from PIL import Image
 from io import BytesIO
 import asyncio
+from database.database import Database, db_call
+from utils.image_edit_client import ImageEditClient
+import json
 
 media_group_photos = {}
 
@@ -100,16 +108,14 @@ async def compress_image(image_url: str, max_size_mb: float = 10.0, quality: int
     return BufferedInputFile(output.read(), filename="image.jpg")
 
 
-@router.callback_query(F.data == "image_editing")
+@callback_index.exact("image_editing")
 async def image_editing_handler(callback: CallbackQuery, state: FSMContext):
     """Обработчик кнопки 'Редактирование изображений'"""
-    from database.database import Database
-
     user_id = callback.from_user.id
 
     # Получаем количество генераций
     db = Database()
-    generations = db.get_user_generations(user_id)
+    generations = await db_call(db.get_user_generations, user_id)
 
     generation_text = (
         f"<blockquote>⚡ У вас осталось: {generations} генераций\n\n"
@@ -146,12 +152,9 @@ async def image_editing_handler(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("edit_aspect_"))
+@callback_index.prefix("edit_aspect_")
 async def edit_aspect_handler(callback: CallbackQuery, state: FSMContext):
     """Обработчик выбора соотношения сторон"""
-    from database.database import Database
-    from keyboards.inline import get_trend_model_selection_keyboard
-
     # Проверяем текущее состояние
     current_state = await state.get_state()
 
@@ -170,7 +173,7 @@ async def edit_aspect_handler(callback: CallbackQuery, state: FSMContext):
     # Получаем количество генераций для показа в выборе модели
     user_id = callback.from_user.id
     db = Database()
-    generations = db.get_user_generations(user_id)
+    generations = await db_call(db.get_user_generations, user_id)
 
     # Показываем выбор модели
     await callback.message.edit_text(
@@ -282,9 +285,6 @@ async def handle_edit_photos(message: Message, state: FSMContext, bot: Bot):
 @router.message(ImageEditingStates.waiting_for_description, F.text)
 async def process_edit_description(message: Message, state: FSMContext, bot: Bot):
     """Обработчик описания редактирования - сразу запускает генерацию"""
-    from database.database import Database
-    import json
-
     prompt = message.text
     user_id = message.from_user.id
     chat_id = message.chat.id
@@ -298,7 +298,7 @@ async def process_edit_description(message: Message, state: FSMContext, bot: Bot
     generations_cost = 1 if model_type == "standard" else 4
 
     db = Database()
-    generations = db.get_user_generations(user_id)
+    generations = await db_call(db.get_user_generations, user_id)
 
     # Проверяем количество генераций
     if generations < generations_cost:
@@ -308,14 +308,9 @@ async def process_edit_description(message: Message, state: FSMContext, bot: Bot
             "prompt": prompt,
             "model_type": model_type
         })
-        db.save_pending_action(user_id, "image_editing_pending", action_data)
+        await db_call(db.save_pending_action, user_id, "image_editing_pending", action_data)
 
-        keyboard = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [InlineKeyboardButton(text="⚡ Купить генерации", callback_data="buy_generations_from_editing")],
-                [InlineKeyboardButton(text="Главное меню", callback_data="main_menu")]
-            ]
-        )
+        keyboard = get_buy_generations_keyboard("editing")
 
         await message.answer(
             "У вас закончились генерации 😔\n\n"
@@ -338,13 +333,11 @@ async def process_edit_description(message: Message, state: FSMContext, bot: Bot
 
     try:
         if model_type == "standard":
-            from utils.nano_banana_edit_client import NanoBananaEditClient
             edit_client_instance = NanoBananaEditClient()
             task_id = await edit_client_instance.create_edit_task(
                 prompt=prompt, image_urls=photos, image_size=aspect_ratio, output_format="png"
             )
         else:
-            from utils.image_edit_client import ImageEditClient
             edit_client_instance = ImageEditClient()
             task_id = await edit_client_instance.create_edit_task(
                 prompt=prompt, image_urls=photos, aspect_ratio=aspect_ratio, resolution="2K", output_format="png"
@@ -356,16 +349,13 @@ async def process_edit_description(message: Message, state: FSMContext, bot: Bot
             return
 
         if model_type == "pro":
-            async def update_progress(elapsed_min, remaining_min):
-                try:
-                    await processing_msg.edit_text(
-                        f"⭐ Идет генерация в высоком качестве...\n\n"
-                        f"⏱️ Прошло: {elapsed_min} мин\n⏳ Осталось примерно: {remaining_min} мин\n\n"
-                        f"💡 Профессиональная модель создает изображения в 4K"
-                    )
-                except:
-                    pass
-            image_url = await edit_client_instance.wait_for_result(task_id, max_attempts=240, delay=5, progress_callback=update_progress)
+            try:
+                image_url = await edit_client_instance.wait_for_result(
+                    task_id, max_attempts=240, delay=5,
+                    progress_callback=progress_reporter.callback(processing_msg, title="⭐ Идет генерация в высоком качестве...", hint="💡 Профессиональная модель создает изображения в 4K")
+                )
+            finally:
+                progress_reporter.finish(processing_msg)
         else:
             image_url = await edit_client_instance.wait_for_result(task_id, max_attempts=120, delay=5)
 
@@ -376,13 +366,13 @@ async def process_edit_description(message: Message, state: FSMContext, bot: Bot
                     "Система безопасности заблокировала запрос.\n\n💛 Не переживайте, генерация не списана"
                 )
             else:
-                db.subtract_generations(user_id, generations_cost)
+                await db_call(db.subtract_generations, user_id, generations_cost, reason="image_editing", ref_id=task_id)
                 compressed_image = await compress_image(image_url, max_size_mb=9.5, quality=85)
                 await bot.send_photo(chat_id=chat_id, photo=compressed_image, caption="✨ Ваше изображение готово!", request_timeout=180)
                 await processing_msg.delete()
-                db.save_generation(user_id, "image_editing", image_url, prompt)
+                await db_call(db.save_generation, user_id, "image_editing", image_url, prompt, model=model_type)
 
-            generations = db.get_user_generations(user_id)
+            generations = await db_call(db.get_user_generations, user_id)
             generation_text = f"<blockquote>⚡ У вас осталось: {generations} генераций</blockquote>"
             await bot.send_message(chat_id=chat_id, text=f"<b>🖼️ Работа с изображениями</b>\n\n✨ <b>Создать фото</b> — генерация изображений с нуля\n🎨 <b>Отредактировать фото</b> — изменить изображение по описанию\n\n{generation_text}", reply_markup=get_images_menu_keyboard(), parse_mode="HTML")
     except Exception as e:
@@ -392,7 +382,7 @@ async def process_edit_description(message: Message, state: FSMContext, bot: Bot
     await state.clear()
 
 
-@router.callback_query(F.data == "back_to_edit_aspect")
+@callback_index.exact("back_to_edit_aspect")
 async def back_to_edit_aspect_handler(callback: CallbackQuery, state: FSMContext):
     """Обработчик кнопки 'Назад' - возврат к выбору соотношения сторон"""
     await callback.message.edit_text(
@@ -403,14 +393,10 @@ async def back_to_edit_aspect_handler(callback: CallbackQuery, state: FSMContext
     await callback.answer()
 
 
-@router.callback_query(F.data == "video_instruction_editing")
+@callback_index.exact("video_instruction_editing")
 async def video_instruction_editing_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Видео-инструкция' в разделе редактирования"""
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="Назад", callback_data="image_editing")]
-        ]
-    )
+    keyboard = get_back_keyboard("image_editing")
     
     await callback.message.answer_video(
         video="BAACAgIAAxkBAAIEm2lj89wQUbrn5anGqPd_m0MfSz8OAAIunQACHSMgSwihmsAAAVHFmzgE",
@@ -422,7 +408,7 @@ async def video_instruction_editing_handler(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "top_up_balance_editing")
+@callback_index.exact("top_up_balance_editing")
 async def top_up_balance_editing_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Купить генерации' из раздела редактирования"""
     # Перенаправляем на покупку генераций
@@ -5,16 +5,20 @@ from aiogram.fsm.state import State, StatesGroup
 from keyboards.inline import (
     get_generation_aspect_ratio_keyboard,
     get_images_menu_keyboard,
-    get_trend_model_selection_keyboard
+    get_trend_model_selection_keyboard,
+    get_buy_generations_keyboard
 )
+from utils.callback_index import callback_index
 from utils.nano_banana_client import NanoBananaClient
 from utils.image_edit_client import ImageEditClient
 from utils.texts import TEXTS
+from utils.progress import progress_reporter
 import logging
 import aiohttp
 from PIL import Image
 from io import BytesIO
 import json
+from database.database import Database, db_call
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -88,16 +92,14 @@ async def compress_image(image_url: str, max_size_mb: float = 10.0, quality: int
     return BufferedInputFile(output.read(), filename="image.jpg")
 
 
-@router.callback_query(F.data == "create_photo")
+@callback_index.exact("create_photo")
 async def create_photo_handler(callback: CallbackQuery, state: FSMContext):
     """Обработчик кнопки 'Создать фото'"""
-    from database.database import Database
-
     user_id = callback.from_user.id
 
     # Получаем количество генераций
     db = Database()
-    generations = db.get_user_generations(user_id)
+    generations = await db_call(db.get_user_generations, user_id)
 
     generation_text = (
         f"<blockquote>⚡ У вас осталось: {generations} генераций\n\n"
@@ -134,11 +136,9 @@ async def create_photo_handler(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("generation_aspect_"))
+@callback_index.prefix("generation_aspect_")
 async def generation_aspect_handler(callback: CallbackQuery, state: FSMContext):
     """Обработчик выбора соотношения сторон для генерации"""
-    from database.database import Database
-
     # Проверяем текущее состояние
     current_state = await state.get_state()
 
@@ -157,7 +157,7 @@ async def generation_aspect_handler(callback: CallbackQuery, state: FSMContext):
     # Получаем количество генераций для показа в выборе модели
     user_id = callback.from_user.id
     db = Database()
-    generations = db.get_user_generations(user_id)
+    generations = await db_call(db.get_user_generations, user_id)
 
     # Показываем выбор модели
     await callback.message.edit_text(
@@ -214,8 +214,6 @@ async def generation_model_selection_handler(callback: CallbackQuery, state: FSM
 @router.message(ImageGenerationStates.waiting_for_prompt, F.text)
 async def process_generation_prompt(message: Message, state: FSMContext, bot: Bot):
     """Обработчик промпта для генерации - сразу запускает генерацию"""
-    from database.database import Database
-
     prompt = message.text
     user_id = message.from_user.id
     chat_id = message.chat.id
@@ -228,7 +226,7 @@ async def process_generation_prompt(message: Message, state: FSMContext, bot: Bo
     generations_cost = 1 if model_type == "standard" else 4
 
     db = Database()
-    generations = db.get_user_generations(user_id)
+    generations = await db_call(db.get_user_generations, user_id)
 
     # Проверяем количество генераций
     if generations < generations_cost:
@@ -238,15 +236,9 @@ async def process_generation_prompt(message: Message, state: FSMContext, bot: Bo
             "prompt": prompt,
             "model_type": model_type
         })
-        db.save_pending_action(user_id, "image_generation_pending", action_data)
-
-        from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-        keyboard = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [InlineKeyboardButton(text="⚡ Купить генерации", callback_data="buy_generations_from_generation")],
-                [InlineKeyboardButton(text="Главное меню", callback_data="main_menu")]
-            ]
-        )
+        await db_call(db.save_pending_action, user_id, "image_generation_pending", action_data)
+
+        keyboard = get_buy_generations_keyboard("generation")
 
         await message.answer(
             "У вас закончились генерации 😔\n\n"
@@ -292,16 +284,13 @@ async def process_generation_prompt(message: Message, state: FSMContext, bot: Bo
             return
 
         if model_type == "pro":
-            async def update_progress(elapsed_min, remaining_min):
-                try:
-                    await processing_msg.edit_text(
-                        f"⭐ Идет генерация в высоком качестве...\n\n"
-                        f"⏱️ Прошло: {elapsed_min} мин\n⏳ Осталось примерно: {remaining_min} мин\n\n"
-                        f"💡 Профессиональная модель создает изображения в 4K"
-                    )
-                except:
-                    pass
-            image_url = await generation_client.wait_for_result(task_id, max_attempts=240, delay=5, progress_callback=update_progress)
+            try:
+                image_url = await generation_client.wait_for_result(
+                    task_id, max_attempts=240, delay=5,
+                    progress_callback=progress_reporter.callback(processing_msg, title="⭐ Идет генерация в высоком качестве...", hint="💡 Профессиональная модель создает изображения в 4K")
+                )
+            finally:
+                progress_reporter.finish(processing_msg)
         else:
             image_url = await generation_client.wait_for_result(task_id, max_attempts=120, delay=5)
 
@@ -312,13 +301,13 @@ async def process_generation_prompt(message: Message, state: FSMContext, bot: Bo
                     "Система безопасности заблокировала запрос.\n\n💛 Не переживайте, генерация не списана"
                 )
             else:
-                db.subtract_generations(user_id, generations_cost)
+                await db_call(db.subtract_generations, user_id, generations_cost, reason="image_generation", ref_id=task_id)
                 compressed_image = await compress_image(image_url, max_size_mb=9.5, quality=85)
                 await bot.send_photo(chat_id=chat_id, photo=compressed_image, caption="✨ Ваше изображение готово!", request_timeout=180)
                 await processing_msg.delete()
-                db.save_generation(user_id, "image_generation", image_url, prompt)
+                await db_call(db.save_generation, user_id, "image_generation", image_url, prompt, model=model_type)
 
-            generations = db.get_user_generations(user_id)
+            generations = await db_call(db.get_user_generations, user_id)
             generation_text = f"<blockquote>⚡ У вас осталось: {generations} генераций</blockquote>"
             await bot.send_message(chat_id=chat_id, text=f"<b>🖼️ Работа с изображениями</b>\n\n✨ <b>Создать фото</b> — генерация изображений с нуля\n🎨 <b>Отредактировать фото</b> — изменить изображение по описанию\n\n{generation_text}", reply_markup=get_images_menu_keyboard(), parse_mode="HTML")
     except Exception as e:
@@ -0,0 +1,50 @@
+import importlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Модули с роутерами в порядке подключения к диспетчеру.
+# Порядок важен: image_generation должен идти перед image_editing!
+HANDLER_MODULES = (
+    "handlers.start",
+    "handlers.motion_control",
+    "handlers.photo_animation",
+    "handlers.video_generation",
+    "handlers.image_generation",
+    "handlers.image_editing",
+    "handlers.payment",
+    "handlers.referral",
+    "handlers.cabinet",
+    "handlers.support",
+    "handlers.trends",
+    "handlers.generation_purchase",
+)
+
+# Тяжёлые зависимости, которые обработчики используют при первом же запросе
+HEAVY_MODULES = (
+    "PIL.Image",
+    "aiohttp",
+)
+
+
+def preload_heavy_modules():
+    """Импортирует тяжёлые зависимости заранее, чтобы первый запрос не платил за них"""
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+
+
+def import_handler_modules():
+    """Импортирует модули обработчиков и возвращает их роутеры в порядке подключения"""
+    preload_heavy_modules()
+    return [importlib.import_module(name).router for name in HANDLER_MODULES]
+
+
+def include_routers(dp, routers):
+    """Подключает индекс callback-запросов и роутеры к диспетчеру"""
+    from utils.callback_index import callback_index
+
+    # Индекс заполняется декораторами при импорте модулей, поэтому подключаем его после
+    dp.include_router(callback_index)
+    for router in routers:
+        dp.include_router(router)
+    logger.info(f"✅ Подключено роутеров: {len(routers)}")
@@ -1,8 +1,14 @@
 from aiogram import Router, F
-from aiogram.types import CallbackQuery, Message, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import CallbackQuery, Message, InlineKeyboardMarkup, InlineKeyboardButton, URLInputFile
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from utils.callback_index import callback_index
 import logging
+from keyboards.inline import get_motion_quality_keyboard, get_payment_methods_keyboard, get_video_menu_keyboard
+from database.database import Database, db_call
+from utils.texts import TEXTS
+from utils.motion_control_client import MotionControlClient
+import json
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -19,7 +25,7 @@ class MotionControlStates(StatesGroup):
     waiting_for_quality = State()
 
 
-@router.callback_query(F.data == "motion_control")
+@callback_index.exact("motion_control")
 async def motion_control_handler(callback: CallbackQuery, state: FSMContext):
     """Обработчик кнопки 'Управление движением'"""
     user_id = callback.from_user.id
@@ -80,8 +86,6 @@ async def process_motion_photo(message: Message, state: FSMContext):
 @router.message(MotionControlStates.waiting_for_video, F.video)
 async def process_motion_video(message: Message, state: FSMContext, bot):
     """Обработчик получения видео"""
-    from keyboards.inline import get_motion_quality_keyboard
-
     user_id = message.from_user.id
 
     logger.info(f"\n{'='*70}")
@@ -154,16 +158,9 @@ async def process_motion_video(message: Message, state: FSMContext, bot):
     await state.set_state(MotionControlStates.waiting_for_quality)
 
 
-@router.callback_query(F.data.startswith("motion_quality_"))
+@callback_index.prefix("motion_quality_")
 async def motion_quality_handler(callback: CallbackQuery, state: FSMContext, bot):
     """Обработчик выбора качества - запускает генерацию"""
-    from database.database import Database
-    from keyboards.inline import get_payment_methods_keyboard, get_video_menu_keyboard
-    from utils.texts import TEXTS
-    from utils.motion_control_client import MotionControlClient
-    from aiogram.types import URLInputFile
-    import json
-
     quality = callback.data.replace("motion_quality_", "")
     user_id = callback.from_user.id
 
@@ -188,7 +185,7 @@ async def motion_quality_handler(callback: CallbackQuery, state: FSMContext, bot
     logger.info(f"Required amount: {required_amount}₽")
 
     db = Database()
-    user = db.get_user(user_id)
+    user = await db_call(db.get_user, user_id)
     balance = user['balance'] if user else 0.00
 
     logger.info(f"User balance: {balance}₽")
@@ -208,7 +205,7 @@ async def motion_quality_handler(callback: CallbackQuery, state: FSMContext, bot
                 "video_duration": video_duration
             }
         })
-        db.save_pending_action(user_id, "motion_control_pending", action_data)
+        await db_call(db.save_pending_action, user_id, "motion_control_pending", action_data)
 
         await callback.message.answer(
             "Похоже, средств сейчас немного не хватает\n\n"
@@ -284,7 +281,7 @@ async def motion_quality_handler(callback: CallbackQuery, state: FSMContext, bot
 
                 # Успешная генерация - списываем средства
                 new_balance = balance - required_amount
-                db.update_user_balance(user_id, new_balance)
+                await db_call(db.subtract_from_balance, user_id, required_amount, reason="motion_control", ref_id=task_id)
 
                 logger.info(f"💰 Charged {required_amount}₽. New balance: {new_balance}₽")
 
@@ -303,7 +300,7 @@ async def motion_quality_handler(callback: CallbackQuery, state: FSMContext, bot
 
                     logger.info(f"✅ Video sent successfully!")
 
-                    db.save_generation(user_id, "motion_control", result_url, "")
+                    await db_call(db.save_generation, user_id, "motion_control", result_url, "", model=quality)
 
                     logger.info(f"💾 Generation saved to database")
 
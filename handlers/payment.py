@@ -1,5 +1,5 @@
-from aiogram import Router, F
-from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, BufferedInputFile
+from aiogram import Router
+from aiogram.types import CallbackQuery, BufferedInputFile, URLInputFile
 from aiogram.fsm.context import FSMContext
 from keyboards.inline import (
     get_balance_amounts_keyboard,
@@ -12,11 +12,26 @@ from keyboards.inline import (
     get_video_format_keyboard,
     get_main_menu_keyboard,
     get_cabinet_keyboard,
-    get_video_menu_keyboard
+    get_video_menu_keyboard,
+    get_payment_link_keyboard
 )
+from utils.callback_index import callback_index
+from utils.progress import progress_reporter
 import aiohttp
 from PIL import Image
 from io import BytesIO
+from database.database import Database, db_call
+from utils.texts import TEXTS
+from utils.yookassa_client import yookassa_client
+from utils.pricing import TOP_UP_DESCRIPTIONS, TOP_UP_INVOICE_TEXTS, get_top_up_amount
+from utils.api_client import KieApiClient
+from utils.veo_api_client import VeoApiClient
+from utils.image_edit_client import ImageEditClient
+from utils.nano_banana_client import NanoBananaClient
+from utils.motion_control_client import MotionControlClient
+from utils.nano_banana_edit_client import NanoBananaEditClient
+import json
+import logging
 
 router = Router()
 
@@ -86,7 +101,7 @@ async def compress_image(image_url: str, max_size_mb: float = 9.0, quality: int
     return BufferedInputFile(output.read(), filename="image.jpg")
 
 
-@router.callback_query(F.data == "top_up_balance_photo")
+@callback_index.exact("top_up_balance_photo")
 async def top_up_balance_photo_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Пополнить баланс' из раздела 'Оживление фото'"""
     user_balance_context[callback.from_user.id] = "photo_animation"
@@ -98,7 +113,7 @@ async def top_up_balance_photo_handler(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "top_up_balance_video_menu")
+@callback_index.exact("top_up_balance_video_menu")
 async def top_up_balance_video_menu_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Пополнить баланс' из меню видео-контент"""
     user_balance_context[callback.from_user.id] = "video_menu"
@@ -110,7 +125,7 @@ async def top_up_balance_video_menu_handler(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "top_up_balance_video")
+@callback_index.exact("top_up_balance_video")
 async def top_up_balance_video_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Пополнить баланс' из раздела 'Создание видео'"""
     user_balance_context[callback.from_user.id] = "video_generation"
@@ -122,19 +137,7 @@ async def top_up_balance_video_handler(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "top_up_balance_editing")
-async def top_up_balance_editing_handler(callback: CallbackQuery):
-    """Обработчик кнопки 'Пополнить баланс' из раздела 'Редактирование изображений'"""
-    user_balance_context[callback.from_user.id] = "image_editing"
-    
-    await callback.message.answer(
-        "💰 Выберите сумму для пополнения:",
-        reply_markup=get_balance_amounts_keyboard(back_to="image_editing")
-    )
-    await callback.answer()
-
-
-@router.callback_query(F.data.startswith("pay_card_"))
+@callback_index.prefix("pay_card_")
 async def pay_card_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Оплата картой'"""
     # Извлекаем откуда пришёл пользователь
@@ -150,17 +153,14 @@ async def pay_card_handler(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "back_to_photo_animation")
+@callback_index.exact("back_to_photo_animation")
 async def back_to_photo_animation_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Назад' - возврат в раздел оживления фото"""
-    from database.database import Database
-    from keyboards.inline import get_photo_animation_keyboard
-    
     user_id = callback.from_user.id
     
     # Получаем баланс из БД
     db = Database()
-    user = db.get_user(user_id)
+    user = await db_call(db.get_user, user_id)
     balance = user['balance'] if user else 0.00
     
     text = (
@@ -191,15 +191,12 @@ async def back_to_photo_animation_handler(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "back_to_video_menu")
+@callback_index.exact("back_to_video_menu")
 async def back_to_video_menu_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Назад' - возврат в меню видео-контент"""
-    from database.database import Database
-    from keyboards.inline import get_video_menu_keyboard
-
     user_id = callback.from_user.id
     db = Database()
-    user = db.get_user(user_id)
+    user = await db_call(db.get_user, user_id)
     balance = user['balance'] if user else 0.00
 
     text = (
@@ -224,17 +221,14 @@ async def back_to_video_menu_handler(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "back_to_video_generation")
+@callback_index.exact("back_to_video_generation")
 async def back_to_video_generation_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Назад' - возврат в раздел создания видео"""
-    from database.database import Database
-    from keyboards.inline import get_video_generation_keyboard
-    
     user_id = callback.from_user.id
     
     # Получаем баланс из БД
     db = Database()
-    user = db.get_user(user_id)
+    user = await db_call(db.get_user, user_id)
     balance = user['balance'] if user else 0.00
     
     text = (
@@ -269,17 +263,14 @@ async def back_to_video_generation_handler(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "back_to_image_editing")
+@callback_index.exact("back_to_image_editing")
 async def back_to_image_editing_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Назад' - возврат в меню изображений"""
-    from database.database import Database
-    from keyboards.inline import get_images_menu_keyboard
-
     user_id = callback.from_user.id
 
     # Получаем количество генераций
     db = Database()
-    generations = db.get_user_generations(user_id)
+    generations = await db_call(db.get_user_generations, user_id)
 
     generation_text = (
         f"<blockquote>⚡ У вас осталось: {generations} генераций\n\n"
@@ -317,11 +308,9 @@ async def back_to_image_editing_handler(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "back_to_motion_control")
+@callback_index.exact("back_to_motion_control")
 async def back_to_motion_control_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Назад' - возврат в видео-контент"""
-    from utils.texts import TEXTS
-
     try:
         await callback.message.delete()
     except:
@@ -335,16 +324,14 @@ async def back_to_motion_control_handler(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "back_to_personal_cabinet")
+@callback_index.exact("back_to_personal_cabinet")
 async def back_to_personal_cabinet_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Назад' - возврат в личный кабинет"""
-    from database.database import Database
-    
     user_id = callback.from_user.id
     
     # Получаем баланс из БД
     db = Database()
-    user = db.get_user(user_id)
+    user = await db_call(db.get_user, user_id)
     balance = user['balance'] if user else 0.00
     
     text = (
@@ -370,173 +357,33 @@ async def back_to_personal_cabinet_handler(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "amount_80")
-async def amount_80_handler(callback: CallbackQuery):
-    """Обработчик выбора суммы 80₽"""
-    from utils.yookassa_client import YooKassaClient
-    from database.database import Database
-    
-    user_id = callback.from_user.id
-    amount = 80.00
-    
-    # Создаём платёж через YooKassa
-    yookassa = YooKassaClient()
-    payment_data = await yookassa.create_payment(
-        amount=amount,
-        description=f"Пополнение баланса на {int(amount)}₽",
-        user_id=user_id
-    )
-    
-    # Сохраняем платёж в БД
-    if payment_data and payment_data.get("payment_id"):
-        db = Database()
-        db.save_payment(payment_data["payment_id"], user_id, amount)
-    
-    if payment_data and payment_data.get("confirmation_url"):
-        keyboard = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [InlineKeyboardButton(text="💳 Перейти к оплате", url=payment_data["confirmation_url"])],
-                [InlineKeyboardButton(text="Главное меню", callback_data="main_menu")]
-            ]
-        )
-        
-        await callback.message.answer(
-            f"<b>Сумма к оплате {int(amount)}₽</b>\n\n"
-            f"  ✨ Подтверждение об успешной оплате приходит в течение нескольких минут (в некоторых случаях в течение часа)",
-            parse_mode="HTML",
-            reply_markup=keyboard
-        )
-    else:
-        await callback.message.answer(
-            "❌ Произошла ошибка при создании платежа. Попробуйте позже."
-        )
-    
-    await callback.answer()
-
-
-@router.callback_query(F.data == "amount_160")
-async def amount_160_handler(callback: CallbackQuery):
-    """Обработчик выбора суммы 160₽"""
-    from utils.yookassa_client import YooKassaClient
-    from database.database import Database
-    
-    user_id = callback.from_user.id
-    amount = 160.00
-    
-    # Создаём платёж через YooKassa
-    yookassa = YooKassaClient()
-    payment_data = await yookassa.create_payment(
-        amount=amount,
-        description=f"Пополнение баланса на {int(amount)}₽",
-        user_id=user_id
-    )
-    
-    # Сохраняем платёж в БД
-    if payment_data and payment_data.get("payment_id"):
-        db = Database()
-        db.save_payment(payment_data["payment_id"], user_id, amount)
-    
-    if payment_data and payment_data.get("confirmation_url"):
-        keyboard = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [InlineKeyboardButton(text="💳 Перейти к оплате", url=payment_data["confirmation_url"])],
-                [InlineKeyboardButton(text="Главное меню", callback_data="main_menu")]
-            ]
-        )
-        
-        await callback.message.answer(
-            f"<b>Сумма к оплате {int(amount)}₽</b>\n\n"
-            f"  ✨ Подтверждение об успешной оплате приходит в течение нескольких минут (в некоторых случаях в течение часа)",
-            parse_mode="HTML",
-            reply_markup=keyboard
-        )
-    else:
-        await callback.message.answer(
-            "❌ Произошла ошибка при создании платежа. Попробуйте позже."
-        )
-    
-    await callback.answer()
-
-
-@router.callback_query(F.data == "amount_320")
-async def amount_320_handler(callback: CallbackQuery):
-    """Обработчик выбора суммы 320₽"""
-    from utils.yookassa_client import YooKassaClient
-    from database.database import Database
-    
-    user_id = callback.from_user.id
-    amount = 320.00
-    
-    # Создаём платёж через YooKassa
-    yookassa = YooKassaClient()
-    payment_data = await yookassa.create_payment(
-        amount=amount,
-        description=f"Пополнение баланса на {int(amount)}₽",
-        user_id=user_id
-    )
-    
-    # Сохраняем платёж в БД
-    if payment_data and payment_data.get("payment_id"):
-        db = Database()
-        db.save_payment(payment_data["payment_id"], user_id, amount)
-    
-    if payment_data and payment_data.get("confirmation_url"):
-        keyboard = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [InlineKeyboardButton(text="💳 Перейти к оплате", url=payment_data["confirmation_url"])],
-                [InlineKeyboardButton(text="Главное меню", callback_data="main_menu")]
-            ]
-        )
-        
-        await callback.message.answer(
-            f"<b>Сумма к оплате {int(amount)}₽</b>\n\n"
-            f"  ✨ Подтверждение об успешной оплате приходит в течение нескольких минут (в некоторых случаях в течение часа)",
-            parse_mode="HTML",
-            reply_markup=keyboard
-        )
-    else:
-        await callback.message.answer(
-            "❌ Произошла ошибка при создании платежа. Попробуйте позже."
-        )
-    
-    await callback.answer()
-
-
-@router.callback_query(F.data == "amount_640")
-async def amount_640_handler(callback: CallbackQuery):
-    """Обработчик выбора суммы 640₽"""
-    from utils.yookassa_client import YooKassaClient
-    from database.database import Database
+@callback_index.prefix("amount_")
+async def top_up_amount_handler(callback: CallbackQuery):
+    """Обработчик выбора суммы пополнения (amount_80, amount_160, ...)"""
+    amount = get_top_up_amount(callback.data)
+    if amount is None:
+        await callback.answer("❌ Неизвестная сумма пополнения", show_alert=True)
+        return
     
     user_id = callback.from_user.id
-    amount = 640.00
     
     # Создаём платёж через YooKassa
-    yookassa = YooKassaClient()
-    payment_data = await yookassa.create_payment(
-        amount=amount,
-        description=f"Пополнение баланса на {int(amount)}₽",
+    payment_data = await yookassa_client.create_payment(
+        amount=float(amount),
+        description=TOP_UP_DESCRIPTIONS[amount],
         user_id=user_id
     )
     
     # Сохраняем платёж в БД
     if payment_data and payment_data.get("payment_id"):
         db = Database()
-        db.save_payment(payment_data["payment_id"], user_id, amount)
+        await db_call(db.save_payment, payment_data["payment_id"], user_id, float(amount))
     
     if payment_data and payment_data.get("confirmation_url"):
-        keyboard = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [InlineKeyboardButton(text="💳 Перейти к оплате", url=payment_data["confirmation_url"])],
-                [InlineKeyboardButton(text="Главное меню", callback_data="main_menu")]
-            ]
-        )
-        
         await callback.message.answer(
-            f"<b>Сумма к оплате {int(amount)}₽</b>\n\n"
-            f"  ✨ Подтверждение об успешной оплате приходит в течение нескольких минут (в некоторых случаях в течение часа)",
+            TOP_UP_INVOICE_TEXTS[amount],
             parse_mode="HTML",
-            reply_markup=keyboard
+            reply_markup=get_payment_link_keyboard(payment_data["confirmation_url"])
         )
     else:
         await callback.message.answer(
@@ -546,20 +393,9 @@ async def amount_640_handler(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("start_action_"))
+@callback_index.prefix("start_action_")
 async def start_action_handler(callback: CallbackQuery):
     """Обработчик подтверждения начала действия после оплаты"""
-    from database.database import Database
-    from utils.texts import TEXTS
-    from aiogram.types import URLInputFile
-    from utils.api_client import KieApiClient
-    from utils.veo_api_client import VeoApiClient
-    from utils.image_edit_client import ImageEditClient
-    from utils.nano_banana_client import NanoBananaClient
-    from utils.motion_control_client import MotionControlClient
-    import json
-    import logging
-    
     logger = logging.getLogger(__name__)
     
     user_id = callback.from_user.id
@@ -568,14 +404,14 @@ async def start_action_handler(callback: CallbackQuery):
     db = Database()
     
     # Получаем незавершённое действие
-    pending = db.get_pending_action(user_id)
+    pending = await db_call(db.get_pending_action, user_id)
     
     if not pending:
         await callback.message.answer("❌ Действие не найдено")
         return
     
     # Получаем баланс
-    user = db.get_user(user_id)
+    user = await db_call(db.get_user, user_id)
     balance = user['balance'] if user else 0.00
     
     # Парсим данные действия
@@ -624,7 +460,7 @@ async def start_action_handler(callback: CallbackQuery):
                     else:
                         # Успешная генерация - списываем средства
                         new_balance = balance - required_amount
-                        db.update_user_balance(user_id, new_balance)
+                        await db_call(db.subtract_from_balance, user_id, required_amount, reason="photo_animation", ref_id=task_id)
                         
                         print(f"💰 Списано {required_amount}₽, новый баланс: {new_balance}₽")
                         
@@ -640,7 +476,7 @@ async def start_action_handler(callback: CallbackQuery):
                             await processing_msg.delete()
                             print("✅ Видео успешно отправлено")
 
-                            db.save_generation(user_id, "photo_animation", video_url, prompt)
+                            await db_call(db.save_generation, user_id, "photo_animation", video_url, prompt)
                         except Exception as e:
                             logger.error(f"Ошибка отправки видео: {e}")
                             await processing_msg.edit_text(
@@ -729,7 +565,7 @@ async def start_action_handler(callback: CallbackQuery):
                     else:
                         # Успешная генерация - списываем средства
                         new_balance = balance - required_amount
-                        db.update_user_balance(user_id, new_balance)
+                        await db_call(db.subtract_from_balance, user_id, required_amount, reason="video_generation", ref_id=task_id)
                         
                         # Отправляем видео
                         try:
@@ -743,7 +579,7 @@ async def start_action_handler(callback: CallbackQuery):
                             await processing_msg.delete()
                             print("✅ Видео успешно отправлено")
                             
-                            db.save_generation(user_id, "video_generation", video_url, prompt)
+                            await db_call(db.save_generation, user_id, "video_generation", video_url, prompt)
                         except Exception as e:
                             logger.error(f"Ошибка отправки видео: {e}")
                             await processing_msg.edit_text(
@@ -790,7 +626,7 @@ async def start_action_handler(callback: CallbackQuery):
         
         generations_cost = 1 if model_type == "standard" else 4
         
-        generations = db.get_user_generations(user_id)
+        generations = await db_call(db.get_user_generations, user_id)
         
         if generations < generations_cost:
             await callback.message.answer("❌ Недостаточно генераций для редактирования изображения")
@@ -802,7 +638,6 @@ async def start_action_handler(callback: CallbackQuery):
         
         try:
             if model_type == "standard":
-                from utils.nano_banana_edit_client import NanoBananaEditClient
                 edit_client = NanoBananaEditClient()
                 task_id = await edit_client.create_edit_task(
                     prompt=prompt,
@@ -822,16 +657,13 @@ async def start_action_handler(callback: CallbackQuery):
             
             if task_id:
                 if model_type == "pro":
-                    async def update_progress(elapsed_min, remaining_min):
-                        try:
-                            await processing_msg.edit_text(
-                                f"⭐ Идет редактирование в высоком качестве...\n\n"
-                                f"⏱️ Прошло: {elapsed_min} мин\n⏳ Осталось примерно: {remaining_min} мин\n\n"
-                                f"💡 Профессиональная модель создает изображения в 4K"
-                            )
-                        except:
-                            pass
-                    image_url = await edit_client.wait_for_result(task_id, max_attempts=240, delay=5, progress_callback=update_progress)
+                    try:
+                        image_url = await edit_client.wait_for_result(
+                            task_id, max_attempts=240, delay=5,
+                            progress_callback=progress_reporter.callback(processing_msg, title="⭐ Идет редактирование в высоком качестве...", hint="💡 Профессиональная модель создает изображения в 4K")
+                        )
+                    finally:
+                        progress_reporter.finish(processing_msg)
                 else:
                     image_url = await edit_client.wait_for_result(task_id, max_attempts=120, delay=5)
                 
@@ -843,7 +675,7 @@ async def start_action_handler(callback: CallbackQuery):
                             "Система безопасности заблокировала запрос.\n\n💛 Не переживайте, генерация не списана"
                         )
                     else:
-                        db.subtract_generations(user_id, generations_cost)
+                        await db_call(db.subtract_generations, user_id, generations_cost, reason="image_editing", ref_id=task_id)
                         
                         # Отправляем изображение
                         try:
@@ -856,7 +688,7 @@ async def start_action_handler(callback: CallbackQuery):
                             )
                             await processing_msg.delete()
                             
-                            db.save_generation(user_id, "image_editing", image_url, prompt)
+                            await db_call(db.save_generation, user_id, "image_editing", image_url, prompt, model=model_type)
                         except Exception as e:
                             logger.error(f"Ошибка отправки изображения: {e}")
                             await processing_msg.edit_text(
@@ -893,7 +725,7 @@ async def start_action_handler(callback: CallbackQuery):
         
         generations_cost = 1 if model_type == "standard" else 4
         
-        generations = db.get_user_generations(user_id)
+        generations = await db_call(db.get_user_generations, user_id)
         
         if generations < generations_cost:
             await callback.message.answer("❌ Недостаточно генераций для создания изображения")
@@ -924,16 +756,13 @@ async def start_action_handler(callback: CallbackQuery):
             
             if task_id:
                 if model_type == "pro":
-                    async def update_progress(elapsed_min, remaining_min):
-                        try:
-                            await processing_msg.edit_text(
-                                f"⭐ Идет генерация в высоком качестве...\n\n"
-                                f"⏱️ Прошло: {elapsed_min} мин\n⏳ Осталось примерно: {remaining_min} мин\n\n"
-                                f"💡 Профессиональная модель создает изображения в 4K"
-                            )
-                        except:
-                            pass
-                    image_url = await generation_client.wait_for_result(task_id, max_attempts=240, delay=5, progress_callback=update_progress)
+                    try:
+                        image_url = await generation_client.wait_for_result(
+                            task_id, max_attempts=240, delay=5,
+                            progress_callback=progress_reporter.callback(processing_msg, title="⭐ Идет генерация в высоком качестве...", hint="💡 Профессиональная модель создает изображения в 4K")
+                        )
+                    finally:
+                        progress_reporter.finish(processing_msg)
                 else:
                     image_url = await generation_client.wait_for_result(task_id, max_attempts=120, delay=5)
                 
@@ -944,7 +773,7 @@ async def start_action_handler(callback: CallbackQuery):
                             "Система безопасности заблокировала запрос.\n\n💛 Не переживайте, генерация не списана"
                         )
                     else:
-                        db.subtract_generations(user_id, generations_cost)
+                        await db_call(db.subtract_generations, user_id, generations_cost, reason="image_generation", ref_id=task_id)
                         
                         try:
                             compressed_image = await compress_image(image_url, max_size_mb=9.5, quality=85)
@@ -956,7 +785,7 @@ async def start_action_handler(callback: CallbackQuery):
                             )
                             await processing_msg.delete()
                             
-                            db.save_generation(user_id, "image_generation", image_url, prompt)
+                            await db_call(db.save_generation, user_id, "image_generation", image_url, prompt, model=model_type)
                         except Exception as e:
                             logger.error(f"Ошибка отправки изображения: {e}")
                             await processing_msg.edit_text(
@@ -1028,7 +857,7 @@ async def start_action_handler(callback: CallbackQuery):
                     else:
                         # Успешная генерация - списываем средства
                         new_balance = balance - required_amount
-                        db.update_user_balance(user_id, new_balance)
+                        await db_call(db.subtract_from_balance, user_id, required_amount, reason="motion_control", ref_id=task_id)
                         
                         # Отправляем видео
                         try:
@@ -1041,7 +870,7 @@ async def start_action_handler(callback: CallbackQuery):
                             )
                             await processing_msg.delete()
                             
-                            db.save_generation(user_id, "motion_control", result_url, "")
+                            await db_call(db.save_generation, user_id, "motion_control", result_url, "", model=quality)
                         except Exception as e:
                             logger.error(f"Ошибка отправки видео: {e}")
                             await processing_msg.edit_text(
@@ -1067,10 +896,10 @@ async def start_action_handler(callback: CallbackQuery):
                 await callback.message.answer("❌ Произошла ошибка при генерации.")
     
     # Очищаем pending action после выполнения
-    db.clear_pending_action(user_id)
+    await db_call(db.clear_pending_action, user_id)
 
 
-@router.callback_query(F.data == "buy_generations_from_generation")
+@callback_index.exact("buy_generations_from_generation")
 async def buy_generations_from_generation_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Купить генерации' из раздела генерации изображений"""
     # Перенаправляем на покупку генераций
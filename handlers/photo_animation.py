@@ -1,12 +1,16 @@
 from aiogram import Router, F, Bot
 from aiogram.types import CallbackQuery, Message, URLInputFile, FSInputFile
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from keyboards.inline import get_video_menu_keyboard
+from utils.callback_index import callback_index
+from keyboards.inline import get_video_menu_keyboard, get_payment_methods_keyboard, get_back_keyboard
 from utils.api_client import KieApiClient
 from utils.texts import TEXTS
 import os
+from database.database import Database, db_call
+import json
+import aiohttp
+import tempfile
 
 router = Router()
 api_client = KieApiClient()
@@ -21,7 +25,7 @@ class PhotoAnimationStates(StatesGroup):
     waiting_for_prompt = State()
 
 
-@router.callback_query(F.data == "photo_animation")
+@callback_index.exact("photo_animation")
 async def photo_animation_handler(callback: CallbackQuery, state: FSMContext):
     """Обработчик кнопки 'Оживление фото'"""
     # Путь к примеру фото
@@ -85,16 +89,12 @@ async def process_invalid_photo(message: Message):
 @router.message(PhotoAnimationStates.waiting_for_prompt, F.text)
 async def process_prompt(message: Message, state: FSMContext, bot: Bot):
     """Обработчик получения промпта"""
-    from database.database import Database
-    from keyboards.inline import get_payment_methods_keyboard
-    import json
-    
     prompt = message.text
     data = await state.get_data()
     photo_url = data.get('photo_url')
     
     db = Database()
-    user = db.get_user(message.from_user.id)
+    user = await db_call(db.get_user, message.from_user.id)
     
     # Проверяем баланс
     balance = user['balance'] if user else 0.00
@@ -107,7 +107,7 @@ async def process_prompt(message: Message, state: FSMContext, bot: Bot):
             "photo_url": photo_url,
             "prompt": prompt
         })
-        db.save_pending_action(message.from_user.id, "photo_animation_pending", action_data)
+        await db_call(db.save_pending_action, message.from_user.id, "photo_animation_pending", action_data)
         
         print(f"💾 Сохранено состояние для оживления фото: photo_url={photo_url}, prompt={prompt}")
         
@@ -155,8 +155,7 @@ async def process_prompt(message: Message, state: FSMContext, bot: Bot):
                 )
             else:
                 # Успешная генерация - списываем средства
-                new_balance = balance - required_amount
-                db.update_user_balance(message.from_user.id, new_balance)
+                await db_call(db.subtract_from_balance, message.from_user.id, required_amount, reason="photo_animation", ref_id=task_id)
                 
                 print(f"🎬 Попытка отправки видео: {video_url}")
                 
@@ -176,15 +175,13 @@ async def process_prompt(message: Message, state: FSMContext, bot: Bot):
                     # Удаляем сообщение о генерации ТОЛЬКО после успешной отправки
                     await processing_msg.delete()
                     # Сохраняем генерацию в БД
-                    db.save_generation(message.from_user.id, "photo_animation", video_url, prompt)
+                    await db_call(db.save_generation, message.from_user.id, "photo_animation", video_url, prompt)
                 except Exception as e:
                     print(f"❌ Ошибка отправки через URLInputFile: {e}")
                     
                     # Способ 2: Пробуем скачать и отправить как файл
                     try:
                         print("📥 Попытка скачать видео и отправить как файл...")
-                        import aiohttp
-                        import tempfile
                         
                         async with aiohttp.ClientSession() as session:
                             async with session.get(video_url, timeout=aiohttp.ClientTimeout(total=300)) as resp:
@@ -273,14 +270,10 @@ async def process_invalid_prompt(message: Message):
     )
 
 
-@router.callback_query(F.data == "video_instruction")
+@callback_index.exact("video_instruction")
 async def video_instruction_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Видео-инструкция'"""
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="Назад", callback_data="photo_animation")]
-        ]
-    )
+    keyboard = get_back_keyboard("photo_animation")
     
     await callback.message.answer_video(
         video="BAACAgIAAxkBAAIEjGlj8Z8gbLE9fhyegRNAnQW3gCmnAAL-nAACHSMgS9w6BMnXVrvhOAQ",
@@ -1,26 +1,32 @@
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
+from utils.callback_index import callback_index
 from config import BOT_USERNAME
 import os
+from database.database import Database, db_call
+from database.read_pool import read_pool
 
 router = Router()
 
 
-@router.callback_query(F.data == "referral_system")
+@callback_index.exact("referral_system")
 async def referral_system_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Реферальная система'"""
-    from database.database import Database
-    
     user_id = callback.from_user.id
     db = Database()
     
-    # Получаем или генерируем реферальный код
-    referral_code = db.get_referral_code(user_id)
+    # Код и счётчики рефералов лежат в профиле пользователя
+    user = await db_call(db.get_user, user_id) or {}
+    referral_code = user.get('referral_code')
     if not referral_code:
-        referral_code = db.generate_referral_code(user_id)
-    
-    # Получаем статистику
-    stats = db.get_referral_stats(user_id)
+        referral_code = await db_call(db.generate_referral_code, user_id)
+
+    stats = {
+        'referrals_count': user.get('referrals_count') or 0,
+        'total_earned': user.get('referral_earned') or 0.0
+    }
+    # Приглашённые друзьями пользователя (второй уровень)
+    second_level = (await read_pool.run(db.get_referral_counts_by_depth, user_id, 2)).get(2, 0)
     
     # Формируем реферальную ссылку
     referral_link = f"https://t.me/{BOT_USERNAME}?start=ref_{referral_code}"
@@ -32,6 +38,7 @@ async def referral_system_handler(callback: CallbackQuery):
         "💰 <b><i>Каждый раз</i></b>, когда приглашённый друг совершает покупку, вы получаете 15% от суммы на основной баланс.\n"
         "🔁 <b><i>Бонус начисляется</i></b> с каждой покупки, без ограничений.\n\n"
         f"<blockquote>📊 Приглашено друзей: {stats['referrals_count']}\n"
+        f"🌱 Приглашено вашими друзьями: {second_level}\n"
         f"💎 Всего заработано: {stats['total_earned']:.2f} ₽</blockquote>\n\n"
         f"🔗 <b>Ваша реферальная ссылка:</b>\n"
         f"<code>{referral_link}</code>"
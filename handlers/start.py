@@ -1,6 +1,13 @@
+from datetime import datetime, timedelta
 from aiogram import Router
-from aiogram.filters import Command
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+from utils.callback_index import callback_index
+from database.database import Database, db_call
+from database.cache import user_cache
+from database.read_pool import read_pool
+from keyboards.inline import get_agreement_keyboard, get_main_menu_keyboard, get_images_menu_keyboard, get_video_menu_keyboard, get_cabinet_keyboard, get_to_main_menu_keyboard, get_pay_amounts_keyboard
+from utils.texts import TEXTS
 
 router = Router()
 
@@ -8,10 +15,6 @@ router = Router()
 @router.message(Command("start"))
 async def start_handler(message: Message):
     """Обработчик команды /start"""
-    from database.database import Database
-    from keyboards.inline import get_agreement_keyboard, get_main_menu_keyboard
-    from utils.texts import TEXTS
-    
     user_id = message.from_user.id
     username = message.from_user.username
     first_name = message.from_user.first_name
@@ -26,22 +29,14 @@ async def start_handler(message: Message):
         referral_code = args[1].replace("ref_", "")
     
     # Проверяем, есть ли пользователь в базе
-    user = db.get_user(user_id)
+    user = await db_call(db.get_user, user_id)
     
     if not user:
-        # Новый пользователь - добавляем в БД
-        db.add_user(user_id, username, first_name, last_name)
-        
-        # Генерируем реферальный код
-        db.generate_referral_code(user_id)
-        
-        # Если есть реферальный код - привязываем
-        if referral_code:
-            referrer_id = db.get_user_by_referral_code(referral_code)
-            if referrer_id and referrer_id != user_id:
-                db.set_referrer(user_id, referrer_id)
-                print(f"✅ Пользователь {user_id} зарегистрирован по реферальной ссылке от {referrer_id}")
-        
+        # Новый пользователь - создаём запись, код и привязку к рефереру одной транзакцией
+        result = await db_call(db.onboard_user, user_id, username, first_name, last_name, referral_code)
+        if result['referrer_id']:
+            print(f"✅ Пользователь {user_id} зарегистрирован по реферальной ссылке от {result['referrer_id']}")
+
         # Показываем соглашение
         await message.answer(
             TEXTS['agreement_text'],
@@ -50,7 +45,7 @@ async def start_handler(message: Message):
         )
     else:
         # Пользователь уже есть
-        if db.user_agreed_to_terms(user_id):
+        if await db_call(db.user_agreed_to_terms, user_id):
             # Уже согласился - показываем главное меню
             await message.answer(
                 TEXTS['welcome_message'],
@@ -66,17 +61,13 @@ async def start_handler(message: Message):
             )
 
 
-@router.callback_query(lambda c: c.data == "confirm_agreement")
+@callback_index.exact("confirm_agreement")
 async def confirm_agreement_handler(callback):
     """Обработчик подтверждения согласия"""
-    from database.database import Database
-    from keyboards.inline import get_main_menu_keyboard
-    from utils.texts import TEXTS
-    
     user_id = callback.from_user.id
     
     db = Database()
-    db.update_user_agreement(user_id)
+    await db_call(db.update_user_agreement, user_id)
     
     await callback.message.delete()
     await callback.message.answer(
@@ -87,12 +78,9 @@ async def confirm_agreement_handler(callback):
     await callback.answer()
 
 
-@router.callback_query(lambda c: c.data == "main_menu")
+@callback_index.exact("main_menu")
 async def main_menu_handler(callback):
     """Обработчик кнопки 'Главное меню'"""
-    from keyboards.inline import get_main_menu_keyboard
-    from utils.texts import TEXTS
-    
     # Пытаемся отредактировать сообщение
     try:
         await callback.message.edit_text(
@@ -116,15 +104,12 @@ async def main_menu_handler(callback):
     await callback.answer()
 
 
-@router.callback_query(lambda c: c.data == "images_menu")
+@callback_index.exact("images_menu")
 async def images_menu_handler(callback):
     """Обработчик кнопки 'Изображения'"""
-    from keyboards.inline import get_images_menu_keyboard
-    from database.database import Database
-
     user_id = callback.from_user.id
     db = Database()
-    generations = db.get_user_generations(user_id)
+    generations = await db_call(db.get_user_generations, user_id)
 
     generation_text = (
         f"<blockquote>⚡ У вас осталось: {generations} генераций\n\n"
@@ -162,15 +147,12 @@ async def images_menu_handler(callback):
     await callback.answer()
 
 
-@router.callback_query(lambda c: c.data == "video_menu")
+@callback_index.exact("video_menu")
 async def video_menu_handler(callback):
     """Обработчик кнопки 'Видео и анимация'"""
-    from keyboards.inline import get_video_menu_keyboard
-    from database.database import Database
-
     user_id = callback.from_user.id
     db = Database()
-    user = db.get_user(user_id)
+    user = await db_call(db.get_user, user_id)
     balance = user['balance'] if user else 0.00
 
     text = (
@@ -215,9 +197,6 @@ async def video_menu_handler(callback):
 @router.message(Command("menu"))
 async def menu_command_handler(message: Message):
     """Обработчик команды /menu"""
-    from keyboards.inline import get_main_menu_keyboard
-    from utils.texts import TEXTS
-    
     await message.answer(
         TEXTS['welcome_message'],
         reply_markup=get_main_menu_keyboard(),
@@ -228,17 +207,7 @@ async def menu_command_handler(message: Message):
 @router.message(Command("pay"))
 async def pay_command_handler(message: Message):
     """Обработчик команды /pay"""
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(text="80₽", callback_data="amount_80"),
-                InlineKeyboardButton(text="160₽", callback_data="amount_160"),
-                InlineKeyboardButton(text="320₽", callback_data="amount_320"),
-                InlineKeyboardButton(text="640₽", callback_data="amount_640")
-            ],
-            [InlineKeyboardButton(text="Главное меню", callback_data="main_menu")]
-        ]
-    )
+    keyboard = get_pay_amounts_keyboard()
     
     await message.answer(
         "💰 Выберите сумму для пополнения:",
@@ -249,13 +218,10 @@ async def pay_command_handler(message: Message):
 @router.message(Command("cabinet"))
 async def lk_command_handler(message: Message):
     """Обработчик команды cabinet (личный кабинет)"""
-    from database.database import Database
-    from keyboards.inline import get_cabinet_keyboard
-    
     user_id = message.from_user.id
     
     db = Database()
-    user = db.get_user(user_id)
+    user = await db_call(db.get_user, user_id)
     balance = user['balance'] if user else 0.00
     
     text = (
@@ -282,11 +248,7 @@ async def lk_command_handler(message: Message):
 @router.message(Command("help"))
 async def help_command_handler(message: Message):
     """Обработчик команды /help (поддержка)"""
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="Главное меню", callback_data="main_menu")]
-        ]
-    )
+    keyboard = get_to_main_menu_keyboard()
     
     await message.answer(
         "<b>💬 Поддержка</b>\n\n"
@@ -296,11 +258,37 @@ async def help_command_handler(message: Message):
         reply_markup=keyboard
     )
 
+def parse_stats_range(args: str = None):
+    """
+    Разбирает период для /stats: '7d', '24h', 'YYYY-MM-DD' или 'YYYY-MM-DD YYYY-MM-DD'
+
+    Возвращает (start, end, подпись) в UTC или None, если формат не распознан.
+    """
+    now = datetime.utcnow()
+    parts = (args or "7d").split()
+    try:
+        if len(parts) == 1 and parts[0][-1:] in ("d", "h") and parts[0][:-1].isdigit():
+            amount = int(parts[0][:-1])
+            if amount <= 0:
+                return None
+            delta = timedelta(days=amount) if parts[0].endswith("d") else timedelta(hours=amount)
+            unit = "дн." if parts[0].endswith("d") else "ч."
+            return now - delta, now, f"за {amount} {unit}"
+        if len(parts) in (1, 2):
+            first = datetime.strptime(parts[0], "%Y-%m-%d")
+            last = datetime.strptime(parts[-1], "%Y-%m-%d")
+            if last < first:
+                return None
+            label = f"за {parts[0]}" if first == last else f"с {parts[0]} по {parts[-1]}"
+            return first, min(last + timedelta(days=1), now), label
+    except ValueError:
+        return None
+    return None
+
+
 @router.message(Command("stats"))
-async def stats_command_handler(message: Message):
-    """Обработчик команды /stats - статистика бота (только для админов)"""
-    from database.database import Database
-    
+async def stats_command_handler(message: Message, command: CommandObject, outbound_limiter=None, reconciler=None):
+    """Обработчик команды /stats [период] - статистика бота (только для админов)"""
     # Список ID администраторов (замени на свой)
     ADMIN_IDS = [6397535545]  # Твой user_id
     
@@ -308,33 +296,50 @@ async def stats_command_handler(message: Message):
         await message.answer("❌ У вас нет доступа к статистике")
         return
     
-    db = Database()
-    
-    # Собираем статистику
-    total_users = db.get_total_users_count()
-    new_users_7d = db.get_new_users_count(days=7)
-    active_users_7d = db.get_active_users_count(days=7)
-    
-    total_generations = db.get_total_generations_count()
-    generations_by_type = db.get_generations_by_type()
+    period = parse_stats_range(command.args)
+    if period is None:
+        await message.answer(
+            "❌ Не удалось разобрать период\n\n"
+            "Примеры: <code>/stats</code>, <code>/stats 30d</code>, <code>/stats 24h</code>, "
+            "<code>/stats 2025-01-01 2025-01-31</code>",
+            parse_mode="HTML"
+        )
+        return
+    start, end, period_label = period
     
-    total_payments = db.get_payments_count()
-    total_earnings = db.get_total_payments_sum()
-    earnings_7d = db.get_recent_payments_sum(days=7)
+    def collect_stats():
+        db = Database()
+        return db.get_stats_totals(), db.get_range_stats(start, end)
     
-    referral_stats = db.get_referral_stats_total()
+    # Собираем статистику в потоках пула чтения, не блокируя event loop и запись платежей
+    stats, period_stats = await read_pool.run(collect_stats)
+    total_users = stats['total_users']
+    total_generations = stats['total_generations']
+    generations_by_type = stats['generations_by_type']
+    total_payments = stats['total_payments']
+    total_earnings = stats['total_earnings']
+    referral_stats = stats['referral_stats']
+    cache_stats = user_cache.stats()
     
     # Генерации по типам
     photo_count = generations_by_type.get('photo_animation', 0)
     video_count = generations_by_type.get('video_generation', 0)
     edit_count = generations_by_type.get('image_editing', 0)
     
+    period_types = "".join(
+        f"    ◦ {generation_type}: <b>{count}</b>\n"
+        for generation_type, count in sorted(period_stats['generations_by_type'].items(), key=lambda item: -item[1])
+    )
+    period_models = "".join(
+        f"    ◦ {model}: <b>{count}</b>\n"
+        for model, count in sorted(period_stats['generations_by_model'].items(), key=lambda item: -item[1])
+    )
+    
     text = (
         "<b>📊 Статистика бота</b>\n\n"
         "<b>👥 Пользователи:</b>\n"
         f"  • Всего: <b>{total_users}</b>\n"
-        f"  • Новых за 7 дней: <b>{new_users_7d}</b>\n"
-        f"  • Активных за 7 дней: <b>{active_users_7d}</b>\n\n"
+        f"  • Приглашено рефералами: <b>{referral_stats['total_referrals']}</b>\n\n"
         "<b>🎨 Генерации:</b>\n"
         f"  • Всего: <b>{total_generations}</b>\n"
         f"  • Оживление фото: <b>{photo_count}</b>\n"
@@ -343,10 +348,36 @@ async def stats_command_handler(message: Message):
         "<b>💰 Платежи:</b>\n"
         f"  • Всего платежей: <b>{total_payments}</b>\n"
         f"  • Всего заработано: <b>{total_earnings:.2f} ₽</b>\n"
-        f"  • За 7 дней: <b>{earnings_7d:.2f} ₽</b>\n\n"
-        "<b>🔗 Рефералы:</b>\n"
-        f"  • Всего приглашено: <b>{referral_stats['total_referrals']}</b>\n"
-        f"  • Выплачено рефералам: <b>{referral_stats['total_earnings']:.2f} ₽</b>"
+        f"  • Выплачено рефералам: <b>{referral_stats['total_earnings']:.2f} ₽</b>\n\n"
+        f"<b>📅 Период {period_label}:</b>\n"
+        f"  • Новых пользователей: <b>{period_stats['new_users']}</b>\n"
+        f"  • Активных в сутки (в среднем): <b>{period_stats['active_users_per_day']:.1f}</b>\n"
+        f"  • Генераций: <b>{period_stats['generations']}</b>\n"
+        f"{period_types}"
+        + (f"  • По моделям:\n{period_models}" if period_models else "") +
+        f"  • Платежей: <b>{period_stats['payments']}</b> на <b>{period_stats['revenue']:.2f} ₽</b>\n"
+        f"  • Выплачено рефералам: <b>{period_stats['referral_payouts']:.2f} ₽</b>\n\n"
+        "<b>⚙️ Кэш пользователей:</b>\n"
+        f"  • Попаданий: <b>{cache_stats['hit_rate']:.0%}</b> ({cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']})\n"
+        f"  • Записей: <b>{cache_stats['size']}</b>"
     )
+    if outbound_limiter is not None:
+        sending = outbound_limiter.stats()
+        text += (
+            "\n\n<b>📤 Отправка в Telegram:</b>\n"
+            f"  • Отправлено: <b>{sending['sent']}</b>\n"
+            f"  • Повторов после 429: <b>{sending['retried']}</b>\n"
+            f"  • Не отправлено: <b>{sending['dropped']}</b>\n"
+            f"  • Чатов на паузе: <b>{sending['paused_chats']}</b>"
+        )
+    if reconciler is not None:
+        reconcile = reconciler.stats()
+        text += (
+            "\n\n<b>🔄 Сверка платежей:</b>\n"
+            f"  • Запусков: <b>{reconcile['runs']}</b>, последний за <b>{reconcile['last_run_duration']:.1f} с</b>\n"
+            f"  • Проверено: <b>{reconcile['checked']}</b>\n"
+            f"  • Восстановлено: <b>{reconcile['recovered']}</b>, отменено: <b>{reconcile['canceled']}</b>\n"
+            f"  • Ошибок: <b>{reconcile['errors']}</b>"
+        )
     
     await message.answer(text, parse_mode="HTML")
\ No newline at end of file
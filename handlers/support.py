@@ -1,17 +1,15 @@
-from aiogram import Router, F
-from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram import Router
+from aiogram.types import CallbackQuery
+from keyboards.inline import get_to_main_menu_keyboard
+from utils.callback_index import callback_index
 
 router = Router()
 
 
-@router.callback_query(F.data == "support")
+@callback_index.exact("support")
 async def support_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Написать в поддержку'"""
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="Главное меню", callback_data="main_menu")]
-        ]
-    )
+    keyboard = get_to_main_menu_keyboard()
     
     await callback.message.edit_text(
         "<b>💬 Поддержка</b>\n\n"
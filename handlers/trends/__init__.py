@@ -1,46 +1,28 @@
-from aiogram import Router, F
-from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
-from database.database import Database
+from aiogram import Router
+from aiogram.types import CallbackQuery
+from utils.callback_index import callback_index
+from database.database import Database, db_call
 from keyboards.inline import get_trends_keyboard
-from .handler import router as handler_router
-from .macbook import router as macbook_router
-from .bouquet import router as bouquet_router
-from .snow_angel import router as snow_angel_router
-from .snowboard import router as snowboard_router
-from .wall_portrait import router as wall_portrait_router
-from .loving_gaze import router as loving_gaze_router
-from .swords import router as swords_router
-from .heart_building import router as heart_building_router
-from .car import router as car_router
-from .scream import router as scream_router
-from .avatar import router as avatar_router
-from .love_is import router as love_is_router
+from .engine import router as engine_router
+from .registry import TREND_PAGES
 
 # Главный роутер для трендов
 router = Router()
 
-# Подключаем все роутеры
-router.include_router(handler_router)
-router.include_router(macbook_router)
-router.include_router(bouquet_router)
-router.include_router(snow_angel_router)
-router.include_router(snowboard_router)
-router.include_router(wall_portrait_router)
-router.include_router(loving_gaze_router)
-router.include_router(swords_router)
-router.include_router(heart_building_router)
-router.include_router(car_router)
-router.include_router(scream_router)
-router.include_router(avatar_router)
-router.include_router(love_is_router)
+# Все тренды обслуживает один движок, описания трендов - в registry.py
+router.include_router(engine_router)
 
+TREND_PAGE_CALLBACKS = {"trends": 1}
+TREND_PAGE_CALLBACKS.update({f"trends_page_{page}": page for page in range(2, TREND_PAGES + 1)})
 
-@router.callback_query(F.data == "trends")
+
+@callback_index.exact(*TREND_PAGE_CALLBACKS)
 async def trends_handler(callback: CallbackQuery):
-    """Обработчик кнопки 'Тренды'"""
+    """Обработчик кнопки 'Тренды' и переключения страниц трендов"""
+    page = TREND_PAGE_CALLBACKS.get(callback.data, 1)
     user_id = callback.from_user.id
     db = Database()
-    generations = db.get_user_generations(user_id)
+    generations = await db_call(db.get_user_generations, user_id)
     
     try:
         await callback.message.delete()
@@ -53,37 +35,6 @@ async def trends_handler(callback: CallbackQuery):
         f"Выберите тренд, который лучше всего вам подходит 💫\n\n"
         f"{generation_text}",
         parse_mode="HTML",
-        reply_markup=get_trends_keyboard(page=1)
+        reply_markup=get_trends_keyboard(page=page)
     )
     await callback.answer()
-
-@router.callback_query(F.data == "trends_page_2")
-async def trends_page_2_handler(callback: CallbackQuery):
-    """Обработчик кнопки 'Следующая страница' в трендах"""
-    user_id = callback.from_user.id
-    db = Database()
-    generations = db.get_user_generations(user_id)
-
-    try:
-        await callback.message.delete()
-    except:
-        pass
-
-    generation_text = f"<blockquote>⚡ У вас осталось: {generations} генераций</blockquote>"
-
-    await callback.message.answer(
-        f"Выберите тренд, который лучше всего вам подходит 💫\n\n"
-        f"{generation_text}",
-        parse_mode="HTML",
-        reply_markup=InlineKeyboardMarkup(
-            inline_keyboard=[
-                [
-                    InlineKeyboardButton(text="Я аватар", callback_data="trend_avatar"),
-                    InlineKeyboardButton(text="Именной букет", callback_data="trend_bouquet")
-                ],
-                [InlineKeyboardButton(text="← Предыдущая страница", callback_data="trends")],
-                [InlineKeyboardButton(text="← Главное меню", callback_data="main_menu")]
-            ]
-        )
-    )
-    await callback.answer()
\ No newline at end of file
@@ -0,0 +1,394 @@
+from aiogram import Router, F
+from aiogram.types import (
+    CallbackQuery, Message, URLInputFile, BufferedInputFile
+)
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from database.database import Database, db_call
+from keyboards.inline import (
+    get_trends_keyboard,
+    get_trend_aspect_ratio_keyboard,
+    get_trend_model_selection_keyboard,
+    get_back_keyboard,
+    get_buy_generations_keyboard
+)
+from utils.callback_index import callback_index
+from utils.nano_banana_edit_client import NanoBananaEditClient
+from utils.image_edit_client import ImageEditClient
+from utils.progress import progress_reporter
+from .registry import TRENDS, TRENDS_BY_CALLBACK
+import aiohttp
+import traceback
+from PIL import Image
+from io import BytesIO
+
+router = Router()
+
+ASPECT_MAP = {
+    "trend_aspect_16_9": "16:9",
+    "trend_aspect_9_16": "9:16",
+    "trend_aspect_1_1": "1:1"
+}
+
+
+def generations_text(count: int) -> str:
+    """'1 генерация', '4 генерации', '5 генераций'"""
+    if count % 10 == 1 and count % 100 != 11:
+        word = "генерация"
+    elif 2 <= count % 10 <= 4 and not 12 <= count % 100 <= 14:
+        word = "генерации"
+    else:
+        word = "генераций"
+    return f"{count} {word}"
+
+
+class TrendStates(StatesGroup):
+    """Общие состояния для всех трендов (сам тренд хранится в данных FSM)"""
+    waiting_for_photo = State()
+    waiting_for_input = State()
+    waiting_for_aspect = State()
+    waiting_for_model = State()
+
+
+async def ask_aspect_ratio(message: Message, state: FSMContext):
+    """Переходит к выбору соотношения сторон"""
+    await message.answer(
+        "📐 Выберите <b>соотношение сторон</b> для вашего фото:",
+        parse_mode="HTML",
+        reply_markup=get_trend_aspect_ratio_keyboard()
+    )
+    await state.set_state(TrendStates.waiting_for_aspect)
+
+
+async def ask_trend_input(message: Message, state: FSMContext, trend, input_index: int):
+    """Запрашивает очередной дополнительный ввод тренда"""
+    keyboard = get_back_keyboard("trends", text="Отмена")
+
+    await message.answer(
+        trend.inputs[input_index].request_text,
+        parse_mode="HTML",
+        reply_markup=keyboard
+    )
+    await state.update_data(input_index=input_index)
+    await state.set_state(TrendStates.waiting_for_input)
+
+
+@callback_index.exact(*TRENDS_BY_CALLBACK)
+async def trend_select_handler(callback: CallbackQuery, state: FSMContext):
+    """Выбор тренда: показываем пример и ждём фото"""
+    trend = TRENDS_BY_CALLBACK[callback.data]
+
+    keyboard = get_back_keyboard(trend.back_to)
+
+    try:
+        await callback.message.delete()
+    except:
+        pass
+
+    await callback.message.answer_photo(
+        photo=trend.photo_file_id,
+        caption=(
+            "<b>Пример того, что у вас получится ⤴️</b>\n\n"
+            "Если вы готовы — <b><i>присылайте свою фотографию</i></b>, и мы с радостью её отредактируем 💫"
+        ),
+        parse_mode="HTML",
+        reply_markup=keyboard
+    )
+
+    await state.set_data({"trend_key": trend.key})
+    await state.set_state(TrendStates.waiting_for_photo)
+    await callback.answer()
+
+
+@router.message(TrendStates.waiting_for_photo, F.photo)
+async def process_trend_photo(message: Message, state: FSMContext, bot):
+    user_id = message.from_user.id
+    data = await state.get_data()
+    trend = TRENDS[data["trend_key"]]
+
+    photo = message.photo[-1]
+    file = await bot.get_file(photo.file_id)
+    photo_url = f"https://api.telegram.org/file/bot{bot.token}/{file.file_path}"
+
+    print(f"🎨 User {user_id} - {trend.title} trend photo: {photo_url}")
+
+    await state.update_data(photo_url=photo_url)
+
+    if trend.inputs:
+        await ask_trend_input(message, state, trend, 0)
+    else:
+        await ask_aspect_ratio(message, state)
+
+
+@router.message(TrendStates.waiting_for_input, F.text)
+async def process_trend_input(message: Message, state: FSMContext):
+    data = await state.get_data()
+    trend = TRENDS[data["trend_key"]]
+    input_index = data.get("input_index", 0)
+    trend_input = trend.inputs[input_index]
+
+    value = message.text.strip()
+    print(f"🎨 User {message.from_user.id} - {trend.title} {trend_input.key}: {value}")
+
+    await state.update_data({trend_input.key: value})
+
+    if input_index + 1 < len(trend.inputs):
+        await ask_trend_input(message, state, trend, input_index + 1)
+    else:
+        await ask_aspect_ratio(message, state)
+
+
+@router.callback_query(TrendStates.waiting_for_aspect, F.data.in_(ASPECT_MAP))
+async def process_trend_aspect(callback: CallbackQuery, state: FSMContext):
+    await state.update_data(aspect_ratio=ASPECT_MAP[callback.data])
+    trend = TRENDS[(await state.get_data())["trend_key"]]
+
+    user_id = callback.from_user.id
+    db = Database()
+    generations = await db_call(db.get_user_generations, user_id)
+
+    await callback.message.answer(
+        "<b>🤖 Выбор модели генерации</b>\n\n"
+        "<b>Активная модель: Стандартная</b>\n\n"
+        "<b>🌟 Стандартная (Nano Banana)</b>\n"
+        f"• Цена: <b><i>{generations_text(trend.standard_cost)}</i></b>\n"
+        "• Качество: <b><i>стабильно хорошее</i></b>\n"
+        "• Скорость: <b><i>молниеносная ⚡</i></b>\n\n"
+        "<b>🚀 Профессиональная (Nano Banana Pro)</b>\n"
+        f"• Цена: <b><i>{generations_text(trend.pro_cost)}</i></b>\n"
+        "• Разрешение: <b><i>ультра-чёткое 4K</i></b>\n"
+        "• Качество: <b><i>максимальный уровень детализации</i></b>\n"
+        "• Промты до <b><i>5000 символов</i></b>\n"
+        "• <b><i>Продвинутое понимание текста</i></b> для точных результатов\n\n"
+        f"<blockquote>⚡ У вас осталось: {generations} генераций</blockquote>",
+        parse_mode="HTML",
+        reply_markup=get_trend_model_selection_keyboard(generations)
+    )
+
+    await state.set_state(TrendStates.waiting_for_model)
+    await callback.answer()
+
+
+async def prepare_photo(result_url: str):
+    """Скачивает результат и сжимает его, если он больше лимита Telegram на фото"""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(result_url) as response:
+            image_data = await response.read()
+            original_size_mb = len(image_data) / (1024 * 1024)
+            print(f"   Размер: {original_size_mb:.2f} MB")
+
+    if original_size_mb <= 9.0:
+        return URLInputFile(result_url)
+
+    print("   🔧 Сжимаем изображение...")
+    img = Image.open(BytesIO(image_data))
+
+    if img.mode in ('RGBA', 'P', 'LA'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
+        img = background
+
+    output = BytesIO()
+    quality = 85
+    while quality > 20:
+        output.seek(0)
+        output.truncate()
+        img.save(output, format='JPEG', quality=quality, optimize=True)
+        size_mb = output.tell() / (1024 * 1024)
+        if size_mb <= 9.0:
+            break
+        quality -= 5
+
+    output.seek(0)
+    print(f"   ✅ Сжато до {size_mb:.2f} MB")
+    return BufferedInputFile(output.read(), filename="image.jpg")
+
+
+@router.callback_query(TrendStates.waiting_for_model, F.data.in_(["trend_model_standard", "trend_model_pro"]))
+async def process_trend_model(callback: CallbackQuery, state: FSMContext, bot):
+    await callback.answer()
+
+    try:
+        await callback.message.delete()
+    except:
+        pass
+
+    data = await state.get_data()
+    trend = TRENDS.get(data.get("trend_key"))
+    photo_url = data.get("photo_url")
+    aspect_ratio = data.get("aspect_ratio")
+    chat_id = callback.message.chat.id
+
+    if (not trend or not photo_url or not aspect_ratio
+            or any(not data.get(trend_input.key) for trend_input in trend.inputs)):
+        await bot.send_message(
+            chat_id=chat_id,
+            text="❌ Ошибка: данные не найдены. Попробуйте заново."
+        )
+        await state.clear()
+        return
+
+    model_type = "standard" if callback.data == "trend_model_standard" else "pro"
+    generations_cost = trend.cost(model_type)
+
+    user_id = callback.from_user.id
+
+    db = Database()
+    generations = await db_call(db.get_user_generations, user_id)
+
+    if generations < generations_cost:
+        keyboard = get_buy_generations_keyboard("trends")
+
+        await bot.send_message(
+            chat_id=chat_id,
+            text="У вас закончились генерации 😔\n\n"
+            f"<blockquote>⚡ Доступно: {generations} генераций\n"
+            f"🎨 Выбранная модель требует: {generations_cost} генерации</blockquote>\n\n"
+            "Купите пакет генераций, чтобы продолжить!",
+            parse_mode="HTML",
+            reply_markup=keyboard
+        )
+        await state.clear()
+        return
+
+    print(f"🎨 User {user_id} - {trend.title}, model: {model_type}, aspect ratio: {aspect_ratio}")
+
+    prompt = trend.build_prompt(data)
+    if trend.inputs:
+        print(f"📝 Final prompt: {prompt}")
+
+    processing_msg = await bot.send_message(
+        chat_id=chat_id,
+        text="⭐ Начинается редактирование, пожалуйста подождите..."
+    )
+
+    try:
+        if model_type == "standard":
+            edit_client = NanoBananaEditClient()
+            task_id = await edit_client.create_edit_task(
+                prompt=prompt,
+                image_urls=[photo_url],
+                image_size=aspect_ratio,
+                output_format="png"
+            )
+        else:
+            edit_client = ImageEditClient()
+            task_id = await edit_client.create_edit_task(
+                prompt=prompt,
+                image_urls=[photo_url],
+                aspect_ratio=aspect_ratio,
+                resolution="2K",
+                output_format="png"
+            )
+
+        if not task_id:
+            await processing_msg.edit_text(
+                "❌ Произошла ошибка при создании задачи. Попробуйте позже."
+            )
+            await state.clear()
+            return
+
+        print(f"✅ Task created: {task_id}")
+
+        if model_type == "pro":
+            # Для Pro модели: увеличенный таймаут и показ прогресса
+            try:
+                result_url = await edit_client.wait_for_result(
+                    task_id,
+                    max_attempts=240,  # 20 минут для Pro
+                    delay=5,
+                    progress_callback=progress_reporter.callback(
+                        processing_msg,
+                        title="⭐ Идет генерация в высоком качестве...",
+                        hint="💡 Профессиональная модель создает изображения в 4K, "
+                             "это требует больше времени, но результат того стоит!"
+                    )
+                )
+            finally:
+                progress_reporter.finish(processing_msg)
+        else:
+            result_url = await edit_client.wait_for_result(task_id, max_attempts=120, delay=5)
+
+        if not result_url:
+            await processing_msg.edit_text(
+                "😔 Что-то пошло не так\n\n"
+                "Не удалось отредактировать фото. Возможные причины:\n"
+                "• Превышено время ожидания\n"
+                "• Временные проблемы с сервером\n\n"
+                "💡 Попробуйте ещё раз через пару минут\n\n"
+                "💛 Не переживайте, генерация не списана"
+            )
+        elif result_url == "MODERATION_ERROR":
+            await processing_msg.edit_text(
+                "😔 Упс! Не получилось отредактировать фото\n\n"
+                "Система безопасности заблокировала запрос.\n\n"
+                "Частые причины:\n"
+                "• На фото известная личность\n"
+                "• Неподходящий контент\n\n"
+                "💡 Совет: используйте обычные фотографии\n\n"
+                "💛 Не переживайте, генерация не списана"
+            )
+        elif result_url == "TIMEOUT_ERROR":
+            await processing_msg.edit_text(
+                "⏱️ Время ожидания истекло\n\n"
+                "Сервер генерации не успел обработать запрос.\n\n"
+                "Возможные причины:\n"
+                "• Очень высокая нагрузка на сервер\n"
+                "• Слишком сложное изображение\n\n"
+                "💡 Попробуйте:\n"
+                "• Подождать 5-10 минут и попробовать снова\n"
+                "• Использовать стандартную модель (она быстрее)\n\n"
+                "💛 Не переживайте, генерация не списана"
+            )
+        else:
+            await db_call(db.subtract_generations, user_id, generations_cost, reason=trend.generation_type, ref_id=task_id)
+
+            print(f"✅ Generation successful! Result URL: {result_url}")
+
+            try:
+                print(f"📤 Отправка изображения: {result_url}")
+                photo_file = await prepare_photo(result_url)
+
+                await bot.send_photo(
+                    chat_id=chat_id,
+                    photo=photo_file,
+                    caption="✨ Ваше фото готово!",
+                    request_timeout=180
+                )
+                await processing_msg.delete()
+
+                print("✅ Photo sent successfully!")
+
+                await db_call(db.save_generation, user_id, trend.generation_type, result_url, prompt, model=model_type)
+
+                generations = await db_call(db.get_user_generations, user_id)
+
+                generation_text = f"<blockquote>⚡ У вас осталось: {generations} генераций"
+                if generations == 1 and not await db_call(db.has_purchased_generations, user_id):
+                    generation_text += "\n🎨 Вам доступна 1 бесплатная генерация"
+                generation_text += "</blockquote>"
+
+                await bot.send_message(
+                    chat_id=chat_id,
+                    text=f"Выберите тренд, который лучше всего вам подходит 💫\n\n{generation_text}",
+                    parse_mode="HTML",
+                    reply_markup=get_trends_keyboard(page=1)
+                )
+
+            except Exception as e:
+                print(f"❌ Error sending photo: {e}")
+                await processing_msg.edit_text(
+                    "❌ Не удалось отправить фото. Попробуйте позже."
+                )
+
+    except Exception as e:
+        print(f"❌ Generation error: {e}")
+        traceback.print_exc()
+
+        await processing_msg.edit_text(
+            "❌ Произошла ошибка при редактировании. Попробуйте позже."
+        )
+
+    await state.clear()
@@ -1,358 +0,0 @@
-from aiogram import Router, F
-from aiogram.types import CallbackQuery, Message, InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.fsm.context import FSMContext
-from aiogram.fsm.state import State, StatesGroup
-
-router = Router()
-
-PHOTO_FILE_ID = "AgACAgIAAxkBAAIP7mlvXSyuqf8inHSAalwgZt89fZUTAAIKEGsbSD94S6EX2XZ3ilgAAQEAAwIAA3kAAzgE"
-
-HEART_BUILDING_PROMPT = (
-    "Create a realistic photo without changing your face. "
-    "The photo is taken against the backdrop of a building. "
-    "The image is done in an urban aesthetic style. "
-    "The model, a girl in dark, loose clothing, stands in a snowy wasteland. "
-    "A modern multi-story building towers in the background. "
-    "The main detail is the building's windows, illuminated with a bright pink light "
-    "so that they form the outline of a huge heart. "
-    "The photo conveys a melancholic, romantic urban mood"
-)
-
-
-class HeartBuildingStates(StatesGroup):
-    waiting_for_photo = State()
-    waiting_for_aspect = State()
-    waiting_for_model = State()
-
-
-@router.callback_query(F.data == "trend_heart_building")
-async def trend_heart_building_handler(callback: CallbackQuery, state: FSMContext):
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="Назад", callback_data="trends")]
-        ]
-    )
-    
-    try:
-        await callback.message.delete()
-    except:
-        pass
-    
-    await callback.message.answer_photo(
-        photo=PHOTO_FILE_ID,
-        caption=(
-            "<b>Пример того, что у вас получится ⤴️</b>\n\n"
-            "Если вы готовы — <b><i>присылайте свою фотографию</i></b>, и мы с радостью её отредактируем 💫"
-        ),
-        parse_mode="HTML",
-        reply_markup=keyboard
-    )
-    
-    await state.set_state(HeartBuildingStates.waiting_for_photo)
-    await callback.answer()
-
-
-@router.message(HeartBuildingStates.waiting_for_photo, F.photo)
-async def process_heart_building_photo(message: Message, state: FSMContext, bot):
-    user_id = message.from_user.id
-    
-    photo = message.photo[-1]
-    file = await bot.get_file(photo.file_id)
-    photo_url = f"https://api.telegram.org/file/bot{bot.token}/{file.file_path}"
-    
-    print(f"🎨 User {user_id} - Heart Building trend photo: {photo_url}")
-    
-    await state.update_data(photo_url=photo_url)
-    
-    from keyboards.inline import get_trend_aspect_ratio_keyboard
-    
-    await message.answer(
-        "📐 Выберите <b>соотношение сторон</b> для вашего фото:",
-        parse_mode="HTML",
-        reply_markup=get_trend_aspect_ratio_keyboard()
-    )
-    
-    await state.set_state(HeartBuildingStates.waiting_for_aspect)
-
-
-@router.callback_query(HeartBuildingStates.waiting_for_aspect, F.data.in_(["trend_aspect_16_9", "trend_aspect_9_16", "trend_aspect_1_1"]))
-async def process_heart_building_aspect(callback: CallbackQuery, state: FSMContext):
-    from database.database import Database
-    
-    aspect_map = {
-        "trend_aspect_16_9": "16:9",
-        "trend_aspect_9_16": "9:16",
-        "trend_aspect_1_1": "1:1"
-    }
-    
-    aspect_ratio = aspect_map[callback.data]
-    await state.update_data(aspect_ratio=aspect_ratio)
-    
-    user_id = callback.from_user.id
-    db = Database()
-    generations = db.get_user_generations(user_id)
-    
-    from keyboards.inline import get_trend_model_selection_keyboard
-    
-    await callback.message.answer(
-        "<b>🤖 Выбор модели генерации</b>\n\n"
-        "<b>Активная модель: Стандартная</b>\n\n"
-        "<b>🌟 Стандартная (Nano Banana)</b>\n"
-        "• Цена: <b><i>1 генерация</i></b>\n"
-        "• Качество: <b><i>стабильно хорошее</i></b>\n"
-        "• Скорость: <b><i>молниеносная ⚡</i></b>\n\n"
-        "<b>🚀 Профессиональная (Nano Banana Pro)</b>\n"
-        "• Цена: <b><i>4 генерации</i></b>\n"
-        "• Разрешение: <b><i>ультра-чёткое 4K</i></b>\n"
-        "• Качество: <b><i>максимальный уровень детализации</i></b>\n"
-        "• Промты до <b><i>5000 символов</i></b>\n"
-        "• <b><i>Продвинутое понимание текста</i></b> для точных результатов\n\n"
-        f"<blockquote>⚡ У вас осталось: {generations} генераций</blockquote>",
-        parse_mode="HTML",
-        reply_markup=get_trend_model_selection_keyboard(generations)
-    )
-    
-    await state.set_state(HeartBuildingStates.waiting_for_model)
-    await callback.answer()
-
-
-@router.callback_query(HeartBuildingStates.waiting_for_model, F.data.in_(["trend_model_standard", "trend_model_pro"]))
-async def process_heart_building_model(callback: CallbackQuery, state: FSMContext, bot):
-    await callback.answer()
-    from database.database import Database
-    import aiohttp
-    from PIL import Image
-    from io import BytesIO
-    from aiogram.types import URLInputFile, BufferedInputFile
-        
-    
-    
-
-    try:
-        await callback.message.delete()
-    except:
-        pass
-
-    model_type = "standard" if callback.data == "trend_model_standard" else "pro"
-    generations_cost = 1 if model_type == "standard" else 4
-
-    data = await state.get_data()
-    photo_url = data.get("photo_url")
-    aspect_ratio = data.get("aspect_ratio")
-
-    if not photo_url or not aspect_ratio:
-        await bot.send_message(
-            chat_id=callback.message.chat.id,
-            text="❌ Ошибка: фото не найдено. Попробуйте заново."
-        )   
-        await state.clear()
-        return
-
-    user_id = callback.from_user.id
-
-    db = Database()
-    generations = db.get_user_generations(user_id)
-
-    if generations < generations_cost:
-        keyboard = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [InlineKeyboardButton(text="⚡ Купить генерации", callback_data="buy_generations_from_trends")],
-                [InlineKeyboardButton(text="Главное меню", callback_data="main_menu")]
-            ]
-        )
-    
-        await bot.send_message(
-            chat_id=callback.message.chat.id,
-            text="У вас закончились генерации 😔\n\n"
-            f"<blockquote>⚡ Доступно: {generations} генераций\n"
-            f"🎨 Выбранная модель требует: {generations_cost} генерации</blockquote>\n\n"
-            "Купите пакет генераций, чтобы продолжить!",
-            parse_mode="HTML",
-            reply_markup=keyboard
-        )
-        await state.clear()
-        return
-
-    print(f"🎨 User {user_id} - Selected model: {model_type}, aspect ratio: {aspect_ratio}")
-
-    processing_msg = await bot.send_message(
-        chat_id=callback.message.chat.id,
-        text="⭐ Начинается редактирование, пожалуйста подождите..."
-    )
-    
-    try:
-        if model_type == "standard":
-            from utils.nano_banana_edit_client import NanoBananaEditClient
-            edit_client = NanoBananaEditClient()
-            
-            task_id = await edit_client.create_edit_task(
-                prompt=HEART_BUILDING_PROMPT,
-                image_urls=[photo_url],
-                image_size=aspect_ratio,
-                output_format="png"
-            )
-        else:
-            from utils.image_edit_client import ImageEditClient
-            edit_client = ImageEditClient()
-            
-            task_id = await edit_client.create_edit_task(
-                prompt=HEART_BUILDING_PROMPT,
-                image_urls=[photo_url],
-                aspect_ratio=aspect_ratio,
-                resolution="2K",
-                output_format="png"
-            )
-        
-        if not task_id:
-            await processing_msg.edit_text(
-                "❌ Произошла ошибка при создании задачи. Попробуйте позже."
-            )
-            await state.clear()
-            return
-        
-        print(f"✅ Task created: {task_id}")
-        
-        # Разные таймауты и прогресс для разных моделей
-        if model_type == "pro":
-            # Для Pro модели: увеличенный таймаут и показ прогресса
-            async def update_progress(elapsed_min, remaining_min):
-                """Обновляет сообщение с прогрессом для пользователя"""
-                try:
-                    await processing_msg.edit_text(
-                        f"⭐ Идет генерация в высоком качестве...\n\n"
-                        f"⏱️ Прошло: {elapsed_min} мин\n"
-                        f"⏳ Осталось примерно: {remaining_min} мин\n\n"
-                        f"💡 Профессиональная модель создает изображения в 4K, "
-                        f"это требует больше времени, но результат того стоит!"
-                    )
-                except:
-                    pass
-            
-            result_url = await edit_client.wait_for_result(
-                task_id, 
-                max_attempts=240,  # 20 минут для Pro
-                delay=5,
-                progress_callback=update_progress
-            )
-        else:
-            # Для Standard модели: обычный таймаут без прогресса
-            result_url = await edit_client.wait_for_result(task_id, max_attempts=120, delay=5)
-        
-        if result_url:
-            if result_url == "MODERATION_ERROR":
-                await processing_msg.edit_text(
-                    "😔 Упс! Не получилось отредактировать фото\n\n"
-                    "Система безопасности заблокировала запрос.\n\n"
-                    "Частые причины:\n"
-                    "• На фото известная личность\n"
-                    "• Неподходящий контент\n\n"
-                    "💡 Совет: используйте обычные фотографии\n\n"
-                    "💛 Не переживайте, генерация не списана"
-                )
-            elif result_url == "TIMEOUT_ERROR":
-                await processing_msg.edit_text(
-                    "⏱️ Время ожидания истекло\n\n"
-                    "Сервер генерации не успел обработать запрос.\n\n"
-                    "Возможные причины:\n"
-                    "• Очень высокая нагрузка на сервер\n"
-                    "• Слишком сложное изображение\n\n"
-                    "💡 Попробуйте:\n"
-                    "• Подождать 5-10 минут и попробовать снова\n"
-                    "• Использовать стандартную модель (она быстрее)\n\n"
-                    "💛 Не переживайте, генерация не списана"
-                )
-            else:
-                # Успешная генерация - списываем генерации
-                db.subtract_generations(user_id, generations_cost)
-                
-                print(f"✅ Generation successful! Result URL: {result_url}")
-                
-                try:
-                    print(f"📤 Отправка изображения: {result_url}")
-                    
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(result_url) as response:
-                            image_data = await response.read()
-                            original_size_mb = len(image_data) / (1024 * 1024)
-                            print(f"   Размер: {original_size_mb:.2f} MB")
-                    
-                    if original_size_mb > 9.0:
-                        print(f"   🔧 Сжимаем изображение...")
-                        img = Image.open(BytesIO(image_data))
-                        
-                        if img.mode in ('RGBA', 'P', 'LA'):
-                            background = Image.new('RGB', img.size, (255, 255, 255))
-                            if img.mode == 'P':
-                                img = img.convert('RGBA')
-                            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                            img = background
-                        
-                        output = BytesIO()
-                        quality = 85
-                        while quality > 20:
-                            output.seek(0)
-                            output.truncate()
-                            img.save(output, format='JPEG', quality=quality, optimize=True)
-                            size_mb = output.tell() / (1024 * 1024)
-                            if size_mb <= 9.0:
-                                break
-                            quality -= 5
-                        
-                        output.seek(0)
-                        photo_file = BufferedInputFile(output.read(), filename="image.jpg")
-                        print(f"   ✅ Сжато до {size_mb:.2f} MB")
-                    else:
-                        photo_file = URLInputFile(result_url)
-                    
-                    await bot.send_photo(
-                        chat_id=callback.message.chat.id,
-                        photo=photo_file,
-                        caption="✨ Ваше фото готово!",
-                        request_timeout=180
-                    )
-                    await processing_msg.delete()
-                    
-                    print(f"✅ Photo sent successfully!")
-                    
-                    db.save_generation(user_id, "trend_heart_building", result_url, HEART_BUILDING_PROMPT)
-                    
-                    from keyboards.inline import get_trends_keyboard
-                    generations = db.get_user_generations(user_id)
-                    
-                    generation_text = f"<blockquote>⚡ У вас осталось: {generations} генераций"
-                    if generations == 1 and not db.has_purchased_generations(user_id):
-                        generation_text += "\n🎨 Вам доступна 1 бесплатная генерация"
-                    generation_text += "</blockquote>"
-                    
-                    await bot.send_message(
-                        chat_id=callback.message.chat.id,
-                        text=f"Выберите тренд, который лучше всего вам подходит 💫\n\n{generation_text}",
-                        parse_mode="HTML",
-                        reply_markup=get_trends_keyboard(page=1)
-                    )
-                    
-                except Exception as e:
-                    print(f"❌ Error sending photo: {e}")
-                    await processing_msg.edit_text(
-                        "❌ Не удалось отправить фото. Попробуйте позже."
-                    )
-        else:
-            await processing_msg.edit_text(
-                "😔 Что-то пошло не так\n\n"
-                "Не удалось отредактировать фото. Возможные причины:\n"
-                "• Превышено время ожидания\n"
-                "• Временные проблемы с сервером\n\n"
-                "💡 Попробуйте ещё раз через пару минут\n\n"
-                "💛 Не переживайте, генерация не списана"
-            )
-    
-    except Exception as e:
-        print(f"❌ Generation error: {e}")
-        import traceback
-        traceback.print_exc()
-        
-        await processing_msg.edit_text(
-            "❌ Произошла ошибка при редактировании. Попробуйте позже."
-        )
-    
-    await state.clear()
\ No newline at end of file
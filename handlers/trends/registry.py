@@ -0,0 +1,310 @@
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+
+@dataclass(frozen=True)
+class TrendInput:
+    """Дополнительный текстовый ввод, который тренд запрашивает после фото"""
+    key: str                # ключ в данных FSM
+    request_text: str       # сообщение с просьбой ввести значение
+    placeholder: str        # имя подстановки в шаблоне промпта
+    transform: Optional[Callable[[str], str]] = None
+
+
+@dataclass(frozen=True)
+class Trend:
+    """Описание тренда: всё, чем тренды отличаются друг от друга"""
+    key: str
+    button_text: str
+    title: str
+    photo_file_id: str
+    prompt: str
+    page: int = 1
+    inputs: tuple = field(default_factory=tuple)
+    standard_cost: int = 1
+    pro_cost: int = 4
+
+    @property
+    def callback_data(self) -> str:
+        return f"trend_{self.key}"
+
+    @property
+    def generation_type(self) -> str:
+        return f"trend_{self.key}"
+
+    @property
+    def back_to(self) -> str:
+        return "trends" if self.page == 1 else f"trends_page_{self.page}"
+
+    def cost(self, model_type: str) -> int:
+        return self.standard_cost if model_type == "standard" else self.pro_cost
+
+    def build_prompt(self, data: dict) -> str:
+        """Собирает финальный промпт из шаблона и введённых пользователем значений"""
+        if not self.inputs:
+            return self.prompt
+
+        values = {}
+        for trend_input in self.inputs:
+            value = data[trend_input.key]
+            if trend_input.transform:
+                value = trend_input.transform(value)
+            values[trend_input.placeholder] = value
+        return self.prompt.format(**values)
+
+
+def _name_letters(name: str) -> str:
+    """'Anna' -> '"A", "N", "N", "A"' - по букве на каждый букет"""
+    return ", ".join(f'"{letter}"' for letter in name.upper())
+
+
+MACBOOK_PROMPT = (
+    "Make a vertical 3-frame low-res webcam collage of the same female subject. "
+    "Very dim warm screen lighting, low-light nighttime atmosphere, soft shadows, "
+    "dark cozy mood, grainy noisy Photo Booth vibe, simple warm bedroom background. "
+    "Exaggerated pout, finger near lip, pink camisole with modest neckline, "
+    "collarbones slightly visible, no cleavage, chest fully covered, soft fabric, "
+    "natural look. Shy flirty head tilt, soft expression, pink hearts overlay. "
+    "Dramatic late-night pose, slightly darker camisole with modest neckline "
+    "showing collarbones only, hand near mouth. Keep facial features consistent across all frames."
+)
+
+LOVE_IS_PROMPT_TEMPLATE = (
+    "Recreate the uploaded reference image composition exactly in classic 'Love Is…' comic style. "
+    "Use the uploaded couple photo as face reference and replace the original characters with the two people from the photo while preserving their facial likeness. "
+    "Match the same poses, body positions, proportions and interaction as in the reference image. "
+    "Keep the same cartoon proportions: big heads, small bodies, rounded shapes, simple facial features, blush on cheeks. "
+    "Outfit colors and positions should follow the reference layout. "
+    "Background: white canvas with light blue circular backdrop behind characters. "
+    "Add small red hearts floating above heads exactly like reference. "
+    "Draw thick clean black outlines, flat pastel coloring, smooth shading. "
+    "Title text at top: 'Love is…' in handwritten comic font style. "
+    "Bottom caption placement identical to reference with romantic sentence. "
+    "Poster vertical format, centered characters, vintage Love Is postcard look. "
+    "High resolution illustration, no realism, no 3D, pure 2D cartoon style. "
+    "Bottom caption text in Russian: '{user_text}'"
+)
+
+SNOW_ANGEL_PROMPT = (
+    "A young angelic woman kneeling in fresh snow in a dark winter forest at night. "
+    "She has long blonde hair, slightly wavy, softly framing her face. "
+    "She wears a white satin corset dress with lace sleeves, elegant and delicate. "
+    "She has large white feathered wings attached to her back. "
+    "Knees are on the snow, arms relaxed, one hand lightly touching her hair. "
+    "Soft, serene, slightly melancholic expression, eyes gently closed or looking down. "
+    "Snow gently falling around, soft light illuminating her from the front and back, "
+    "creating a subtle glow on the wings and hair. "
+    "High-detail, realistic skin and fabric textures, cinematic lighting, "
+    "slightly cool blue tones with high contrast. "
+    "Soft shadows, depth of field to emphasize subject, ultra-realistic, photo-realistic style."
+)
+
+SNOWBOARD_PROMPT = (
+    "A hyper-realistic night-time iPhone flash photo on the summit of a snowy mountain. "
+    "A woman stands full body in the foreground, holding a snowboard, wearing a snow Red Bull helmet "
+    "and ski mask (face fully visible, eyes uncovered). Technical white jacket and colorful pants. "
+    "A harsh, direct on-camera flash hits the character and nearby snow - blown highlights, hard shadows, raw contrast. "
+    "Behind her, a pink helicopter is lifting off: skids just above the ground, rotors in heavy motion blur, "
+    "snow violently blasted outward. The helicopter fades into darkness and fog as it ascends. "
+    "Snow particles frozen mid-air by flash, uneven exposure, imperfect framing - unmistakable accidental iPhone shot. "
+    "Distant mountains disappear into the night. Natural grain, no cinematic grading, no stylization"
+)
+
+WALL_PORTRAIT_PROMPT = (
+    "Using the attached images as a reference for the girl's face and appearance, "
+    "create a scene in which she stands in a modern art gallery, seen from behind, "
+    "and gazes at a large oil portrait of herself on the wall. "
+    "She should be wearing an elegant black dress. "
+    "The painting should depict the same girl in a realistic and expressive oil painting style, "
+    "depicting her face and upper body with textured brushstrokes and soft colors. "
+    "The gallery wall is clean and white, and a soft spotlight illuminates the artwork, "
+    "creating a professional exhibition atmosphere"
+)
+
+LOVING_GAZE_PROMPT = (
+    "создай изображение на котором парень и девушка с фото сидят вместе в темном месте "
+    "но на них направлена небольшая вспышка фото чб парень сидит чуть отдаленно и позади девушки "
+    "и парень смотрит на девушку влюбленным взглядом а девушка красиво сидит и смотрит влево "
+    "снимок сделан на камеру G7X"
+)
+
+SWORDS_PROMPT = (
+    "Grassy hill covered with short wild grass, flat gray overcast sky, soft dramatic clouds, "
+    "heavy cinematic atmosphere. Three-quarter side low-angle shot, slightly rotated perspective "
+    "for dynamic composition. Dozens of giant matte metal swords planted vertically across the hill, "
+    "creating an epic battlefield memorial scene, some close, some fading into the foggy distance. "
+    "One massive sword directly behind the woman, towering above her. "
+    "Woman sitting on the slope with her back resting against the giant sword, knees slightly bent, "
+    "legs angled downhill. One arm resting on her knee, the other touching the grass for balance. "
+    "Head slightly tilted and turned sideways, calm but powerful expression. "
+    "Light translucent veil trailing behind, flowing in the wind. "
+    "Warm ivory structured dress, matte fabric, elegant heroic silhouette. "
+    "Cinematic lighting, soft contrast, subtle rim light outlining the figure. "
+    "Depth of field with foreground focus, background softly blurred. "
+    "Ultra realistic film still look, near-RAW photo style, slightly warm cinematic color grading, "
+    "high dynamic range."
+)
+
+HEART_BUILDING_PROMPT = (
+    "Create a realistic photo without changing your face. "
+    "The photo is taken against the backdrop of a building. "
+    "The image is done in an urban aesthetic style. "
+    "The model, a girl in dark, loose clothing, stands in a snowy wasteland. "
+    "A modern multi-story building towers in the background. "
+    "The main detail is the building's windows, illuminated with a bright pink light "
+    "so that they form the outline of a huge heart. "
+    "The photo conveys a melancholic, romantic urban mood"
+)
+
+CAR_PROMPT = (
+    "сделай реалистично черно белый портрет будто девушка и парень едут на машине , "
+    "парень за рулём Мерседес а рядом девушка на пассажирском,они смотрят на друг друга влюбленно ,"
+    "девушка подложила левую руку под щеку якобы любуясь парнем,кадр с заднего сиденья формат фото 9:16,"
+    "за окном ночь,фото со вспышкой"
+)
+
+SCREAM_PROMPT = (
+    "Портрет в стиле y2k с атмосферой мечтательности: я лежу на блестящем розовом сатиновом постельном белье ,"
+    "держа в руке большой ретро- телефон с проводом из 90-х .Поза задумчивая,как будто в мечтах ."
+    "Рядом со мной стоит миска с попкорном и раскиданы журналы 90-х На заднем плане,в дверном проёме темного коридора ,"
+    "стоит призрачный убийца Ghostface,частично скрытый в полумраке,и внимательно смотрит на меня"
+)
+
+AVATAR_PROMPT = (
+    "Используй загруженное изображение как точный и обязательный референс. "
+    "НЕ меняй фон, локацию, окружение, задний план, сцену или освещение окружения. Оставь оригинальный фон полностью без изменений. "
+    "НЕ меняй ракурс камеры, НЕ меняй позу, НЕ кадрируй изображение, НЕ приближай лицо и НЕ меняй масштаб. "
+    "Сохрани оригинальную композицию, расстояние камеры, перспективу, пропорции тела и положение человека. "
+    "Преобразуй человека на фото в персонажа из фильма «Аватар» (Na'vi), строго сохраняя пол, рост, телосложение, анатомию и индивидуальные черты внешности. "
+    "Черты лица должны быть полностью сохранены: форма лица, глаза, нос, губы, скулы, челюсть, пропорции и мимика должны максимально совпадать с оригиналом. "
+    "Сделай синюю кожу с биолюминесцентными узорами и стиль Na'vi, оставляя полный рост (full body) и исходные пропорции тела. "
+    "Используй фотореализм, cinematic lighting, ultra-detailed, 8k, realistic textures. "
+    "Одежду оставить без изменений."
+)
+
+BOUQUET_PROMPT_TEMPLATE = (
+    "A girl sits in an apartment at night, surrounded by large, expensive bouquets of white and red roses. "
+    "Each bouquet clearly displays a perfectly formed letter: {name_letters}... "
+    "View from above She sits among them. She looks into the camera. "
+    "She is wearing a stylish, form-fitting black dress. "
+    "Photo taken with a flash on a film camera. Her hair is shiny."
+)
+
+
+# Порядок реестра = порядок кнопок в клавиатуре трендов
+TREND_LIST = (
+    Trend(
+        key="macbook",
+        button_text="Фотки с макбука",
+        title="Macbook",
+        photo_file_id="AgACAgIAAxkBAAIOJWluowS26osrvYk-kJzmuvu3kOUhAAI6FWsbSD9wS-hjRNal4hq1AQADAgADeQADOAQ",
+        prompt=MACBOOK_PROMPT
+    ),
+    Trend(
+        key="love_is",
+        button_text="Love is",
+        title="Love is",
+        photo_file_id="AgACAgIAAxkBAAIejWmAk8U5K8sgERedM7zFQfQeFXh8AALpD2sbe8ABSEV_dksKjR19AQADAgADdwADOAQ",
+        prompt=LOVE_IS_PROMPT_TEMPLATE,
+        inputs=(
+            TrendInput(
+                key="user_text",
+                request_text=(
+                    "💬 Отлично! Теперь <b><i>напишите текст</i></b>, который хотите видеть на фотографии\n\n"
+                    "Например: <i>…когда ты рядом</i>"
+                ),
+                placeholder="user_text"
+            ),
+        )
+    ),
+    Trend(
+        key="snow_angel",
+        button_text="Снежный ангел",
+        title="Snow Angel",
+        photo_file_id="AgACAgIAAxkBAAIOI2luol9rNO9bvPBp1SGe5j5NgEpQAAIwFWsbSD9wS3qnSJ7HUI4-AQADAgADeQADOAQ",
+        prompt=SNOW_ANGEL_PROMPT
+    ),
+    Trend(
+        key="snowboard",
+        button_text="Фотка на сноуборде",
+        title="Snowboard",
+        photo_file_id="AgACAgIAAxkBAAIN9mluoS85_tjYEoGIYuAWOQGDw1G8AAIBFWsbSD9wS_w_3PPNn4KLAQADAgADeQADOAQ",
+        prompt=SNOWBOARD_PROMPT
+    ),
+    Trend(
+        key="wall_portrait",
+        button_text="Портрет на стене",
+        title="Wall Portrait",
+        photo_file_id="AgACAgIAAxkBAAIN_GluoYtjfAKu47OaQKydDYJG9ugvAAIFFWsbSD9wS316h40v-qTMAQADAgADeQADOAQ",
+        prompt=WALL_PORTRAIT_PROMPT
+    ),
+    Trend(
+        key="loving_gaze",
+        button_text="Влюбленный взгляд",
+        title="Loving Gaze",
+        photo_file_id="AgACAgIAAxkBAAIOEmluoi5_aMPaTa4ZSuEmsXXwfLLLAAIoFWsbSD9wS8FHjDFZDSUwAQADAgADeQADOAQ",
+        prompt=LOVING_GAZE_PROMPT
+    ),
+    Trend(
+        key="swords",
+        button_text="Фотка с мечами",
+        title="Swords",
+        photo_file_id="AgACAgIAAxkBAAIOGmluokFN3Ojk5DfeepD-ZVVYb7HhAAItFWsbSD9wS6-RY6BVyNO0AQADAgADeQADOAQ",
+        prompt=SWORDS_PROMPT
+    ),
+    Trend(
+        key="heart_building",
+        button_text="Сердце на здание",
+        title="Heart Building",
+        photo_file_id="AgACAgIAAxkBAAIP7mlvXSyuqf8inHSAalwgZt89fZUTAAIKEGsbSD94S6EX2XZ3ilgAAQEAAwIAA3kAAzgE",
+        prompt=HEART_BUILDING_PROMPT
+    ),
+    Trend(
+        key="car",
+        button_text="Фотка в машине",
+        title="Car",
+        photo_file_id="AgACAgIAAxkBAAIOGGluojp7nbFBKw0xsgaDCclmOxYPAAIsFWsbSD9wSwQtYC8rzqwtAQADAgADeQADOAQ",
+        prompt=CAR_PROMPT
+    ),
+    Trend(
+        key="scream",
+        button_text="Фотка с криком",
+        title="Scream",
+        photo_file_id="AgACAgIAAxkBAAIOFmluojarzIs11Vk7JW8qESYLa8ryAAIrFWsbSD9wS2ezxeJYsvuQAQADAgADeQADOAQ",
+        prompt=SCREAM_PROMPT
+    ),
+    Trend(
+        key="avatar",
+        button_text="Я аватар",
+        title="Avatar",
+        photo_file_id="AgACAgIAAxkBAAIVg2lznnLtuEWuGS1IPJMSXCjwG2GVAALXD2sbcmegS7K6747i6gxlAQADAgADdwADOAQ",
+        prompt=AVATAR_PROMPT,
+        page=2
+    ),
+    Trend(
+        key="bouquet",
+        button_text="Именной букет",
+        title="Bouquet",
+        photo_file_id="AgACAgIAAxkBAAIOHmluok2kQF0pfQc311ebHBcetuKwAAIvFWsbSD9wS0ot3b5oVW2eAQADAgADeQADOAQ",
+        prompt=BOUQUET_PROMPT_TEMPLATE,
+        page=2,
+        inputs=(
+            TrendInput(
+                key="user_name",
+                request_text=(
+                    "👍 Отлично! Теперь <b><i>напишите имя</i></b>, которое хотите видеть на букетах\n\n"
+                    "Имя должно быть обязательно написано на английском языке"
+                ),
+                placeholder="name_letters",
+                transform=_name_letters
+            ),
+        )
+    ),
+)
+
+TRENDS = {trend.key: trend for trend in TREND_LIST}
+
+# Индекс для выбора тренда по callback_data за одну проверку словаря
+TRENDS_BY_CALLBACK = {trend.callback_data: trend for trend in TREND_LIST}
+
+TREND_PAGES = max(trend.page for trend in TREND_LIST)
@@ -2,11 +2,13 @@ from aiogram import Router, F, Bot
 from aiogram.types import CallbackQuery, Message, URLInputFile
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from keyboards.inline import get_video_format_keyboard, get_aspect_ratio_keyboard, get_video_menu_keyboard
+from utils.callback_index import callback_index
+from keyboards.inline import get_video_format_keyboard, get_aspect_ratio_keyboard, get_video_menu_keyboard, get_payment_methods_keyboard, get_back_keyboard
 from utils.veo_api_client import VeoApiClient
 from utils.texts import TEXTS
 import logging
+from database.database import Database, db_call
+import json
 
 router = Router()
 veo_client = VeoApiClient()
@@ -25,7 +27,7 @@ class VideoGenerationStates(StatesGroup):
     waiting_for_description = State()
 
 
-@router.callback_query(F.data == "video_generation")
+@callback_index.exact("video_generation")
 async def video_generation_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Создание видео'"""
     await callback.message.answer(
@@ -36,7 +38,7 @@ async def video_generation_handler(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "video_fast_photo")
+@callback_index.exact("video_fast_photo")
 async def video_fast_photo_handler(callback: CallbackQuery, state: FSMContext):
     """Обработчик выбора быстрой модели с фото"""
     await state.update_data(
@@ -59,7 +61,7 @@ async def video_fast_photo_handler(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-@router.callback_query(F.data == "video_quality_photo")
+@callback_index.exact("video_quality_photo")
 async def video_quality_photo_handler(callback: CallbackQuery, state: FSMContext):
     """Обработчик выбора модели высокого качества с фото"""
     await state.update_data(
@@ -82,7 +84,7 @@ async def video_quality_photo_handler(callback: CallbackQuery, state: FSMContext
     await callback.answer()
 
 
-@router.callback_query(F.data == "video_fast_prompt")
+@callback_index.exact("video_fast_prompt")
 async def video_fast_prompt_handler(callback: CallbackQuery, state: FSMContext):
     """Обработчик выбора быстрой модели с промтом"""
     await state.update_data(
@@ -105,7 +107,7 @@ async def video_fast_prompt_handler(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-@router.callback_query(F.data == "video_quality_prompt")
+@callback_index.exact("video_quality_prompt")
 async def video_quality_prompt_handler(callback: CallbackQuery, state: FSMContext):
     """Обработчик выбора модели высокого качества с промтом"""
     await state.update_data(
@@ -128,7 +130,7 @@ async def video_quality_prompt_handler(callback: CallbackQuery, state: FSMContex
     await callback.answer()
 
 
-@router.callback_query(F.data == "aspect_9_16")
+@callback_index.exact("aspect_9_16")
 async def aspect_9_16_handler(callback: CallbackQuery, state: FSMContext):
     """Обработчик выбора вертикального соотношения сторон 9:16"""
     data = await state.get_data()
@@ -172,7 +174,7 @@ async def aspect_9_16_handler(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-@router.callback_query(F.data == "aspect_16_9")
+@callback_index.exact("aspect_16_9")
 async def aspect_16_9_handler(callback: CallbackQuery, state: FSMContext):
     """Обработчик выбора горизонтального соотношения сторон 16:9"""
     data = await state.get_data()
@@ -270,12 +272,8 @@ async def process_video_photos(message: Message, state: FSMContext, bot: Bot):
 @router.message(VideoGenerationStates.waiting_for_description, F.text)
 async def process_video_description(message: Message, state: FSMContext, bot: Bot):
     """Обработчик получения описания видео"""
-    from database.database import Database
-    from keyboards.inline import get_payment_methods_keyboard
-    import json
-    
     db = Database()
-    user = db.get_user(message.from_user.id)
+    user = await db_call(db.get_user, message.from_user.id)
     
     # Получаем данные о выбранной модели
     data = await state.get_data()
@@ -293,7 +291,7 @@ async def process_video_description(message: Message, state: FSMContext, bot: Bo
             "state_data": data,  # Сохраняем ВСЁ: модель, соотношение, фото
             "prompt": prompt
         })
-        db.save_pending_action(message.from_user.id, "video_generation_pending", action_data)
+        await db_call(db.save_pending_action, message.from_user.id, "video_generation_pending", action_data)
         
         print(f"💾 Сохранено состояние для генерации видео:")
         print(f"   Model: {veo_model}")
@@ -373,8 +371,7 @@ async def process_video_description(message: Message, state: FSMContext, bot: Bo
                 )
             else:
                 # Успешная генерация - списываем средства
-                new_balance = balance - required_amount
-                db.update_user_balance(message.from_user.id, new_balance)
+                await db_call(db.subtract_from_balance, message.from_user.id, required_amount, reason="video_generation", ref_id=task_id)
                 
                 # Отправляем видео пользователю
                 try:
@@ -391,7 +388,7 @@ async def process_video_description(message: Message, state: FSMContext, bot: Bo
                     await processing_msg.delete()
 
                     # Сохраняем генерацию в БД
-                    db.save_generation(message.from_user.id, "video_generation", video_url, prompt)
+                    await db_call(db.save_generation, message.from_user.id, "video_generation", video_url, prompt)
                 except Exception as e:
                     logger.error(f"Ошибка отправки видео: {e}")
                     await processing_msg.edit_text(
@@ -431,7 +428,7 @@ async def process_video_description(message: Message, state: FSMContext, bot: Bo
     await state.clear()
 
 
-@router.callback_query(F.data == "back_to_video_format")
+@callback_index.exact("back_to_video_format")
 async def back_to_video_format_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Назад' - возврат к выбору формата"""
     await callback.message.edit_text(
@@ -441,14 +438,10 @@ async def back_to_video_format_handler(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "video_instruction_generation")
+@callback_index.exact("video_instruction_generation")
 async def video_instruction_generation_handler(callback: CallbackQuery):
     """Обработчик кнопки 'Видео-инструкция' в разделе генерации видео"""
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="Назад", callback_data="video_generation")]
-        ]
-    )
+    keyboard = get_back_keyboard("video_generation")
     
     await callback.message.answer_video(
         video="BAACAgIAAxkBAAIElmlj8d5SR3hTYL-7rDBf6FFWJy-4AAIDnQACHSMgS8HzgmFm3p1LOAQ",
@@ -1,6 +1,13 @@
+from functools import lru_cache
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from utils.pricing import TOP_UP_AMOUNTS
 
+# Клавиатуры строятся один раз и переиспользуются: при каждом нажатии больше не
+# валидируется новое дерево pydantic-моделей. Возвращаемые объекты общие -
+# изменять их нельзя, для другой разметки нужна отдельная функция.
 
+
+@lru_cache(maxsize=None)
 def get_agreement_keyboard() -> InlineKeyboardMarkup:
     """Создаёт инлайн-клавиатуру для подтверждения согласия"""
     keyboard = InlineKeyboardMarkup(
@@ -11,6 +18,7 @@ def get_agreement_keyboard() -> InlineKeyboardMarkup:
     return keyboard
 
 
+@lru_cache(maxsize=None)
 def get_main_menu_keyboard() -> InlineKeyboardMarkup:
     """Создаёт главное меню с инлайн-кнопками"""
     keyboard = InlineKeyboardMarkup(
@@ -27,6 +35,7 @@ def get_main_menu_keyboard() -> InlineKeyboardMarkup:
     return keyboard
 
 
+@lru_cache(maxsize=None)
 def get_images_menu_keyboard() -> InlineKeyboardMarkup:
     """Создаёт подменю 'Изображения'"""
     keyboard = InlineKeyboardMarkup(
@@ -40,6 +49,7 @@ def get_images_menu_keyboard() -> InlineKeyboardMarkup:
     return keyboard
 
 
+@lru_cache(maxsize=None)
 def get_video_menu_keyboard() -> InlineKeyboardMarkup:
     """Создаёт подменю 'Видео-контент'"""
     keyboard = InlineKeyboardMarkup(
@@ -56,6 +66,7 @@ def get_video_menu_keyboard() -> InlineKeyboardMarkup:
     return keyboard
 
 
+@lru_cache(maxsize=None)
 def get_photo_animation_keyboard() -> InlineKeyboardMarkup:
     """Создаёт клавиатуру для раздела 'Оживление фото'"""
     keyboard = InlineKeyboardMarkup(
@@ -69,6 +80,7 @@ def get_photo_animation_keyboard() -> InlineKeyboardMarkup:
     return keyboard
 
 
+@lru_cache(maxsize=None)
 def get_video_generation_keyboard() -> InlineKeyboardMarkup:
     """Создаёт клавиатуру для раздела 'Создание видео'"""
     keyboard = InlineKeyboardMarkup(
@@ -82,6 +94,7 @@ def get_video_generation_keyboard() -> InlineKeyboardMarkup:
     return keyboard
 
 
+@lru_cache(maxsize=None)
 def get_video_format_keyboard() -> InlineKeyboardMarkup:
     """Создаёт клавиатуру для выбора формата генерации видео"""
     keyboard = InlineKeyboardMarkup(
@@ -97,6 +110,7 @@ def get_video_format_keyboard() -> InlineKeyboardMarkup:
     return keyboard
 
 
+@lru_cache(maxsize=None)
 def get_aspect_ratio_keyboard() -> InlineKeyboardMarkup:
     """Создаёт клавиатуру для выбора соотношения сторон"""
     keyboard = InlineKeyboardMarkup(
@@ -110,22 +124,26 @@ def get_aspect_ratio_keyboard() -> InlineKeyboardMarkup:
     return keyboard
 
 
+def _top_up_amounts_row():
+    return [
+        InlineKeyboardButton(text=f"{amount}₽", callback_data=f"amount_{amount}")
+        for amount in TOP_UP_AMOUNTS
+    ]
+
+
+@lru_cache(maxsize=32)
 def get_balance_amounts_keyboard(back_to: str = "photo_animation") -> InlineKeyboardMarkup:
     """Создаёт клавиатуру с суммами для пополнения"""
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
-            [
-                InlineKeyboardButton(text="80₽", callback_data="amount_80"),
-                InlineKeyboardButton(text="160₽", callback_data="amount_160"),
-                InlineKeyboardButton(text="320₽", callback_data="amount_320"),
-                InlineKeyboardButton(text="640₽", callback_data="amount_640")
-            ],
+            _top_up_amounts_row(),
             [InlineKeyboardButton(text="Назад", callback_data=f"back_to_{back_to}")]
         ]
     )
     return keyboard
 
 
+@lru_cache(maxsize=32)
 def get_payment_keyboard(amount: int) -> InlineKeyboardMarkup:
     """Создаёт клавиатуру для оплаты"""
     keyboard = InlineKeyboardMarkup(
@@ -136,6 +154,16 @@ def get_payment_keyboard(amount: int) -> InlineKeyboardMarkup:
     )
     return keyboard
 
+def get_payment_link_keyboard(confirmation_url: str) -> InlineKeyboardMarkup:
+    """Создаёт клавиатуру со ссылкой на оплату (не кэшируется: ссылка у каждого платежа своя)"""
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="💳 Перейти к оплате", url=confirmation_url)],
+            [InlineKeyboardButton(text="Главное меню", callback_data="main_menu")]
+        ]
+    )
+
+@lru_cache(maxsize=None)
 def get_edit_aspect_ratio_keyboard() -> InlineKeyboardMarkup:
     """Создаёт клавиатуру для выбора соотношения сторон при редактировании"""
     keyboard = InlineKeyboardMarkup(
@@ -148,6 +176,7 @@ def get_edit_aspect_ratio_keyboard() -> InlineKeyboardMarkup:
     )
     return keyboard
 
+@lru_cache(maxsize=None)
 def get_generation_aspect_ratio_keyboard() -> InlineKeyboardMarkup:
     """Создаёт клавиатуру для выбора соотношения сторон при генерации"""
     keyboard = InlineKeyboardMarkup(
@@ -160,6 +189,7 @@ def get_generation_aspect_ratio_keyboard() -> InlineKeyboardMarkup:
     )
     return keyboard
 
+@lru_cache(maxsize=None)
 def get_photo_quality_keyboard() -> InlineKeyboardMarkup:
     """Создаёт клавиатуру для выбора качества фото"""
     keyboard = InlineKeyboardMarkup(
@@ -175,6 +205,7 @@ def get_photo_quality_keyboard() -> InlineKeyboardMarkup:
     )
     return keyboard
 
+@lru_cache(maxsize=32)
 def get_payment_methods_keyboard(back_to: str = "main_menu") -> InlineKeyboardMarkup:
     """Создаёт клавиатуру для выбора способа оплаты"""
     keyboard = InlineKeyboardMarkup(
@@ -185,6 +216,7 @@ def get_payment_methods_keyboard(back_to: str = "main_menu") -> InlineKeyboardMa
     )
     return keyboard
 
+@lru_cache(maxsize=32)
 def get_start_action_keyboard(action_type: str) -> InlineKeyboardMarkup:
     """Создаёт клавиатуру для подтверждения начала действия"""
     keyboard = InlineKeyboardMarkup(
@@ -195,6 +227,7 @@ def get_start_action_keyboard(action_type: str) -> InlineKeyboardMarkup:
     )
     return keyboard 
 
+@lru_cache(maxsize=None)
 def get_cabinet_keyboard() -> InlineKeyboardMarkup:
     """Создаёт клавиатуру для личного кабинета"""
     keyboard = InlineKeyboardMarkup(
@@ -212,6 +245,7 @@ def get_cabinet_keyboard() -> InlineKeyboardMarkup:
     )
     return keyboard
 
+@lru_cache(maxsize=None)
 def get_motion_quality_keyboard():
     """Создаёт клавиатуру для выбора качества управления движением"""
     keyboard = InlineKeyboardMarkup(
@@ -225,37 +259,31 @@ def get_motion_quality_keyboard():
     )
     return keyboard
 
+@lru_cache(maxsize=32)
 def get_trends_keyboard(page: int = 1) -> InlineKeyboardMarkup:
-    """Создаёт клавиатуру для раздела 'Тренды'"""
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(text="Фотки с макбука", callback_data="trend_macbook"),
-                InlineKeyboardButton(text="Love is", callback_data="trend_love_is")
-            ],
-            [
-                InlineKeyboardButton(text="Снежный ангел", callback_data="trend_snow_angel"),
-                InlineKeyboardButton(text="Фотка на сноуборде", callback_data="trend_snowboard")
-            ],
-            [
-                InlineKeyboardButton(text="Портрет на стене", callback_data="trend_wall_portrait"),
-                InlineKeyboardButton(text="Влюбленный взгляд", callback_data="trend_loving_gaze")
-            ],
-            [
-                InlineKeyboardButton(text="Фотка с мечами", callback_data="trend_swords"),
-                InlineKeyboardButton(text="Сердце на здание", callback_data="trend_heart_building")
-            ],
-            [
-                InlineKeyboardButton(text="Фотка в машине", callback_data="trend_car"),
-                InlineKeyboardButton(text="Фотка с криком", callback_data="trend_scream")
-            ],
-            [InlineKeyboardButton(text="Следующая страница →", callback_data="trends_page_2")],
-            [InlineKeyboardButton(text="⚡ Купить генерации", callback_data="buy_generations_from_trends")],
-            [InlineKeyboardButton(text="← Главное меню", callback_data="main_menu")]
-        ]
-    )
+    """Создаёт клавиатуру для раздела 'Тренды' по реестру трендов"""
+    from handlers.trends.registry import TREND_LIST, TREND_PAGES
+    
+    trends = [trend for trend in TREND_LIST if trend.page == page]
+    buttons = [
+        InlineKeyboardButton(text=trend.button_text, callback_data=trend.callback_data)
+        for trend in trends
+    ]
+    inline_keyboard = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+    
+    if page < TREND_PAGES:
+        inline_keyboard.append([InlineKeyboardButton(text="Следующая страница →", callback_data=f"trends_page_{page + 1}")])
+    if page > 1:
+        previous_page = "trends" if page == 2 else f"trends_page_{page - 1}"
+        inline_keyboard.append([InlineKeyboardButton(text="← Предыдущая страница", callback_data=previous_page)])
+    else:
+        inline_keyboard.append([InlineKeyboardButton(text="⚡ Купить генерации", callback_data="buy_generations_from_trends")])
+    inline_keyboard.append([InlineKeyboardButton(text="← Главное меню", callback_data="main_menu")])
+    
+    keyboard = InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
     return keyboard
 
+@lru_cache(maxsize=None)
 def get_trend_aspect_ratio_keyboard() -> InlineKeyboardMarkup:
     """Создаёт клавиатуру для выбора соотношения сторон для трендов"""
     keyboard = InlineKeyboardMarkup(
@@ -270,10 +298,59 @@ def get_trend_aspect_ratio_keyboard() -> InlineKeyboardMarkup:
 
 def get_trend_model_selection_keyboard(generations: int) -> InlineKeyboardMarkup:
     """Создаёт клавиатуру для выбора модели генерации в трендах"""
+    return _get_trend_model_selection_keyboard()
+
+@lru_cache(maxsize=None)
+def _get_trend_model_selection_keyboard() -> InlineKeyboardMarkup:
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
             [InlineKeyboardButton(text="🌟 Стандартная", callback_data="trend_model_standard")],
             [InlineKeyboardButton(text="🚀 Профессиональная", callback_data="trend_model_pro")]
         ]
     )
-    return keyboard
\ No newline at end of file
+    return keyboard
+
+
+@lru_cache(maxsize=None)
+def get_to_main_menu_keyboard() -> InlineKeyboardMarkup:
+    """Создаёт клавиатуру с одной кнопкой 'Главное меню'"""
+    keyboard = InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="Главное меню", callback_data="main_menu")]
+        ]
+    )
+    return keyboard
+
+
+@lru_cache(maxsize=32)
+def get_back_keyboard(back_to: str, text: str = "Назад", main_menu: bool = False) -> InlineKeyboardMarkup:
+    """Создаёт клавиатуру с кнопкой возврата (и, при необходимости, 'Главное меню')"""
+    inline_keyboard = [[InlineKeyboardButton(text=text, callback_data=back_to)]]
+    if main_menu:
+        inline_keyboard.append([InlineKeyboardButton(text="Главное меню", callback_data="main_menu")])
+    keyboard = InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
+    return keyboard
+
+
+@lru_cache(maxsize=8)
+def get_buy_generations_keyboard(source: str) -> InlineKeyboardMarkup:
+    """Создаёт клавиатуру при нехватке генераций: покупка и главное меню"""
+    keyboard = InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="⚡ Купить генерации", callback_data=f"buy_generations_from_{source}")],
+            [InlineKeyboardButton(text="Главное меню", callback_data="main_menu")]
+        ]
+    )
+    return keyboard
+
+
+@lru_cache(maxsize=None)
+def get_pay_amounts_keyboard() -> InlineKeyboardMarkup:
+    """Создаёт клавиатуру с суммами для команды /pay"""
+    keyboard = InlineKeyboardMarkup(
+        inline_keyboard=[
+            _top_up_amounts_row(),
+            [InlineKeyboardButton(text="Главное меню", callback_data="main_menu")]
+        ]
+    )
+    return keyboard
@@ -3,10 +3,17 @@ import logging
 from aiogram import Bot, Dispatcher, F
 from aiogram.types import BotCommand, Message
 from aiogram.fsm.storage.memory import MemoryStorage
-from config import BOT_TOKEN
-from handlers import start, photo_animation, video_generation, payment, image_editing, referral, cabinet, support, motion_control, generation_purchase,image_generation
-from handlers.trends import router as trends_router
+from config import (
+    BOT_TOKEN, LEDGER_SNAPSHOT_INTERVAL, REFERRAL_CHECK_INTERVAL, PENDING_ACTION_SWEEP_INTERVAL, BACKUP_INTERVAL
+)
+from database.database import Database
+from database.read_pool import read_pool
+from database.backup import backup_all
+from handlers.loader import import_handler_modules, include_routers
 from webhook_server import start_webhook_server
+from utils.telegram_limiter import OutboundRateLimiter
+from utils.jobs import start_periodic
+from utils.yookassa_client import yookassa_client
 
 # Настройка логирования
 logging.basicConfig(
@@ -21,8 +28,13 @@ async def main():
     """Главная функция запуска бота"""
     # Создаём бота и диспетчер
     bot = Bot(token=BOT_TOKEN)
+    # Все исходящие запросы проходят через общий планировщик с лимитами Telegram
+    outbound_limiter = OutboundRateLimiter()
+    bot.session.middleware(outbound_limiter)
     storage = MemoryStorage()
     dp = Dispatcher(storage=storage)
+    # Метрики для /stats: aiogram передаёт данные диспетчера в обработчики по имени аргумента
+    dp["outbound_limiter"] = outbound_limiter
     
     # Настраиваем команды бота (меню)
     commands = [
@@ -31,34 +43,44 @@ async def main():
         BotCommand(command="lk", description="Личный кабинет"),
         BotCommand(command="help", description="Поддержка")
     ]
-    await bot.set_my_commands(commands)
+    # Обработчики и тяжёлые зависимости (PIL, aiohttp) импортируются в отдельном
+    # потоке, пока идёт запрос к Telegram
+    _, routers = await asyncio.gather(
+        bot.set_my_commands(commands),
+        asyncio.to_thread(import_handler_modules)
+    )
     logger.info("✅ Команды бота настроены")
     
     # Подключаем роутеры из handlers
-    dp.include_router(start.router)
-    dp.include_router(motion_control.router)
-    dp.include_router(photo_animation.router)
-    dp.include_router(video_generation.router)
-    dp.include_router(image_generation.router)  # Должен быть перед image_editing!
-    dp.include_router(image_editing.router) 
-    dp.include_router(payment.router)
-    dp.include_router(referral.router)
-    dp.include_router(cabinet.router)
-    dp.include_router(support.router)
-    dp.include_router(trends_router)
-    dp.include_router(generation_purchase.router)
+    include_routers(dp, routers)
     logger.info("🚀 Бот запущен")
     
     # Запускаем webhook сервер
     webhook_runner = await start_webhook_server(bot, host='127.0.0.1', port=8080)
     logger.info("✅ Webhook сервер запущен на 127.0.0.1:8080")
+    dp["reconciler"] = webhook_runner.app['reconciler']
+
+    # Фоновые задачи обслуживания БД
+    background_jobs = [
+        start_periodic("ledger_snapshot", LEDGER_SNAPSHOT_INTERVAL, lambda: Database().snapshot_ledger()),
+        start_periodic("referral_counters_check", REFERRAL_CHECK_INTERVAL, lambda: Database().check_referral_counters()),
+        start_periodic(
+            "pending_actions_sweep", PENDING_ACTION_SWEEP_INTERVAL, lambda: Database().sweep_expired_pending_actions()
+        ),
+        # Онлайн-копия через backup API в отдельном потоке, запись при этом не останавливается
+        start_periodic("database_backup", BACKUP_INTERVAL, backup_all),
+    ]
 
 
     # Запускаем polling
     try:
         await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
+        for job in background_jobs:
+            job.cancel()
         await webhook_runner.cleanup()
+        await yookassa_client.close()
+        read_pool.close()
         await bot.session.close()
 
 if __name__ == "__main__":
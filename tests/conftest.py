@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Общая временная БД для тестов: config читает переменные окружения при импорте
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(prefix="bot-tests-"), "bot_database.db"))
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+os.environ.setdefault("REFERRAL_CODE_KEY", "test-referral-key")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
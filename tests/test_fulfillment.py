@@ -0,0 +1,104 @@
+import asyncio
+import itertools
+import json
+import time
+from database.database import Database
+from utils.fulfillment import FulfillmentWorker
+
+_ids = itertools.count(int(time.time()) % 1000000 * 1000 + 500)
+
+
+class FakeBot:
+    """Бот, который только запоминает отправленные сообщения"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+
+class FlakyBot(FakeBot):
+    """Бот, у которого первая отправка в fail_chat_id падает с сетевой ошибкой"""
+
+    def __init__(self, fail_chat_id: int):
+        super().__init__()
+        self.fail_chat_id = fail_chat_id
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id == self.fail_chat_id:
+            self.fail_chat_id = None
+            raise ConnectionError("telegram недоступен")
+        await super().send_message(chat_id, text, **kwargs)
+
+
+def _job(payment_id: str):
+    return next(job for job in Database().get_due_fulfillment_jobs(time.time(), 1000) if job['payment_id'] == payment_id)
+
+
+def _queued_payment():
+    db = Database()
+    user_id, payment_id = next(_ids), f"fulfill-{next(_ids)}"
+    db.add_user(user_id)
+    db.save_payment(payment_id, user_id, 100.0)
+    db.enqueue_payment_event('payment.succeeded', payment_id)
+    return user_id, payment_id
+
+
+def _status(job_id: int):
+    db = Database()
+    db.cursor.execute("SELECT status FROM fulfillment_queue WHERE id = ?", (job_id,))
+    return db.cursor.fetchone()[0]
+
+
+def _job_id(payment_id: str):
+    db = Database()
+    db.cursor.execute("SELECT id FROM fulfillment_queue WHERE payment_id = ?", (payment_id,))
+    return db.cursor.fetchone()[0]
+
+
+def test_notification_survives_restart_after_crediting():
+    user_id, payment_id = _queued_payment()
+    job = _job(payment_id)
+    # Процесс зачислил платёж и упал до отправки уведомления
+    result = Database().fulfill_payment_event(job['event'], payment_id)
+    Database().save_fulfillment_result(job['id'], json.dumps(result))
+
+    bot = FakeBot()
+    asyncio.run(FulfillmentWorker(bot)._process(_job(payment_id)))
+
+    assert [chat_id for chat_id, _ in bot.sent] == [user_id]
+    assert Database().get_user(user_id)['balance'] == 100.0
+    assert _status(job['id']) == 'done'
+
+
+def test_notify_error_is_retried_without_duplicates():
+    referrer_id, user_id = next(_ids), next(_ids)
+    db = Database()
+    db.onboard_user(referrer_id)
+    db.onboard_user(user_id, referral_code=db.generate_referral_code(referrer_id))
+    payment_id = f"fulfill-{next(_ids)}"
+    db.save_payment(payment_id, user_id, 100.0)
+    db.enqueue_payment_event('payment.succeeded', payment_id)
+    _, other_payment = _queued_payment()
+
+    bot = FlakyBot(fail_chat_id=referrer_id)
+    worker = FulfillmentWorker(bot, base_delay=0.01)
+
+    async def scenario():
+        for job_payment in (payment_id, other_payment):
+            await worker._process(_job(payment_id=job_payment))
+        # Уведомление рефереру не ушло: задача ждёт повтора, остальные обработаны
+        assert _status(_job_id(payment_id)) == 'notify'
+        assert _status(_job_id(other_payment)) == 'done'
+        await asyncio.sleep(0.02)
+        await worker._process(_job(payment_id))
+
+    asyncio.run(scenario())
+
+    assert _status(_job_id(payment_id)) == 'done'
+    assert worker.retried == 1
+    # Пользователь получил подтверждение один раз, реферер - со второй попытки
+    assert [chat_id for chat_id, _ in bot.sent].count(user_id) == 1
+    assert [chat_id for chat_id, _ in bot.sent].count(referrer_id) == 1
+    assert Database().get_user(user_id)['balance'] == 100.0
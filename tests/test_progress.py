@@ -0,0 +1,37 @@
+import asyncio
+import time
+from utils.progress import ProgressReporter
+
+
+class SlowMessage:
+    """Сообщение, правка которого идёт заметное время"""
+
+    def __init__(self):
+        self.chat = type("Chat", (), {"id": 1})()
+        self.message_id = 1
+        self.text = "старт"
+        self.edits = []
+
+    async def edit_text(self, text):
+        await asyncio.sleep(0.05)
+        self.edits.append((text, time.monotonic()))
+
+
+def test_update_during_edit_waits_for_interval():
+    reporter = ProgressReporter(max_edits_per_minute=300)
+    message = SlowMessage()
+
+    async def scenario():
+        reporter.update(message, "1 мин")
+        await asyncio.sleep(0.02)
+        # Правка "1 мин" ещё идёт: новый текст должен дождаться интервала
+        reporter.update(message, "2 мин")
+        await asyncio.sleep(0.5)
+
+    asyncio.run(scenario())
+
+    assert [text for text, _ in message.edits] == ["1 мин", "2 мин"]
+    first_done, second_done = message.edits[0][1], message.edits[1][1]
+    # Вторая правка начинается не раньше чем через min_interval после первой
+    assert second_done - first_done >= reporter.min_interval + 0.05 - 0.01
+    assert reporter.edits == 2
@@ -0,0 +1,118 @@
+import asyncio
+import itertools
+import time
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from database.database import Database
+from utils.fulfillment import FulfillmentWorker
+from utils.reconciler import PaymentReconciler
+from utils.yookassa_client import yookassa_client
+
+_ids = itertools.count(int(time.time()) % 1000000 * 1000)
+
+
+class FakeBot:
+    """Бот, который только запоминает отправленные сообщения"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+
+async def _with_yookassa(statuses: dict, scenario):
+    """Запускает заглушку YooKassa, отдающую статусы платежей из statuses"""
+    async def get_payment(request):
+        payment_id = request.match_info['payment_id']
+        return web.json_response({
+            'id': payment_id,
+            'status': statuses.get(payment_id, 'pending'),
+            'paid': statuses.get(payment_id) == 'succeeded',
+            'amount': {'value': '100.00', 'currency': 'RUB'}
+        })
+
+    app = web.Application()
+    app.router.add_get('/payments/{payment_id}', get_payment)
+    server = TestServer(app)
+    await server.start_server()
+    base_url = yookassa_client.base_url
+    yookassa_client.base_url = str(server.make_url('')).rstrip('/')
+    try:
+        return await scenario()
+    finally:
+        yookassa_client.base_url = base_url
+        await yookassa_client.close()
+        await server.close()
+
+
+async def _drain(worker: FulfillmentWorker):
+    for job in Database().get_due_fulfillment_jobs(time.time(), 100):
+        await worker._process(job)
+
+
+def test_lost_webhook_is_credited_once():
+    db = Database()
+    user_id, payment_id = next(_ids), f"lost-{next(_ids)}"
+    db.add_user(user_id)
+    db.save_payment(payment_id, user_id, 100.0)
+
+    bot = FakeBot()
+    worker = FulfillmentWorker(bot)
+    reconciler = PaymentReconciler(worker, min_age=0, max_age=3600)
+
+    async def scenario():
+        # Webhook не пришёл: платёж находит только сверка
+        await reconciler.reconcile_once()
+        await _drain(worker)
+        # Повторная сверка и повторная доставка не зачисляют второй раз
+        await reconciler.reconcile_once()
+        Database().enqueue_payment_event('payment.succeeded', payment_id)
+        await _drain(worker)
+
+    asyncio.run(_with_yookassa({payment_id: 'succeeded'}, scenario))
+
+    assert reconciler.recovered == 1
+    assert Database().get_payment(payment_id)['status'] == 'succeeded'
+    assert Database().get_user(user_id)['balance'] == 100.0
+    assert [chat_id for chat_id, _ in bot.sent] == [user_id]
+
+
+def test_failed_job_is_requeued_by_reconciler():
+    db = Database()
+    user_id, payment_id = next(_ids), f"failed-{next(_ids)}"
+    db.add_user(user_id)
+    db.save_payment(payment_id, user_id, 100.0)
+
+    # Воркер исчерпал попытки раньше, чем платёж появился в БД
+    assert db.enqueue_payment_event('payment.succeeded', payment_id)
+    job = db.get_due_fulfillment_jobs(time.time(), 100)[-1]
+    db.retry_fulfillment_job(job['id'], "платёж не найден", None)
+    assert not any(j['id'] == job['id'] for j in db.get_due_fulfillment_jobs(time.time(), 100))
+
+    worker = FulfillmentWorker(FakeBot())
+    reconciler = PaymentReconciler(worker, min_age=0, max_age=3600)
+
+    async def scenario():
+        await reconciler.reconcile_once()
+        await _drain(worker)
+
+    asyncio.run(_with_yookassa({payment_id: 'succeeded'}, scenario))
+
+    assert reconciler.recovered == 1
+    assert Database().get_user(user_id)['balance'] == 100.0
+    # Задача в работе или выполнена не сбрасывается повторной постановкой
+    assert not Database().enqueue_payment_event('payment.succeeded', payment_id)
+
+
+def test_canceled_payment_is_marked():
+    db = Database()
+    user_id, payment_id = next(_ids), f"canceled-{next(_ids)}"
+    db.add_user(user_id)
+    db.save_payment(payment_id, user_id, 100.0)
+
+    reconciler = PaymentReconciler(None, min_age=0, max_age=3600)
+    asyncio.run(_with_yookassa({payment_id: 'canceled'}, reconciler.reconcile_once))
+
+    assert Database().get_payment(payment_id)['status'] == 'canceled'
+    assert Database().get_user(user_id)['balance'] == 0.0
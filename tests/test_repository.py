@@ -0,0 +1,186 @@
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+import pytest
+import database.database as database_module
+from database.database import Database, db_call
+from database.postgres import PostgresDatabase
+from database.cache import user_cache
+from database.sharded import ShardedDatabase, payment_shard_cache, shard_index
+
+# Уникальные id: в PostgreSQL тестовая БД общая между запусками
+_ids = itertools.count(int(time.time() * 1000) % 10 ** 12 * 100)
+
+
+@pytest.fixture(params=['sqlite', 'sharded', 'postgres'])
+def repo(request, tmp_path):
+    """Одно и то же поведение проверяется на всех хранилищах"""
+    if request.param == 'sqlite':
+        return Database(str(tmp_path / 'repo.db'))
+    if request.param == 'sharded':
+        return ShardedDatabase(str(tmp_path / 'repo.db'), shards=3)
+
+    pytest.importorskip('psycopg_pool')
+    psycopg = pytest.importorskip('psycopg')
+    dsn = os.getenv('TEST_DATABASE_URL')
+    if not dsn:
+        pytest.skip("TEST_DATABASE_URL не задан")
+    try:
+        return PostgresDatabase(dsn, pool_size=2)
+    except (OSError, psycopg.Error) as e:
+        pytest.skip(f"PostgreSQL недоступен: {e}")
+
+
+def test_balance_and_generations(repo):
+    user_id = next(_ids)
+    repo.add_user(user_id, "user", "Имя")
+    repo.add_to_balance(user_id, 100.0, ref_id="top-up")
+    repo.subtract_from_balance(user_id, 30.0)
+    repo.add_generations(user_id, 5)
+    repo.subtract_generations(user_id, 2)
+
+    user = repo.get_user(user_id)
+    assert user['balance'] == 70.0
+    assert repo.get_user_generations(user_id) == 3
+    # Генерации не уходят ниже нуля
+    assert repo.subtract_generations(user_id, 10) is True
+    assert repo.get_user_generations(user_id) == 0
+    assert repo.get_user(next(_ids)) is None
+
+
+def test_onboarding_by_referral_code(repo):
+    grandparent, parent, child = next(_ids), next(_ids), next(_ids)
+    repo.onboard_user(grandparent)
+    parent_result = repo.onboard_user(parent, referral_code=repo.generate_referral_code(grandparent))
+    child_result = repo.onboard_user(child, referral_code=repo.generate_referral_code(parent))
+
+    assert parent_result == {'created': True, 'referrer_id': grandparent}
+    assert child_result == {'created': True, 'referrer_id': parent}
+    assert repo.onboard_user(child)['created'] is False
+    assert repo.get_referral_stats(grandparent)['referrals_count'] == 1
+    assert repo.get_referral_counts_by_depth(grandparent) == {1: 1, 2: 1}
+
+
+def test_onboarding_with_known_referrer(repo):
+    referrer_id, user_id = next(_ids), next(_ids)
+    repo.onboard_user(referrer_id)
+    assert repo.onboard_user(user_id, referrer_id=referrer_id) == {'created': True, 'referrer_id': referrer_id}
+    assert repo.get_referral_stats(referrer_id)['referrals_count'] == 1
+
+
+def test_payment_is_fulfilled_once(repo):
+    referrer_id, user_id = next(_ids), next(_ids)
+    repo.onboard_user(referrer_id)
+    repo.onboard_user(user_id, referral_code=repo.generate_referral_code(referrer_id))
+    payment_id = f"repo-{next(_ids)}"
+    repo.save_payment(payment_id, user_id, 100.0)
+
+    assert payment_id in repo.get_pending_payment_ids(0, 3600, limit=1000)
+    first = repo.fulfill_payment_event('payment.succeeded', payment_id, referral_rates=(0.15,))
+    second = repo.fulfill_payment_event('payment.succeeded', payment_id, referral_rates=(0.15,))
+
+    assert first['status'] == 'processed'
+    assert first['referral_bonuses'] == [{'referrer_id': referrer_id, 'depth': 1, 'bonus': 15.0}]
+    assert second['status'] == 'duplicate'
+    assert repo.get_user(user_id)['balance'] == 100.0
+    assert repo.get_user(referrer_id)['balance'] == 15.0
+    assert repo.get_payment(payment_id)['status'] == 'succeeded'
+    assert payment_id not in repo.get_pending_payment_ids(0, 3600, limit=1000)
+
+
+def test_fulfillment_queue_states(repo):
+    payment_id = f"queue-{next(_ids)}"
+    assert repo.enqueue_payment_event('payment.succeeded', payment_id) is True
+    assert repo.enqueue_payment_event('payment.succeeded', payment_id) is False
+
+    def due():
+        return {job['payment_id']: job for job in repo.get_due_fulfillment_jobs(time.time(), 1000)}
+
+    job = due()[payment_id]
+    assert job['status'] == 'pending'
+    repo.save_fulfillment_result(job['id'], json.dumps({'status': 'processed'}))
+    job = due()[payment_id]
+    assert job['status'] == 'notify'
+    assert json.loads(job['result']) == {'status': 'processed'}
+
+    repo.complete_fulfillment_job(job['id'])
+    assert payment_id not in due()
+
+
+def test_postgres_profile_is_not_cached(repo):
+    if not isinstance(repo, PostgresDatabase):
+        pytest.skip("кэш профилей отключён только для PostgreSQL")
+    user_id = next(_ids)
+    repo.add_user(user_id)
+    assert repo.get_user(user_id)['balance'] == 0.0
+    # Запись другого процесса мимо этого экземпляра видна сразу
+    repo._execute('UPDATE users SET balance = 42 WHERE user_id = $1', user_id)
+    assert repo.get_user(user_id)['balance'] == 42.0
+
+
+
+def test_ledger_snapshot_folds_only_new_entries(tmp_path):
+    db = Database(str(tmp_path / 'ledger.db'))
+    for user_id in (1, 2):
+        db.add_user(user_id)
+        db.add_to_balance(user_id, 100.0)
+    assert db.snapshot_ledger() == 2
+    assert db.snapshot_ledger() == 0
+
+    db.add_to_balance(1, 50.0)
+    db.subtract_from_balance(1, 30.0)
+    assert db.snapshot_ledger() == 1
+    db.cursor.execute("SELECT user_id, value FROM ledger_snapshots WHERE account = 'balance' ORDER BY user_id")
+    assert db.cursor.fetchall() == [(1, 120.0), (2, 100.0)]
+    db.cursor.execute("SELECT ledger_id FROM ledger_watermark")
+    assert db.cursor.fetchone()[0] == db.cursor.execute("SELECT MAX(id) FROM ledger").fetchone()[0]
+
+def test_sharded_pending_payments_are_merged_by_age(tmp_path):
+    repo = ShardedDatabase(str(tmp_path / 'repo.db'), shards=2)
+    crowded_user = next(user_id for user_id in _ids if shard_index(user_id, 2) == 0)
+    other_user = next(user_id for user_id in _ids if shard_index(user_id, 2) == 1)
+    for user_id in (crowded_user, other_user):
+        repo.add_user(user_id)
+
+    # Первый шард забит более новыми платежами, самый старый лежит во втором
+    created = {'crowded-1': '-5 minutes', 'crowded-2': '-4 minutes', 'crowded-3': '-3 minutes', 'other-1': '-10 minutes'}
+    for payment_id, age in created.items():
+        user_id = crowded_user if payment_id.startswith('crowded') else other_user
+        repo.save_payment(payment_id, user_id, 100.0)
+        shard = repo.shard_for(user_id)
+        shard.cursor.execute(
+            "UPDATE payments SET created_at = datetime('now', ?) WHERE payment_id = ?", (age, payment_id)
+        )
+        shard.conn.commit()
+
+    assert repo.get_pending_payment_ids(60, 3600, limit=2) == ['other-1', 'crowded-1']
+
+
+
+def test_sharded_payment_lookup_does_not_probe_shards(tmp_path, monkeypatch):
+    repo = ShardedDatabase(str(tmp_path / 'repo.db'), shards=3)
+    user_id = next(_ids)
+    repo.add_user(user_id)
+    repo.save_payment('lookup-1', user_id, 100.0)
+    user_cache_size = user_cache.stats()['size']
+
+    # Новый процесс: кэш пуст, шард берётся из payment_shards, а не перебором
+    payment_shard_cache.clear()
+    for shard in repo._all():
+        if shard is not repo.shard_for(user_id):
+            monkeypatch.setattr(shard, 'get_payment', lambda payment_id: pytest.fail("перебор шардов"))
+    assert repo.get_payment('lookup-1')['user_id'] == user_id
+    assert user_cache.stats()['size'] == user_cache_size
+
+@pytest.mark.parametrize('backend', ['postgres', 'sharded'])
+def test_db_call_leaves_event_loop(monkeypatch, backend):
+    async def caller_thread():
+        return await db_call(lambda: threading.current_thread())
+
+    main_thread = threading.current_thread()
+    assert asyncio.run(caller_thread()) is main_thread
+    monkeypatch.setattr(database_module, 'DATABASE_BACKEND', backend)
+    assert asyncio.run(caller_thread()) is not main_thread
@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+from database.database import Database
+
+
+def test_deletes_are_reflected_in_rollups(tmp_path):
+    db = Database(str(tmp_path / 'stats.db'))
+    for user_id in (1, 2):
+        db.add_user(user_id)
+    db.save_generation(1, 'image_generation', 'url-1', model='seedream')
+    db.save_generation(1, 'image_generation', 'url-2', model='nano_banana')
+    db.save_generation(2, 'image_editing', 'url-3')
+
+    db.cursor.execute("DELETE FROM generations WHERE file_url IN ('url-1', 'url-3')")
+    db.cursor.execute("DELETE FROM users WHERE user_id = 2")
+    db.conn.commit()
+
+    end = datetime.utcnow() + timedelta(hours=1)
+    period = db.get_range_stats(end - timedelta(days=7), end)
+    summary = db.get_stats_summary(days=7)
+
+    assert period['generations'] == summary['total_generations'] == 1
+    assert period['generations_by_type'] == summary['generations_by_type'] == {'image_generation': 1}
+    assert period['generations_by_model'] == {'nano_banana': 1}
+    assert period['new_users'] == summary['new_users'] == summary['total_users'] == 1
+    # Оба пользователя были активны сегодня, остальные 7 дней периода - пустые
+    assert period['active_users_per_day'] == 2 / 8
+
+    # Пересчёт с нуля даёт те же сводки, что и триггеры
+    db.rebuild_stats()
+    # Активность за сутки удаление генерации не отменяет, пересчёт учитывает только оставшиеся
+    rebuilt = db.get_range_stats(end - timedelta(days=7), end)
+    assert rebuilt | {'active_users_per_day': None} == period | {'active_users_per_day': None}
+    assert rebuilt['active_users_per_day'] == 1 / 8
@@ -0,0 +1,46 @@
+import asyncio
+import time
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+from utils.telegram_limiter import OutboundRateLimiter
+
+
+def _flooding_request(flooded_chats, retry_after=5):
+    async def make_request(bot, method):
+        if method.chat_id in flooded_chats:
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=retry_after)
+        return True
+    return make_request
+
+
+def test_flood_in_one_chat_does_not_pause_others():
+    limiter = OutboundRateLimiter(max_retries=0)
+
+    async def scenario():
+        make_request = _flooding_request({1})
+        try:
+            await limiter(make_request, None, SendMessage(chat_id=1, text="spam"))
+        except TelegramRetryAfter:
+            pass
+        started = time.monotonic()
+        assert await limiter(make_request, None, SendMessage(chat_id=2, text="payment"))
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) < 0.5
+    assert limiter._global_paused_until == 0.0
+    assert limiter.stats() == {'sent': 1, 'retried': 0, 'dropped': 1, 'paused_chats': 1}
+
+
+def test_flood_in_many_chats_pauses_everything():
+    limiter = OutboundRateLimiter(max_retries=0, global_flood_chats=3)
+
+    async def scenario():
+        make_request = _flooding_request({1, 2, 3})
+        for chat_id in (1, 2, 3):
+            try:
+                await limiter(make_request, None, SendMessage(chat_id=chat_id, text="spam"))
+            except TelegramRetryAfter:
+                pass
+
+    asyncio.run(scenario())
+    assert limiter._global_paused_until > time.monotonic()
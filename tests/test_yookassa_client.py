@@ -0,0 +1,52 @@
+import asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from utils.yookassa_client import YooKassaClient
+
+
+async def _run_against(responses, scenario):
+    """Заглушка YooKassa, отдающая ответы из responses по очереди"""
+    requests = []
+
+    async def handler(request):
+        requests.append(request.headers.get('Idempotence-Key'))
+        return responses[min(len(requests), len(responses)) - 1]()
+
+    app = web.Application()
+    app.router.add_route('*', '/payments{tail:.*}', handler)
+    server = TestServer(app)
+    await server.start_server()
+    client = YooKassaClient()
+    client.base_url = str(server.make_url('')).rstrip('/')
+    client.retry_delay = 0.01
+    try:
+        return await scenario(client), requests
+    finally:
+        await client.close()
+        await server.close()
+
+
+def _gateway_error():
+    return web.Response(status=502, text="<html>Bad Gateway</html>", content_type="text/html")
+
+
+def _payment():
+    return web.json_response({
+        'id': 'p1', 'status': 'pending', 'paid': False,
+        'amount': {'value': '80.00'}, 'confirmation': {'confirmation_url': 'https://pay'}
+    })
+
+
+def test_html_gateway_error_is_retried_with_same_key():
+    result, requests = asyncio.run(_run_against(
+        [_gateway_error, lambda: web.Response(status=503), _payment],
+        lambda client: client.create_payment(80, "test", 1)
+    ))
+    assert result['payment_id'] == 'p1'
+    assert len(requests) == 3 and len(set(requests)) == 1
+
+
+def test_persistent_gateway_error_returns_none():
+    result, requests = asyncio.run(_run_against([_gateway_error], lambda client: client.check_payment('p1')))
+    assert result is None
+    assert len(requests) == YooKassaClient.max_retries
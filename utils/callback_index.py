@@ -0,0 +1,72 @@
+from aiogram import Router
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.types import CallbackQuery
+
+
+class CallbackIndex(Router):
+    """
+    Роутер, выбирающий обработчик callback-запроса по таблице
+
+    Точные значения callback_data ищутся в словаре, префиксы - в словаре по
+    длинам префиксов. Обработчики здесь не должны зависеть от состояния FSM:
+    такие обработчики остаются в обычных роутерах с фильтрами. Если в индексе
+    ничего не нашлось, aiogram продолжает обход остальных роутеров.
+    """
+
+    def __init__(self, name: str = "callback_index"):
+        super().__init__(name=name)
+        self._exact = {}
+        self._prefixes = {}
+        # Длины префиксов от длинных к коротким: выигрывает самый специфичный
+        self._prefix_lengths = ()
+        self.callback_query.register(self._dispatch, self._match)
+
+    def _check_free(self, table: dict, key: str):
+        if key in table:
+            raise ValueError(f"callback_data '{key}' уже зарегистрирован: {table[key].callback.__qualname__}")
+
+    def exact(self, *values: str):
+        """Регистрирует обработчик для точных значений callback_data"""
+        def decorator(handler):
+            callable_object = CallableObject(handler)
+            for value in values:
+                self._check_free(self._exact, value)
+                self._exact[value] = callable_object
+            return handler
+        return decorator
+
+    def prefix(self, prefix: str):
+        """Регистрирует обработчик для всех callback_data, начинающихся с prefix"""
+        def decorator(handler):
+            self._check_free(self._prefixes, prefix)
+            self._prefixes[prefix] = CallableObject(handler)
+            self._prefix_lengths = tuple(sorted({len(p) for p in self._prefixes}, reverse=True))
+            return handler
+        return decorator
+
+    def resolve(self, data: str):
+        """Возвращает обработчик для callback_data или None"""
+        if data is None:
+            return None
+        handler = self._exact.get(data)
+        if handler is not None:
+            return handler
+        for length in self._prefix_lengths:
+            if len(data) >= length:
+                handler = self._prefixes.get(data[:length])
+                if handler is not None:
+                    return handler
+        return None
+
+    async def _match(self, callback: CallbackQuery):
+        handler = self.resolve(callback.data)
+        if handler is None:
+            return False
+        return {"indexed_handler": handler}
+
+    async def _dispatch(self, callback: CallbackQuery, indexed_handler: CallableObject, **kwargs):
+        return await indexed_handler.call(callback, **kwargs)
+
+
+# Общий индекс, подключается к диспетчеру первым
+callback_index = CallbackIndex()
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import logging
+import time
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from database.database import Database, db_call
+from keyboards.inline import get_to_main_menu_keyboard, get_start_action_keyboard
+from utils.telegram_limiter import outbound_priority, PRIORITY_HIGH
+
+logger = logging.getLogger(__name__)
+
+# Доли пополнения, которые начисляются рефереру по уровням (первая - пригласившему напрямую)
+REFERRAL_BONUS_RATES = (0.15,)
+
+
+class FulfillmentWorker:
+    """
+    Фоновое зачисление оплат из очереди fulfillment_queue
+
+    Webhook только сохраняет событие в очередь и будит воркер. Очередь лежит
+    в БД, поэтому события, не обработанные до перезапуска, подхватываются при
+    старте. Неудачные попытки повторяются с экспоненциальной задержкой.
+    """
+
+    def __init__(self, bot: Bot, max_attempts: int = 8, base_delay: float = 5.0, max_delay: float = 600.0,
+                 batch_size: int = 20):
+        self.bot = bot
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.batch_size = batch_size
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.processed = 0
+        self.duplicates = 0
+        self.retried = 0
+        self.failed = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="fulfillment_worker")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def notify(self):
+        """Будит воркер после постановки нового события в очередь"""
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            # Сбрасываем флаг до чтения очереди, чтобы не потерять событие, пришедшее во время чтения
+            self._wakeup.clear()
+            try:
+                jobs = await asyncio.to_thread(
+                    lambda: Database().get_due_fulfillment_jobs(time.time(), self.batch_size)
+                )
+                for job in jobs:
+                    await self._process(job)
+                if len(jobs) == self.batch_size:
+                    continue
+
+                # Ждём новое событие или ближайший повтор
+                next_at = await asyncio.to_thread(lambda: Database().get_next_fulfillment_time())
+                timeout = max(0.0, next_at - time.time()) if next_at is not None else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка воркера зачислений: {e}", exc_info=True)
+                await asyncio.sleep(self.base_delay)
+
+    async def _process(self, job: dict):
+        if job['status'] == 'notify':
+            # Зачисление уже проведено, но процесс остановился до уведомления
+            result = json.loads(job['result'])
+        else:
+            try:
+                result = await asyncio.to_thread(
+                    lambda: Database().fulfill_payment_event(job['event'], job['payment_id'], referral_rates=REFERRAL_BONUS_RATES)
+                )
+                if result['status'] == 'not_found':
+                    raise LookupError(f"платёж {job['payment_id']} не найден в БД")
+            except Exception as e:
+                await self._retry_later(job, str(e))
+                return
+
+            if result['status'] != 'processed':
+                await asyncio.to_thread(lambda: Database().complete_fulfillment_job(job['id']))
+                self.duplicates += 1
+                logger.info(f"⚠️ Платёж {job['payment_id']} уже обработан ({result['status']})")
+                return
+
+            self.processed += 1
+            await asyncio.to_thread(lambda: Database().save_fulfillment_result(job['id'], json.dumps(result)))
+
+        # Задача закрывается только после уведомления. При ошибке она остаётся в
+        # статусе notify и повторяется с задержкой; result сохраняется вместе со
+        # списком тех, кому сообщение уже ушло
+        try:
+            with outbound_priority(PRIORITY_HIGH):
+                if result['kind'] == 'generations':
+                    await notify_generations_purchase(self.bot, result)
+                else:
+                    await notify_balance_top_up(self.bot, result)
+        except Exception as e:
+            await asyncio.to_thread(lambda: Database().save_fulfillment_result(job['id'], json.dumps(result)))
+            await self._retry_later(job, f"уведомление: {e}")
+            return
+        await asyncio.to_thread(lambda: Database().complete_fulfillment_job(job['id']))
+        logger.info(f"✅ Платёж {job['payment_id']} успешно обработан")
+
+    async def _retry_later(self, job: dict, error: str):
+        attempts = job['attempts'] + 1
+        if attempts >= self.max_attempts:
+            self.failed += 1
+            next_attempt_at = None
+            logger.error(f"❌ Зачисление {job['payment_id']} не удалось после {attempts} попыток: {error}")
+        else:
+            self.retried += 1
+            next_attempt_at = time.time() + min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+            logger.warning(f"🔁 Зачисление {job['payment_id']} будет повторено (попытка {attempts}): {error}")
+        await asyncio.to_thread(lambda: Database().retry_fulfillment_job(job['id'], error, next_attempt_at))
+
+    def stats(self) -> dict:
+        return {
+            'processed': self.processed,
+            'duplicates': self.duplicates,
+            'retried': self.retried,
+            'failed': self.failed
+        }
+
+
+async def _send_once(bot: Bot, result: dict, chat_id: int, text: str, **kwargs):
+    """
+    Отправляет уведомление получателю, если оно ещё не уходило
+
+    Отправленные получатели копятся в result['notified'], а воркер сохраняет
+    result перед повтором - так повтор после сбоя не дублирует сообщения,
+    которые уже дошли. Заблокированный бот или удалённый чат - ошибка
+    навсегда, повтор не поможет: такое уведомление считается обработанным.
+    """
+    notified = result.setdefault('notified', [])
+    if chat_id in notified:
+        return
+    try:
+        await bot.send_message(chat_id, text, **kwargs)
+    except (TelegramForbiddenError, TelegramBadRequest) as e:
+        logger.warning(f"⚠️ Уведомление для {chat_id} не доставлено: {e}")
+    notified.append(chat_id)
+
+
+async def notify_generations_purchase(bot: Bot, result: dict):
+    """Уведомляет пользователя о начислении купленных генераций"""
+    user_id = result['user_id']
+    generations_count = result['generations_count']
+    user_generations = await db_call(Database().get_user_generations, user_id)
+
+    await _send_once(
+        bot, result, user_id,
+        f"💫 Оплата прошла успешно!\n\n"
+        f"⚡ Начислено: {generations_count} генераций\n\n"
+        f"<blockquote>Всего у вас: {user_generations} генераций</blockquote>",
+        parse_mode="HTML",
+        reply_markup=get_to_main_menu_keyboard()
+    )
+    logger.info(f"✅ Уведомление о генерациях отправлено пользователю {user_id}")
+
+
+async def notify_balance_top_up(bot: Bot, result: dict):
+    """Уведомляет пользователя о пополнении баланса, а реферера - о бонусе"""
+    user_id = result['user_id']
+    db = Database()
+    user_balance = (await db_call(db.get_user, user_id))['balance']
+
+    # Проверяем есть ли pending action
+    pending = await db_call(db.get_pending_action, user_id)
+    keyboard = get_to_main_menu_keyboard()
+    text = (
+        f"💫 Оплата прошла успешно\n\n"
+        f"<blockquote>Мой текущий баланс: {user_balance:.2f} ₽</blockquote>"
+    )
+
+    if pending:
+        action_type = pending['action_type']
+        action_data = json.loads(pending['action_data'])
+
+        # Определяем требуемую сумму
+        required_amount = 0
+        action_emoji = ""
+        action_text = ""
+
+        if action_type == "photo_animation_pending":
+            required_amount = 40.00
+            action_emoji = "📸"
+            action_text = "оживление фото"
+        elif action_type == "video_generation_pending":
+            state_data = action_data.get("state_data", {})
+            veo_model = state_data.get("veo_model", "veo3_fast")
+            required_amount = 65.00 if veo_model == "veo3_fast" else 115.00
+            action_emoji = "📹"
+            action_text = "генерацию видео"
+        elif action_type == "motion_control_pending":
+            required_amount = 0  # Уточните стоимость
+            action_emoji = "🕺"
+            action_text = "управление движением"
+
+        # Баланса достаточно - предлагаем начать
+        if user_balance >= required_amount:
+            keyboard = get_start_action_keyboard(action_type)
+            text = (
+                f"{action_emoji} Мы готовы начинать {action_text}\n\n"
+                f"Стартуем?\n"
+                f"<blockquote>💰 Ваш баланс: {user_balance:.2f} ₽</blockquote>"
+            )
+
+    # Сначала подтверждение самому пользователю, затем рефереры
+    await _send_once(bot, result, user_id, text, parse_mode="HTML", reply_markup=keyboard)
+    logger.info(f"✅ Уведомление отправлено пользователю {user_id}")
+
+    for referral in result.get('referral_bonuses', ()):
+        who = "Ваш реферал" if referral['depth'] == 1 else "Реферал из вашей сети"
+        await _send_once(
+            bot, result, referral['referrer_id'],
+            f"🎉 {who} пополнил баланс!\n\n"
+            f"💰 Вам начислено: {referral['bonus']:.2f} ₽"
+        )
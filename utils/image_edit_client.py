@@ -1,12 +1,17 @@
 import aiohttp
 import asyncio
 import json
+import math
+import time
 from typing import Optional, Callable
 from config import KIE_API_KEY
 
 
 class ImageEditClient:
     """Клиент для работы с API редактирования изображений (nano-banana-pro)"""
+
+    # Средняя длительность успешной задачи (сек), обновляется по факту выполнения
+    average_duration = 300.0
     
     def __init__(self):
         self.api_key = KIE_API_KEY
@@ -90,6 +95,16 @@ class ImageEditClient:
             print(f"❌ Ошибка при получении статуса: {e}")
             return None
     
+    @classmethod
+    def record_duration(cls, seconds: float):
+        """Обновляет среднюю длительность задачи (экспоненциальное сглаживание)"""
+        cls.average_duration = 0.8 * cls.average_duration + 0.2 * seconds
+    
+    @classmethod
+    def estimate_remaining_minutes(cls, elapsed_seconds: float) -> int:
+        """Оценка оставшегося времени в минутах по средней длительности задач"""
+        return max(1, math.ceil((cls.average_duration - elapsed_seconds) / 60))
+    
     async def wait_for_result(
         self, 
         task_id: str, 
@@ -115,6 +130,8 @@ class ImageEditClient:
         print(f"⏳ Ожидание завершения редактирования задачи {task_id}...")
         print(f"   Максимальное время ожидания: {max_attempts * delay // 60} минут")
         
+        started_at = time.monotonic()
+        
         for attempt in range(max_attempts):
             status_data = await self.get_task_status(task_id)
             
@@ -124,17 +141,20 @@ class ImageEditClient:
             
             state = status_data.get("state")
             
+            elapsed_seconds = time.monotonic() - started_at
+            elapsed_minutes = int(elapsed_seconds // 60)
+            
             # Выводим прогресс каждые 6 попыток (примерно раз в 30 секунд)
             if attempt % 6 == 0:
-                elapsed_minutes = (attempt * delay) // 60
                 print(f"⏳ Проверка {attempt + 1}/{max_attempts}: {state} (прошло {elapsed_minutes} мин)")
-                
-                # Отправляем прогресс пользователю каждую минуту
-                if progress_callback and attempt > 0 and attempt % 12 == 0:
-                    try:
-                        await progress_callback(elapsed_minutes, 5)  # Всегда показываем 5 минут
-                    except Exception as e:
-                        print(f"⚠️ Ошибка при отправке прогресса: {e}")
+            
+            # Прогресс отдаём на каждой проверке - повторы и частоту правок
+            # сообщения отсекает ProgressReporter
+            if progress_callback and elapsed_minutes > 0 and state != "success":
+                try:
+                    await progress_callback(elapsed_minutes, self.estimate_remaining_minutes(elapsed_seconds))
+                except Exception as e:
+                    print(f"⚠️ Ошибка при отправке прогресса: {e}")
             
             if state == "success":
                 print("🎉 Редактирование завершено!")
@@ -152,6 +172,7 @@ class ImageEditClient:
                         
                         if result_urls and len(result_urls) > 0:
                             image_url = result_urls[0]
+                            self.record_duration(time.monotonic() - started_at)
                             print(f"🖼 Изображение готово: {image_url}")
                             return image_url
                         else:
@@ -0,0 +1,60 @@
+"""
+Отчёт о времени импорта модулей
+
+Запускает `python -X importtime -c "import <module>"` в отдельном процессе,
+разбирает вывод и печатает таблицу самых тяжёлых модулей.
+
+Запуск: python -m utils.importtime [модуль] [--top N]
+"""
+import argparse
+import subprocess
+import sys
+
+
+def collect(module: str = "main"):
+    """Возвращает список (модуль, собственное время мкс, накопленное время мкс, глубина)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Не удалось импортировать {module}: {result.stderr.strip().splitlines()[-1:]}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        # import time:       self [us] |  cumulative | imported package
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(parts[0]), int(parts[1]), depth))
+    return rows
+
+
+def format_report(rows, top: int = 25) -> str:
+    """Формирует таблицу по накопленному времени импорта"""
+    total = sum(row[1] for row in rows)
+    lines = [
+        f"Всего модулей: {len(rows)}, суммарно: {total / 1000:.1f} мс",
+        "",
+        f"{'накопл., мс':>12} {'собств., мс':>12}  модуль",
+    ]
+    for name, self_us, cumulative_us, depth in sorted(rows, key=lambda row: row[2], reverse=True)[:top]:
+        lines.append(f"{cumulative_us / 1000:>12.1f} {self_us / 1000:>12.1f}  {'  ' * depth}{name}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время импорта модулей бота")
+    parser.add_argument("module", nargs="?", default="main")
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+    print(format_report(collect(args.module), args.top))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def run_periodic(name: str, interval: float, func, *args):
+    """
+    Периодически выполняет синхронную функцию в отдельном потоке
+
+    Ошибки логируются и не останавливают задачу. Первый запуск - через interval.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            result = await asyncio.to_thread(func, *args)
+            logger.info(f"🕒 Задача {name} выполнена: {result}")
+        except Exception as e:
+            logger.error(f"❌ Ошибка в задаче {name}: {e}")
+
+
+def start_periodic(name: str, interval: float, func, *args) -> asyncio.Task:
+    """Запускает периодическую задачу в текущем event loop"""
+    return asyncio.create_task(run_periodic(name, interval, func, *args), name=name)
@@ -0,0 +1,35 @@
+# Общая таблица цен: по ней строятся клавиатуры и обработчики оплаты
+
+# Суммы пополнения баланса, ₽ (callback_data: amount_<сумма>)
+TOP_UP_AMOUNTS = (80, 160, 320, 640)
+
+# Пакеты генераций (callback_data: select_<ключ>); hot - пометка 🔥 на кнопке
+GENERATION_PACKAGES = {
+    "gen_10": {"count": 10, "price": 99.0},
+    "gen_25": {"count": 25, "price": 199.0, "hot": True},
+    "gen_50": {"count": 50, "price": 399.0},
+    "gen_100": {"count": 100, "price": 799.0, "hot": True}
+}
+
+# Описания платежей и тексты счетов считаются один раз
+TOP_UP_DESCRIPTIONS = {amount: f"Пополнение баланса на {amount}₽" for amount in TOP_UP_AMOUNTS}
+
+TOP_UP_INVOICE_TEXTS = {
+    amount: (
+        f"<b>Сумма к оплате {amount}₽</b>\n\n"
+        f"  ✨ Подтверждение об успешной оплате приходит в течение нескольких минут (в некоторых случаях в течение часа)"
+    )
+    for amount in TOP_UP_AMOUNTS
+}
+
+GENERATION_PACKAGE_DESCRIPTIONS = {
+    key: f"Покупка {package['count']} генераций" for key, package in GENERATION_PACKAGES.items()
+}
+
+
+def get_top_up_amount(callback_data: str):
+    """Возвращает сумму пополнения из callback_data вида amount_<сумма> или None"""
+    prefix, _, value = callback_data.partition("_")
+    if prefix != "amount" or not value.isdigit() or int(value) not in TOP_UP_AMOUNTS:
+        return None
+    return int(value)
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import TelegramBadRequest
+
+logger = logging.getLogger(__name__)
+
+
+class _ProgressSlot:
+    """Состояние одного сообщения с прогрессом"""
+
+    __slots__ = ("message", "pending", "sent", "last_edit_at", "task")
+
+    def __init__(self, message):
+        self.message = message
+        self.pending = None
+        self.sent = message.text
+        self.last_edit_at = 0.0
+        self.task = None
+
+
+class ProgressReporter:
+    """
+    Сервис обновления сообщений с прогрессом генерации
+
+    Обновления одного сообщения объединяются: в Telegram уходит только последний
+    текст, одинаковый текст повторно не отправляется, а число правок одного
+    сообщения ограничено max_edits_per_minute.
+    """
+
+    def __init__(self, max_edits_per_minute: int = 1):
+        self.min_interval = 60 / max_edits_per_minute
+        self._slots = {}
+
+        self.requested = 0
+        self.edits = 0
+        self.skipped = 0
+
+    @staticmethod
+    def _key(message):
+        return message.chat.id, message.message_id
+
+    def update(self, message, text: str):
+        """Запоминает новый текст прогресса и планирует правку сообщения"""
+        self.requested += 1
+        key = self._key(message)
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = _ProgressSlot(message)
+
+        if text == slot.sent:
+            slot.pending = None
+            self.skipped += 1
+            return
+
+        if slot.pending is not None:
+            # Предыдущий текст ещё не ушёл - просто заменяем его
+            self.skipped += 1
+        slot.pending = text
+
+        if slot.task is None:
+            slot.task = asyncio.create_task(self._flush(key, slot))
+
+    async def _flush(self, key, slot: _ProgressSlot):
+        delay = slot.last_edit_at + self.min_interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        text, slot.pending = slot.pending, None
+        if text is not None and text != slot.sent:
+            try:
+                await slot.message.edit_text(text)
+                self.edits += 1
+            except TelegramBadRequest as e:
+                if "message is not modified" not in str(e):
+                    logger.warning(f"⚠️ Ошибка обновления прогресса: {e}")
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка обновления прогресса: {e}")
+
+            slot.sent = text
+            slot.last_edit_at = time.monotonic()
+
+        # Пока шла правка, задача оставалась в slot, и новые обновления только
+        # заменяли pending; теперь планируем их с отсчётом интервала от этой правки
+        slot.task = None
+        if slot.pending is not None and self._slots.get(key) is slot:
+            slot.task = asyncio.create_task(self._flush(key, slot))
+
+    def finish(self, message):
+        """Отменяет незавершённые обновления - дальше сообщение меняет сам обработчик"""
+        slot = self._slots.pop(self._key(message), None)
+        if slot and slot.task:
+            slot.task.cancel()
+
+    def callback(self, message, title: str, hint: str):
+        """Создаёт progress_callback для wait_for_result"""
+        async def report(elapsed_min, remaining_min):
+            self.update(
+                message,
+                f"{title}\n\n"
+                f"⏱️ Прошло: {elapsed_min} мин\n"
+                f"⏳ Осталось примерно: {remaining_min} мин\n\n"
+                f"{hint}"
+            )
+        return report
+
+
+# Общий экземпляр для всех обработчиков
+progress_reporter = ProgressReporter()
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+from database.database import Database
+from utils.yookassa_client import yookassa_client
+from config import RECONCILE_INTERVAL, RECONCILE_MIN_AGE, RECONCILE_MAX_AGE, RECONCILE_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+
+class PaymentReconciler:
+    """
+    Сверка зависших платежей с YooKassa
+
+    Если webhook потерялся, платёж навсегда остаётся в статусе pending. Воркер
+    периодически берёт такие платежи из payments и generation_purchases,
+    запрашивает их статус в YooKassa и ставит успешные в очередь зачислений -
+    дальше их обрабатывает FulfillmentWorker, как и события из webhook.
+    """
+
+    def __init__(self, fulfillment=None, interval: float = RECONCILE_INTERVAL, min_age: int = RECONCILE_MIN_AGE,
+                 max_age: int = RECONCILE_MAX_AGE, concurrency: int = RECONCILE_CONCURRENCY,
+                 batch_size: int = 100):
+        self.fulfillment = fulfillment
+        self.interval = interval
+        self.min_age = min_age
+        self.max_age = max_age
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self._task = None
+        self.runs = 0
+        self.checked = 0
+        self.recovered = 0
+        self.canceled = 0
+        self.errors = 0
+        self.last_run_duration = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="payment_reconciler")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.reconcile_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка сверки платежей: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    async def reconcile_once(self) -> int:
+        """Проверяет одну партию зависших платежей, возвращает их количество"""
+        started = time.monotonic()
+        payment_ids = await asyncio.to_thread(
+            lambda: Database().get_pending_payment_ids(self.min_age, self.max_age, self.batch_size)
+        )
+        if payment_ids:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            await asyncio.gather(*(self._check(semaphore, payment_id) for payment_id in payment_ids))
+
+        self.runs += 1
+        self.last_run_duration = time.monotonic() - started
+        if payment_ids:
+            logger.info(
+                f"🔎 Сверка платежей: проверено {len(payment_ids)} за {self.last_run_duration:.1f} с"
+            )
+        return len(payment_ids)
+
+    async def _check(self, semaphore: asyncio.Semaphore, payment_id: str):
+        async with semaphore:
+            payment = await yookassa_client.check_payment(payment_id)
+
+        self.checked += 1
+        if payment is None:
+            self.errors += 1
+            return
+
+        if payment['status'] == 'succeeded' and payment['paid']:
+            queued = await asyncio.to_thread(
+                lambda: Database().enqueue_payment_event('payment.succeeded', payment_id)
+            )
+            if queued:
+                self.recovered += 1
+                logger.info(f"🔁 Платёж {payment_id} найден при сверке и поставлен в очередь зачислений")
+                if self.fulfillment is not None:
+                    self.fulfillment.notify()
+        elif payment['status'] == 'canceled':
+            self.canceled += 1
+            await asyncio.to_thread(lambda: Database().cancel_pending_payment(payment_id))
+            logger.info(f"🚫 Платёж {payment_id} отменён в YooKassa")
+
+    def stats(self) -> dict:
+        return {
+            'runs': self.runs,
+            'checked': self.checked,
+            'recovered': self.recovered,
+            'canceled': self.canceled,
+            'errors': self.errors,
+            'last_run_duration': self.last_run_duration
+        }
@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageCaption, EditMessageReplyMarkup, EditMessageText
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты исходящих сообщений (меньше = важнее)
+PRIORITY_HIGH = 0     # подтверждения оплаты
+PRIORITY_NORMAL = 1   # обычные ответы и доставка результатов
+PRIORITY_LOW = 2      # обновления прогресса
+
+_PRIORITY_LEVELS = (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW)
+
+# Методы, которые по умолчанию считаются обновлениями прогресса
+_LOW_PRIORITY_METHODS = (EditMessageText, EditMessageCaption, EditMessageReplyMarkup)
+
+_current_priority: ContextVar = ContextVar("outbound_priority", default=None)
+
+
+@contextmanager
+def outbound_priority(priority: int):
+    """Задаёт приоритет для всех запросов к Telegram внутри блока"""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class TokenBucket:
+    """Простой token bucket: rate токенов в секунду, не больше capacity"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def delay(self, now: float) -> float:
+        """Сколько секунд ждать до появления токена (0 - можно сразу)"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+
+class OutboundRateLimiter(BaseRequestMiddleware):
+    """
+    Middleware сессии aiogram, ограничивающий исходящие запросы к Telegram
+
+    Каждый запрос с chat_id проходит через общий и поштучный (на чат) token bucket.
+    Запросы с более высоким приоритетом обслуживаются первыми, а ответ 429
+    (retry_after) приостанавливает отправку в этот чат и повторяет запрос.
+    Вся отправка встаёт на паузу, только если 429 за global_flood_window
+    секунд пришёл не меньше чем в global_flood_chats разных чатов.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        group_rate: float = 20 / 60,
+        max_retries: int = 3,
+        idle_chat_ttl: float = 300.0,
+        global_flood_chats: int = 3,
+        global_flood_window: float = 10.0
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.idle_chat_ttl = idle_chat_ttl
+        self.global_flood_chats = global_flood_chats
+        self.global_flood_window = global_flood_window
+
+        self._chat_buckets = {}
+        self._chat_paused_until = {}
+        self._global_paused_until = 0.0
+        # Недавние ответы 429: (время, chat_id)
+        self._recent_floods = deque()
+        # Количество запросов каждого приоритета, ожидающих общий лимит
+        self._waiting = {priority: 0 for priority in _PRIORITY_LEVELS}
+        self._last_cleanup = time.monotonic()
+
+        self.sent = 0
+        self.retried = 0
+        self.dropped = 0
+
+    def stats(self) -> dict:
+        """Метрики отправки для /stats"""
+        now = time.monotonic()
+        return {
+            'sent': self.sent,
+            'retried': self.retried,
+            'dropped': self.dropped,
+            'paused_chats': sum(1 for until in self._chat_paused_until.values() if until > now)
+        }
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Отрицательные chat_id - группы и каналы, у них свой лимит
+            if isinstance(chat_id, int) and chat_id < 0:
+                bucket = TokenBucket(self.group_rate, 1)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _cleanup(self, now: float):
+        """Удаляет бакеты давно неактивных чатов"""
+        if now - self._last_cleanup < self.idle_chat_ttl:
+            return
+        self._last_cleanup = now
+        stale = [
+            chat_id for chat_id, bucket in self._chat_buckets.items()
+            if now - bucket.updated_at > self.idle_chat_ttl
+        ]
+        for chat_id in stale:
+            del self._chat_buckets[chat_id]
+            self._chat_paused_until.pop(chat_id, None)
+
+    def _register_flood(self, chat_id, now: float, pause_until: float):
+        """Ставит на паузу чат, а при 429 сразу в нескольких чатах - всю отправку"""
+        self._chat_paused_until[chat_id] = pause_until
+        self._recent_floods.append((now, chat_id))
+        while self._recent_floods and now - self._recent_floods[0][0] > self.global_flood_window:
+            self._recent_floods.popleft()
+        flooded_chats = {flooded_chat for _, flooded_chat in self._recent_floods}
+        if len(flooded_chats) >= self.global_flood_chats:
+            self._global_paused_until = max(self._global_paused_until, pause_until)
+            logger.warning(f"⏸️ Flood control в {len(flooded_chats)} чатах - пауза всей отправки")
+
+    def _has_higher_priority_waiters(self, priority: int) -> bool:
+        return any(self._waiting[level] for level in _PRIORITY_LEVELS if level < priority)
+
+    async def _acquire(self, chat_id, priority: int):
+        """Ждёт, пока запрос можно будет отправить, и забирает токены"""
+        chat_bucket = self._chat_bucket(chat_id)
+        waiting = False
+        try:
+            while True:
+                now = time.monotonic()
+                delay = max(
+                    self._chat_paused_until.get(chat_id, 0.0) - now,
+                    self._global_paused_until - now,
+                    chat_bucket.delay(now)
+                )
+                if delay <= 0:
+                    # Лимит чата свободен - встаём в очередь на общий лимит
+                    if not waiting:
+                        self._waiting[priority] += 1
+                        waiting = True
+                    if self._has_higher_priority_waiters(priority):
+                        delay = 1 / self.global_bucket.rate
+                    else:
+                        delay = self.global_bucket.delay(now)
+                if delay <= 0:
+                    self.global_bucket.consume()
+                    chat_bucket.consume()
+                    self._cleanup(now)
+                    return
+                await asyncio.sleep(delay)
+        finally:
+            if waiting:
+                self._waiting[priority] -= 1
+
+    def _resolve_priority(self, method) -> int:
+        priority = _current_priority.get()
+        if priority is not None:
+            return priority
+        if isinstance(method, _LOW_PRIORITY_METHODS):
+            return PRIORITY_LOW
+        return PRIORITY_NORMAL
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+
+        # Служебные запросы (getUpdates, getFile, answerCallbackQuery) не ограничиваем
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        priority = self._resolve_priority(method)
+
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id, priority)
+            try:
+                response = await make_request(bot, method)
+                self.sent += 1
+                return response
+            except TelegramRetryAfter as e:
+                now = time.monotonic()
+                self._register_flood(chat_id, now, now + e.retry_after)
+
+                if attempt == self.max_retries:
+                    self.dropped += 1
+                    logger.error(
+                        f"⛔ Flood control: {type(method).__name__} в чат {chat_id} "
+                        f"не отправлен после {self.max_retries} повторов"
+                    )
+                    raise
+
+                self.retried += 1
+                logger.warning(
+                    f"⏳ Flood control: {type(method).__name__} в чат {chat_id}, "
+                    f"повтор через {e.retry_after} сек (попытка {attempt + 1}/{self.max_retries})"
+                )
@@ -1,42 +1,99 @@
 import aiohttp
-import json
+import asyncio
 import base64
-from config import YOOKASSA_SHOP_ID, YOOKASSA_SECRET_KEY
+from config import YOOKASSA_SHOP_ID, YOOKASSA_SECRET_KEY, YOOKASSA_API_URL
 import uuid
 
 
 class YooKassaClient:
-    """Клиент для работы с YooKassa API"""
-    
+    """
+    Клиент для работы с YooKassa API
+
+    Один экземпляр на процесс (см. yookassa_client ниже): заголовки считаются
+    один раз, а запросы идут через общую сессию с keep-alive соединениями.
+    Ошибки 5xx и таймауты повторяются с тем же Idempotence-Key, поэтому
+    повтор не может создать второй платёж.
+    """
+
+    max_retries = 3
+    retry_delay = 0.5
+    pool_size = 20
+
     def __init__(self):
         self.shop_id = YOOKASSA_SHOP_ID
         self.secret_key = YOOKASSA_SECRET_KEY
-        self.base_url = "https://api.yookassa.ru/v3"
-        
+        self.base_url = YOOKASSA_API_URL
+
         # Создаём Basic Auth заголовок
         credentials = f"{self.shop_id}:{self.secret_key}"
         encoded_credentials = base64.b64encode(credentials.encode()).decode()
-        
+
         self.headers = {
             "Authorization": f"Basic {encoded_credentials}",
-            "Content-Type": "application/json",
-            "Idempotence-Key": str(uuid.uuid4())
+            "Content-Type": "application/json"
         }
-    
+        self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Общая сессия; создаётся при первом запросе внутри event loop"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=30),
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _request(self, method: str, url: str, idempotence_key: str = None, **kwargs):
+        """
+        Выполняет запрос с повторами при 5xx и таймаутах
+
+        Returns:
+            Кортеж (HTTP статус, тело ответа или None, если тело не JSON)
+        """
+        headers = self.headers
+        if idempotence_key:
+            headers = {**headers, "Idempotence-Key": idempotence_key}
+
+        for attempt in range(self.max_retries):
+            last_attempt = attempt == self.max_retries - 1
+            try:
+                async with self.session.request(method, url, headers=headers, **kwargs) as response:
+                    # Ошибки шлюза обычно приходят с HTML или пустым телом - их не разбираем
+                    if response.status >= 500 and not last_attempt:
+                        print(f"⚠️ YooKassa ответила {response.status}, повтор {attempt + 1}")
+                    else:
+                        try:
+                            return response.status, await response.json(content_type=None)
+                        except ValueError:
+                            if last_attempt:
+                                return response.status, None
+                            print(f"⚠️ YooKassa вернула не JSON (статус {response.status}), повтор {attempt + 1}")
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as e:
+                if attempt == self.max_retries - 1:
+                    raise
+                print(f"⚠️ Сбой запроса к YooKassa ({e!r}), повтор {attempt + 1}")
+            await asyncio.sleep(self.retry_delay * 2 ** attempt)
+
     async def create_payment(self, amount: float, description: str, user_id: int) -> dict:
         """
         Создаёт платёж в YooKassa
-        
+
         Args:
             amount: Сумма платежа
             description: Описание платежа
             user_id: ID пользователя Telegram
-            
+
         Returns:
             Словарь с данными платежа (payment_id, confirmation_url)
         """
         url = f"{self.base_url}/payments"
-        
+
         payload = {
             "amount": {
                 "value": f"{amount:.2f}",
@@ -52,58 +109,52 @@ class YooKassaClient:
                 "user_id": str(user_id)
             }
         }
-        
+
         try:
-            # Генерируем новый Idempotence-Key для каждого запроса
-            headers = self.headers.copy()
-            headers["Idempotence-Key"] = str(uuid.uuid4())
-            
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(url, headers=headers, json=payload) as response:
-                    data = await response.json()
-                    
-                    if response.status == 200:
-                        return {
-                            "payment_id": data.get("id"),
-                            "confirmation_url": data.get("confirmation", {}).get("confirmation_url"),
-                            "status": data.get("status")
-                        }
-                    else:
-                        print(f"Ошибка создания платежа: {data}")
-                        return None
+            # Новый Idempotence-Key на каждый платёж, общий для всех его повторов
+            status, data = await self._request("POST", url, idempotence_key=str(uuid.uuid4()), json=payload)
+
+            if status == 200 and data:
+                return {
+                    "payment_id": data.get("id"),
+                    "confirmation_url": data.get("confirmation", {}).get("confirmation_url"),
+                    "status": data.get("status")
+                }
+            else:
+                print(f"Ошибка создания платежа: {data}")
+                return None
         except Exception as e:
             print(f"Ошибка при создании платежа: {e}")
             return None
-    
+
     async def check_payment(self, payment_id: str) -> dict:
         """
         Проверяет статус платежа
-        
+
         Args:
             payment_id: ID платежа в YooKassa
-            
+
         Returns:
             Словарь с данными платежа
         """
         url = f"{self.base_url}/payments/{payment_id}"
-        
+
         try:
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(url, headers=self.headers) as response:
-                    data = await response.json()
-                    
-                    if response.status == 200:
-                        return {
-                            "status": data.get("status"),
-                            "paid": data.get("paid"),
-                            "amount": float(data.get("amount", {}).get("value", 0)),
-                            "metadata": data.get("metadata", {})
-                        }
-                    else:
-                        print(f"Ошибка проверки платежа: {data}")
-                        return None
+            status, data = await self._request("GET", url)
+
+            if status == 200 and data:
+                return {
+                    "status": data.get("status"),
+                    "paid": data.get("paid"),
+                    "amount": float(data.get("amount", {}).get("value", 0)),
+                    "metadata": data.get("metadata", {})
+                }
+            else:
+                print(f"Ошибка проверки платежа: {data}")
+                return None
         except Exception as e:
             print(f"Ошибка при проверке платежа: {e}")
-            return None
\ No newline at end of file
+            return None
+
+
+yookassa_client = YooKassaClient()
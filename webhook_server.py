@@ -1,15 +1,16 @@
 from aiohttp import web
+import asyncio
 import logging
 from database.database import Database
 from aiogram import Bot
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-import json
+from utils.fulfillment import FulfillmentWorker
+from utils.reconciler import PaymentReconciler
 
 logger = logging.getLogger(__name__)
 
 
 async def yookassa_webhook(request):
-    """Обработчик webhook от YooKassa"""
+    """Обработчик webhook от YooKassa: проверяет событие, сохраняет его в очередь и сразу отвечает"""
     try:
         # Получаем данные от YooKassa
         data = await request.json()
@@ -31,198 +32,19 @@ async def yookassa_webhook(request):
         
         logger.info(f"💳 Payment ID: {payment_id}, Status: {status}, Amount: {amount_value}, Paid: {paid}")
         
-        # Обрабатываем успешный платёж
+        # Успешный платёж только сохраняем в очередь: зачисление и уведомления делает воркер
         if event == 'payment.succeeded' and paid and status == 'succeeded':
-            db = Database()
-            
-            # Сначала проверяем, это покупка генераций или пополнение баланса
-            generation_purchase = db.get_generation_purchase(payment_id)
-            
-            if generation_purchase:
-                # ========== ПОКУПКА ГЕНЕРАЦИЙ ==========
-                logger.info(f"💎 Обработка покупки генераций: {generation_purchase}")
-                
-                # Проверяем что покупка ещё не обработана
-                if generation_purchase['status'] == 'succeeded':
-                    logger.info(f"⚠️ Покупка генераций {payment_id} уже обработана")
-                    return web.Response(status=200)
-                
-                user_id = generation_purchase['user_id']
-                generations_count = generation_purchase['package_size']
-                
-                logger.info(f"⚡ Начисляем генерации: user_id={user_id}, count={generations_count}")
-                
-                # Начисляем генерации пользователю
-                db.add_generations(user_id, generations_count)
-                
-                # Обновляем статус покупки
-                db.update_generation_purchase_status(payment_id, 'succeeded')
-                
-                # Отправляем уведомление пользователю
-                try:
-                    bot = request.app['bot']
-                    user_generations = db.get_user_generations(user_id)
-                    
-                    keyboard = InlineKeyboardMarkup(
-                        inline_keyboard=[
-                            [InlineKeyboardButton(text="Главное меню", callback_data="main_menu")]
-                        ]
-                    )
-                    
-                    await bot.send_message(
-                        user_id,
-                        f"💫 Оплата прошла успешно!\n\n"
-                        f"⚡ Начислено: {generations_count} генераций\n\n"
-                        f"<blockquote>Всего у вас: {user_generations} генераций</blockquote>",
-                        parse_mode="HTML",
-                        reply_markup=keyboard
-                    )
-                    
-                    logger.info(f"✅ Уведомление о генерациях отправлено пользователю {user_id}")
-                except Exception as e:
-                    logger.error(f"Ошибка отправки уведомления о генерациях: {e}")
-                
-                logger.info(f"✅ Покупка генераций {payment_id} успешно обработана")
-                return web.Response(status=200)
+            if not payment_id:
+                logger.error("⚠️ Нет id платежа в webhook")
+                return web.Response(status=400)
             
+            queued = await asyncio.to_thread(lambda: Database().enqueue_payment_event(event, payment_id))
+            if queued:
+                request.app['fulfillment'].notify()
+                logger.info(f"📥 Платёж {payment_id} поставлен в очередь зачисления")
             else:
-                # ========== ПОПОЛНЕНИЕ БАЛАНСА ==========
-                logger.info(f"💰 Обработка пополнения баланса")
-                
-                # Находим платёж в БД
-                payment = db.get_payment(payment_id)
-                
-                if not payment:
-                    logger.error(f"❌ Платёж {payment_id} не найден в БД")
-                    return web.Response(status=404)
-                
-                # Проверяем что платёж ещё не обработан
-                if payment['status'] == 'succeeded':
-                    logger.info(f"⚠️ Платёж {payment_id} уже обработан")
-                    return web.Response(status=200)
-                
-                user_id = payment['user_id']
-                amount = payment['amount']
-                
-                logger.info(f"💰 Начисляем баланс: user_id={user_id}, amount={amount}")
-                
-                # Начисляем баланс пользователю
-                db.add_to_balance(user_id, amount)
-                
-                # Обновляем статус платежа
-                db.update_payment_status(payment_id, 'succeeded')
-                
-                # Проверяем реферала и начисляем бонус
-                user = db.get_user(user_id)
-                if user and user.get('referrer_id'):
-                    referrer_id = user['referrer_id']
-                    referral_bonus = amount * 0.15  # 15% реферальный бонус
-                    
-                    logger.info(f"💎 Начисляем реферальный бонус: referrer_id={referrer_id}, bonus={referral_bonus}")
-                    
-                    # Начисляем бонус рефереру
-                    db.add_to_balance(referrer_id, referral_bonus)
-                    db.add_referral_earning(referrer_id, user_id, referral_bonus, amount)
-                    
-                    # Уведомляем реферера
-                    try:
-                        bot = request.app['bot']
-                        await bot.send_message(
-                            referrer_id,
-                            f"🎉 Ваш реферал пополнил баланс!\n\n"
-                            f"💰 Вам начислено: {referral_bonus:.2f} ₽"
-                        )
-                    except Exception as e:
-                        logger.error(f"Ошибка отправки уведомления рефереру: {e}")
-                
-                # Отправляем уведомление пользователю
-                try:
-                    bot = request.app['bot']
-                    user_balance = db.get_user(user_id)['balance']
-                    
-                    # Проверяем есть ли pending action
-                    pending = db.get_pending_action(user_id)
-                    
-                    if pending:
-                        action_type = pending['action_type']
-                        action_data = json.loads(pending['action_data'])
-                        
-                        # Определяем требуемую сумму
-                        required_amount = 0
-                        action_emoji = ""
-                        action_text = ""
-                        
-                        if action_type == "photo_animation_pending":
-                            required_amount = 40.00
-                            action_emoji = "📸"
-                            action_text = "оживление фото"
-                        elif action_type == "video_generation_pending":
-                            state_data = action_data.get("state_data", {})
-                            veo_model = state_data.get("veo_model", "veo3_fast")
-                            required_amount = 65.00 if veo_model == "veo3_fast" else 115.00
-                            action_emoji = "📹"
-                            action_text = "генерацию видео"
-                        elif action_type == "motion_control_pending":
-                            required_amount = 0  # Уточните стоимость
-                            action_emoji = "🕺"
-                            action_text = "управление движением"
-                        
-                        # Проверяем хватает ли баланса
-                        if user_balance >= required_amount:
-                            # Баланса достаточно - предлагаем начать
-                            keyboard = InlineKeyboardMarkup(
-                                inline_keyboard=[
-                                    [InlineKeyboardButton(text="Да", callback_data=f"start_action_{action_type}")],
-                                    [InlineKeyboardButton(text="Главное меню", callback_data="main_menu")]
-                                ]
-                            )
-                            
-                            await bot.send_message(
-                                user_id,
-                                f"{action_emoji} Мы готовы начинать {action_text}\n\n"
-                                f"Стартуем?\n"
-                                f"<blockquote>💰 Ваш баланс: {user_balance:.2f} ₽</blockquote>",
-                                parse_mode="HTML",
-                                reply_markup=keyboard
-                            )
-                        else:
-                            # Баланса всё ещё недостаточно
-                            keyboard = InlineKeyboardMarkup(
-                                inline_keyboard=[
-                                    [InlineKeyboardButton(text="Главное меню", callback_data="main_menu")]
-                                ]
-                            )
-                            
-                            await bot.send_message(
-                                user_id,
-                                f"💫 Оплата прошла успешно\n\n"
-                                f"<blockquote>Мой текущий баланс: {user_balance:.2f} ₽</blockquote>",
-                                parse_mode="HTML",
-                                reply_markup=keyboard
-                            )
-                    else:
-                        # Нет pending action - просто показываем баланс
-                        keyboard = InlineKeyboardMarkup(
-                            inline_keyboard=[
-                                [InlineKeyboardButton(text="Главное меню", callback_data="main_menu")]
-                            ]
-                        )
-                        
-                        await bot.send_message(
-                            user_id,
-                            f"💫 Оплата прошла успешно\n\n"
-                            f"<blockquote>Мой текущий баланс: {user_balance:.2f} ₽</blockquote>",
-                            parse_mode="HTML",
-                            reply_markup=keyboard
-                        )
-                    
-                    logger.info(f"✅ Уведомление отправлено пользователю {user_id}")
-                except Exception as e:
-                    logger.error(f"Ошибка отправки уведомления пользователю: {e}")
-                
-                logger.info(f"✅ Платёж {payment_id} успешно обработан")
-                
-                return web.Response(status=200)
+                logger.info(f"⚠️ Событие по платежу {payment_id} уже в очереди")
+            return web.Response(status=200)
         
         # Другие события
         logger.info(f"ℹ️ Событие {event} - пропускаем")
@@ -242,6 +64,20 @@ def create_app(bot: Bot):
     """Создаёт веб-приложение для webhook"""
     app = web.Application()
     app['bot'] = bot
+    app['fulfillment'] = FulfillmentWorker(bot)
+    app['reconciler'] = PaymentReconciler(app['fulfillment'])
+    
+    # Воркер зачислений и сверка платежей живут вместе с webhook сервером
+    async def start_fulfillment(app):
+        app['fulfillment'].start()
+        app['reconciler'].start()
+    
+    async def stop_fulfillment(app):
+        await app['reconciler'].stop()
+        await app['fulfillment'].stop()
+    
+    app.on_startup.append(start_fulfillment)
+    app.on_cleanup.append(stop_fulfillment)
     
     # Маршруты
     app.router.add_post('/webhook/yookassa', yookassa_webhook)